@@ -0,0 +1,92 @@
+"""
+Compares clean_soup against the previous per-tag implementation.
+Each page is cleaned by both, the resulting trees must serialize identically,
+then both are timed on the same corpus, including pathological 10k-div pages.
+
+    python benchmarks/bench_clean.py [--repeat N] [html files or directories ...]
+
+The legacy cleaner needs tens of seconds per run on nested-divs-10k, use --repeat 1 for a quick look.
+"""
+
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+import corpus
+import pagescraper
+
+
+def legacy_clean_soup(soup):
+    """The original clean_soup: a descendant search per div and one decompose() per tag"""
+    tags_to_remove = {'decompose': [], 'unwrap': []}
+    tags_to_remove['decompose'] += [x for x in soup.find_all('div') if not x.find_all()]
+    tags_to_remove['decompose'] += soup.find_all(pagescraper.UNWANTED_TAGS)
+    tags_to_remove['unwrap'] += soup.find_all(pagescraper.UNWANTED_ENCLOSING_TAGS)
+    for tag in tags_to_remove['decompose']:
+        tag.decompose()
+    for tag in tags_to_remove['unwrap']:
+        if tag.contents:
+            tag.unwrap()
+        else:
+            tag.decompose()
+
+
+CLEANERS = {
+    'legacy': legacy_clean_soup,
+    'clean_soup': pagescraper.clean_soup,
+}
+
+
+def check_equivalence(pages):
+    mismatches = []
+    for name, html in pages.items():
+        results = {}
+        for cleaner, clean in CLEANERS.items():
+            soup = BeautifulSoup(html, 'html.parser')
+            clean(soup)
+            # Serializing walks contents and stripped_strings walks next_element, so both linkages are checked
+            results[cleaner] = (soup.decode(), list(soup.stripped_strings))
+        if results['legacy'] != results['clean_soup']:
+            mismatches.append(name)
+            print(f'MISMATCH {name}')
+    return mismatches
+
+
+def measure(clean, pages, repeat):
+    elapsed = 0.0
+    for _ in range(repeat):
+        for html in pages.values():
+            soup = BeautifulSoup(html, 'html.parser')
+            start = time.process_time()
+            clean(soup)
+            elapsed += time.process_time() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages['nested-divs-10k'] = corpus.nested_div_page(10000)
+    pages.update(corpus.load_pages(args.paths))
+    mismatches = check_equivalence(pages)
+    print(f'equivalence: {len(pages) - len(mismatches)}/{len(pages)} pages identical')
+
+    for name in ('nested-divs-10k', 'flat-divs-10k'):
+        timings = {cleaner: measure(clean, {name: pages[name]}, args.repeat) / args.repeat
+                   for cleaner, clean in CLEANERS.items()}
+        print(f'{name:>16}: ' + '  '.join(f'{cleaner} {seconds * 1000:8.1f} ms'
+                                           for cleaner, seconds in timings.items()))
+    timings = {cleaner: measure(clean, pages, args.repeat) for cleaner, clean in CLEANERS.items()}
+    print(f'{"whole corpus":>16}: ' + '  '.join(f'{cleaner} {seconds * 1000:8.1f} ms'
+                                               for cleaner, seconds in timings.items()))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Compares the soup and stream extraction engines.
+Every page in the corpus is first checked for identical links, text and metadata, then both
+engines are timed and their peak traced memory is recorded.
+
+    python benchmarks/bench_extract.py [--repeat N] [html files or directories ...]
+
+Exits non-zero if any page extracts differently.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import corpus
+import pagescraper
+
+URL = 'https://artist.example.com/'
+ENGINES = {
+    'soup': pagescraper.extract_with_soup,
+    'stream': pagescraper.extract_with_stream,
+}
+
+
+def normalized(extracted):
+    return dict(extracted, links={kind: list(hrefs.items()) for kind, hrefs in extracted['links'].items()})
+
+
+def check_equivalence(pages):
+    mismatches = []
+    for name, html in pages.items():
+        results = {engine: normalized(extract(URL, html)) for engine, extract in ENGINES.items()}
+        if results['soup'] != results['stream']:
+            mismatches.append(name)
+            print(f'MISMATCH {name}')
+            for label, soup_part in results['soup'].items():
+                stream_part = results['stream'][label]
+                if soup_part != stream_part:
+                    print(f'  {label}: soup={str(soup_part)[:300]}')
+                    print(f'  {label}: stream={str(stream_part)[:300]}')
+    return mismatches
+
+
+def measure(extract, pages, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for html in pages.values():
+            extract(URL, html)
+    cpu = time.process_time() - start
+
+    peak = 0
+    for html in pages.values():
+        tracemalloc.start()
+        extract(URL, html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages.update(corpus.load_pages(args.paths))
+    mismatches = check_equivalence(pages)
+    print(f'equivalence: {len(pages) - len(mismatches)}/{len(pages)} pages identical')
+
+    total = args.repeat * len(pages)
+    baseline = None
+    for engine, extract in ENGINES.items():
+        cpu, peak = measure(extract, pages, args.repeat)
+        baseline = baseline or (cpu, peak)
+        print(f'{engine:>7}: {total / cpu:8.1f} pages/s cpu  peak {peak / 1024:9.0f} KiB  '
+              f'({cpu / baseline[0]:.2f}x cpu, {peak / baseline[1]:.2f}x memory vs soup)')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Compares the size of a sitemap as URL lists (what website-sitemaps stores and the
+dashboard receives) against graph_codec: per entry delta encoded ids, and the whole
+graph as one blob with its front coded URL dictionary. Sitemaps are generated for
+sites of increasing size with a portfolio like structure (sections, works, shared
+navigation); every encoding must decode back to the same adjacency sets.
+
+    python benchmarks/bench_graph.py [--pages N ...] [--repeat N]
+
+Exits non-zero if any sitemap does not round trip.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import graph_codec
+
+DOMAIN = 'artist.example.com'
+SECTIONS = ('work', 'exhibitions', 'press', 'news', 'shop')
+
+
+def synthetic_sitemap(pages, seed=0) -> dict:
+    rng = random.Random(seed)
+    origin = f'https://{DOMAIN}'
+    navigation = [origin] + [f'{origin}/{section}' for section in SECTIONS] + [f'{origin}/about', f'{origin}/contact']
+    urls = list(navigation)
+    while len(urls) < pages:
+        section = rng.choice(SECTIONS)
+        urls.append(f'{origin}/{section}/{rng.randint(2005, 2025)}/project-{len(urls)}-{rng.choice(("series", "installation", "print", "video"))}')
+    sitemap = {}
+    for url in urls:
+        related = rng.sample(urls, min(len(urls), rng.randint(3, 30)))
+        sitemap[url] = sorted(set(navigation + related))
+    return sitemap
+
+
+def json_size(sitemap) -> int:
+    return len(json.dumps(sitemap, separators=(',', ':')).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='*', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = 0
+    for pages in args.pages:
+        sitemap = synthetic_sitemap(pages)
+        expected = {url: sorted(set(links)) for url, links in sitemap.items()}
+
+        dictionary = graph_codec.UrlDictionary(DOMAIN)
+        entries = {url: graph_codec.encode_links(dictionary, links) for url, links in sitemap.items()}
+        decoded = {url: sorted(graph_codec.decode_links(dictionary, data)) for url, data in entries.items()}
+        start = time.process_time()
+        for _ in range(args.repeat):
+            blob = graph_codec.encode_graph(sitemap, graph_codec.UrlDictionary(DOMAIN))
+        encode_cpu = (time.process_time() - start) / args.repeat
+        start = time.process_time()
+        for _ in range(args.repeat):
+            _, graph = graph_codec.decode_graph(blob)
+        decode_cpu = (time.process_time() - start) / args.repeat
+        if decoded != expected or {url: sorted(links) for url, links in graph.items()} != expected:
+            failures += 1
+            print(f'ROUND TRIP FAILED for {pages} pages')
+
+        lists = json_size(sitemap)
+        ids = sum(len(url.encode('utf-8')) + len(data) for url, data in entries.items())
+        print(f'{pages:>6} pages: lists {lists / 1024:9.1f} KiB | id entries {ids / 1024:8.1f} KiB '
+              f'({lists / ids:4.1f}x) | graph blob {len(blob) / 1024:7.1f} KiB ({lists / len(blob):5.1f}x) '
+              f'| encode {encode_cpu * 1000:7.1f} ms, decode {decode_cpu * 1000:7.1f} ms')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
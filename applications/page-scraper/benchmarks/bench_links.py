@@ -0,0 +1,103 @@
+"""
+Compares scrape_links against the previous reduce/urljoin implementation.
+Both must find the same set of internal and external targets once the legacy
+hrefs are resolved, then both are timed on the same parsed trees.
+
+    python benchmarks/bench_links.py [--repeat N] [html files or directories ...]
+"""
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+from functools import reduce
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+import corpus
+import link_resolver
+import pagescraper
+
+URL = 'https://artist.example.com/'
+
+
+def legacy_scrape_links(url, soup):
+    """The original scrape_links: one urlparse of the page URL and one urljoin per link"""
+    def get_link_type(href, url):
+        if urlparse(url).netloc == urlparse(urljoin(url, href)).netloc:
+            return 'internal'
+        return 'external'
+
+    def link_reduce(url, acc, link_data):
+        href = link_data['href']
+        acc[get_link_type(href, url)][href] = []
+        return acc
+
+    for link_element in soup.find_all('a', href=lambda href: not href or href.startswith('#')):
+        link_element.decompose()
+    return reduce(
+        lambda acc, link_data: link_reduce(url, acc, link_data),
+        [{'tag': tag, 'href': tag.get('href')} for tag in soup.find_all('a')],
+        {'internal': defaultdict(list), 'external': defaultdict(list)})
+
+
+def legacy_targets(url, soup):
+    # The legacy keys are raw hrefs; resolve them the way link_resolver does to compare targets
+    resolver = link_resolver.LinkResolver(url)
+    targets = set()
+    for hrefs in legacy_scrape_links(url, soup).values():
+        for href in hrefs:
+            resolved = resolver.resolve(href)
+            if resolved:
+                targets.add(resolved)
+    return targets
+
+
+def check_equivalence(pages):
+    mismatches = []
+    for name, html in pages.items():
+        # <base href> is ignored by the legacy implementation, so those pages cannot match
+        if '<base ' in html:
+            continue
+        legacy = legacy_targets(URL, BeautifulSoup(html, 'html.parser'))
+        links = pagescraper.scrape_links(URL, BeautifulSoup(html, 'html.parser'))
+        current = {(href, link_type) for link_type, hrefs in links.items() for href in hrefs}
+        if legacy != current:
+            mismatches.append(name)
+            print(f'MISMATCH {name}: {sorted(legacy ^ current)[:5]}')
+    return mismatches
+
+
+def measure(scrape, pages, repeat):
+    elapsed = 0.0
+    for _ in range(repeat):
+        for html in pages.values():
+            soup = BeautifulSoup(html, 'html.parser')
+            start = time.process_time()
+            scrape(URL, soup)
+            elapsed += time.process_time() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages['link-index-10k'] = corpus.link_index_page(links=10000).replace('<base ', '<meta ')
+    pages.update(corpus.load_pages(args.paths))
+    mismatches = check_equivalence(pages)
+    print(f'equivalence: {len(mismatches)} mismatching pages')
+
+    for name in ('link-index-10k',):
+        timings = {label: measure(scrape, {name: pages[name]}, args.repeat) / args.repeat
+                   for label, scrape in (('legacy', legacy_scrape_links), ('scrape_links', pagescraper.scrape_links))}
+        print(f'{name:>16}: ' + '  '.join(f'{label} {seconds * 1000:8.1f} ms' for label, seconds in timings.items()))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Compares the parser backends bs4 can use in this environment.
+Every page is extracted with each backend and checked against html.parser, then
+each backend is timed and its peak traced memory recorded. The backend that
+PARSER_BACKEND=auto would pick at cold start is printed as well.
+
+    python benchmarks/bench_parsers.py [--repeat N] [--profile NAME] [html files or directories ...]
+
+Pass a FETCH_CACHE_DIR to validate against a recorded corpus. Disagreements are
+reported but do not fail the run: parsers legitimately repair broken markup differently.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import corpus
+import pagescraper
+import parser_backend
+
+URL = 'https://artist.example.com/'
+
+
+def extract(backend, html, profile):
+    extracted = pagescraper.extract_with_soup(URL, html, profile, backend)
+    return dict(extracted, links={kind: list(hrefs) for kind, hrefs in extracted['links'].items()})
+
+
+def check_agreement(backend, pages, profile):
+    disagreements = []
+    for name, html in pages.items():
+        if extract(backend, html, profile) != extract(parser_backend.REFERENCE_BACKEND, html, profile):
+            disagreements.append(name)
+    return disagreements
+
+
+def measure(backend, pages, profile, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for html in pages.values():
+            pagescraper.extract_with_soup(URL, html, profile, backend)
+    cpu = time.process_time() - start
+
+    peak = 0
+    for html in pages.values():
+        tracemalloc.start()
+        pagescraper.extract_with_soup(URL, html, profile, backend)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--profile', default='full', help='parse profile to extract with')
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages.update(corpus.load_pages(args.paths))
+    backends = parser_backend.available_backends()
+    print(f'available backends: {", ".join(backends)}')
+
+    total = args.repeat * len(pages)
+    for backend in backends:
+        disagreements = check_agreement(backend, pages, args.profile)
+        cpu, peak = measure(backend, pages, args.profile, args.repeat)
+        print(f'{backend:>12}: {total / cpu:8.1f} pages/s cpu  peak {peak / 1024:9.0f} KiB  '
+              f'agrees on {len(pages) - len(disagreements)}/{len(pages)} pages')
+        for name in disagreements[:10]:
+            print(f'{"":>14}differs: {name}')
+
+    print(f'cold start pick: {parser_backend.select_backend()} {parser_backend.get_stats()["timings_ms"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Compares the parse profiles of the soup engine.
+text+links must extract the same links, text, embedded data and metadata as full,
+and links-only the same links and metadata; then each profile is timed and its peak traced memory recorded.
+
+    python benchmarks/bench_profiles.py [--repeat N] [html files or directories ...]
+
+Exits non-zero if any page extracts differently.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import corpus
+import pagescraper
+import parse_profiles
+
+URL = 'https://artist.example.com/'
+
+
+def extract(profile, html):
+    extracted = pagescraper.extract_with_soup(URL, html, profile)
+    return dict(extracted, links={kind: list(hrefs.items()) for kind, hrefs in extracted['links'].items()})
+
+
+def check_equivalence(pages):
+    mismatches = []
+    for name, html in pages.items():
+        full = extract('full', html)
+        text_links = extract('text+links', html)
+        links_only = extract('links-only', html)
+        if text_links != full:
+            mismatches.append(name)
+            print(f'MISMATCH {name}: text+links differs from full')
+        if links_only['links'] != full['links'] or links_only['metadata'] != full['metadata']:
+            mismatches.append(name)
+            print(f'MISMATCH {name}: links-only links or metadata differ from full')
+    return mismatches
+
+
+def measure(profile, pages, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for html in pages.values():
+            pagescraper.extract_with_soup(URL, html, profile)
+    cpu = time.process_time() - start
+
+    peak = 0
+    for html in pages.values():
+        tracemalloc.start()
+        pagescraper.extract_with_soup(URL, html, profile)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages.update(corpus.load_pages(args.paths))
+    mismatches = check_equivalence(pages)
+    print(f'equivalence: {len(pages) - len(set(mismatches))}/{len(pages)} pages identical')
+
+    total = args.repeat * len(pages)
+    baseline = None
+    for profile in ('full', 'text+links', 'links-only'):
+        cpu, peak = measure(profile, pages, args.repeat)
+        baseline = baseline or (cpu, peak)
+        print(f'{profile:>10}: {total / cpu:8.1f} pages/s cpu  peak {peak / 1024:9.0f} KiB  '
+              f'({cpu / baseline[0]:.2f}x cpu, {peak / baseline[1]:.2f}x memory vs full)')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
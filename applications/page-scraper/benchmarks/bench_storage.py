@@ -0,0 +1,75 @@
+"""
+Compares the size of stored page objects: the previous pretty-printed JSON against
+page_store's compact JSON, gzip and (when zstandard is installed) zstd.
+Each page is extracted with the soup engine into the record the scraper stores,
+every encoding must decode back to the same record, then sizes and encode times are summed.
+
+    python benchmarks/bench_storage.py [--repeat N] [html files or directories ...]
+
+Exits non-zero if any record does not round trip.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import corpus
+import page_store
+import pagescraper
+
+URL = 'https://artist.example.com/'
+
+
+def legacy_encode(record):
+    return json.dumps(record, indent=4).encode('UTF-8')
+
+
+def page_record(html):
+    extracted = pagescraper.extract_with_soup(URL, html)
+    data = {URL: {'links': extracted['links'], 'text': extracted['text']}}
+    if extracted['metadata']:
+        data[URL]['metadata'] = extracted['metadata']
+    return {'page_url': URL, 'crawl_id': 'bench', 'timestamp': 0, 'data': data}
+
+
+def encoders():
+    result = {'legacy indent=4': (legacy_encode, None), 'compact': (lambda r: page_store.encode(r, 'none'), 'none'),
+              'gzip': (lambda r: page_store.encode(r, 'gzip'), 'gzip')}
+    if page_store.zstandard is not None:
+        result['zstd'] = (lambda r: page_store.encode(r, 'zstd'), 'zstd')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='extra .html files or directories, e.g. a FETCH_CACHE_DIR')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = corpus.synthetic_pages()
+    pages.update(corpus.load_pages(args.paths))
+    records = {name: page_record(html) for name, html in pages.items()}
+
+    failures = []
+    for name, record in records.items():
+        expected = json.loads(json.dumps(record))
+        for label, (encode, encoding) in encoders().items():
+            if encoding and page_store.decode(encode(record), content_encoding=encoding) != expected:
+                failures.append(name)
+                print(f'ROUND TRIP FAILED {name}: {label}')
+    print(f'round trip: {len(records) - len(failures)}/{len(records)} pages decode identically')
+
+    baseline = None
+    for label, (encode, _) in encoders().items():
+        start = time.process_time()
+        for _ in range(args.repeat):
+            size = sum(len(encode(record)) for record in records.values())
+        cpu = (time.process_time() - start) / args.repeat
+        baseline = baseline or size
+        print(f'{label:>16}: {size / 1024:10.1f} KiB  {cpu * 1000:8.1f} ms  ({baseline / size:.1f}x smaller)')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+HTML corpus for the extraction benchmarks.
+Pages come from synthetic generators shaped like the artist sites we crawl, from
+directories of saved .html files, or from a local fetch cache directory (FETCH_CACHE_DIR).
+"""
+
+import gzip
+import os
+import random
+import sys
+
+# Benchmarks import the Lambda modules directly, the same way build.sh flattens them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+WORDS = ('studio', 'light', 'memory', 'installation', 'video', 'textile', 'body', 'landscape',
+         'archive', 'sound', 'collective', 'exhibition', 'residency', 'performance', 'gallery')
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def portfolio_page(seed=0, sections=40):
+    """A page-builder style page: nav, nested wrapper divs, galleries, inline scripts and a footer"""
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html><html><head><title>Artist Portfolio</title>',
+             '<meta name="description" content="%s">' % _sentence(rng),
+             '<link rel="stylesheet" href="/site.css"><style>.x{color:red}</style>',
+             '<script type="application/ld+json">{"@type":"Person","name":"Jane Doe",'
+             '"sameAs":["https://instagram.com/janedoe"]}</script></head><body>',
+             '<nav><ul>']
+    for name in ('Home', 'Work', 'About', 'Contact', 'Shop'):
+        parts.append('<li><a href="/%s">%s</a></li>' % (name.lower(), name))
+    parts.append('<li><a href="#">Close Menu</a></li><li><a>Open Menu</a></li></ul></nav>')
+    for i in range(sections):
+        depth = rng.randint(2, 6)
+        parts.append('<div class="section"><div class="wrap">' * depth)
+        parts.append('<h2>%s</h2><p>%s <a href="/work/%d">more</a> &amp; <em>%s</em></p>'
+                     % (_sentence(rng, 3), _sentence(rng), i, _sentence(rng, 4)))
+        parts.append('<div class="spacer"></div><div>%s</div>' % _sentence(rng, 5))
+        parts.append('<figure><img src="/img/%d.jpg" alt="work %d"><figcaption>%s</figcaption></figure>'
+                     % (i, i, _sentence(rng, 6)))
+        if i % 7 == 0:
+            parts.append('<form><input name="q"><button>Search</button>'
+                         '<a href="https://vimeo.com/%d">vimeo</a></form>' % i)
+        if i % 5 == 0:
+            parts.append('<a href="https://external-%d.example.org/page?id=%d">press</a>' % (i, i))
+        parts.append('</div></div>' * depth)
+    parts.append('<footer><p>&copy; 2025 Jane Doe</p><!-- footer --><a href="mailto:jane@example.com">'
+                 'Email</a></footer><script>window.__INITIAL_STATE__ = {"bio": "%s"};</script>'
+                 % _sentence(rng, 10))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def link_index_page(seed=0, links=2000):
+    """An archive/index page that is mostly links"""
+    rng = random.Random(seed)
+    parts = ['<html><head><base href="https://index.example.com/archive/"></head><body><ul>']
+    for i in range(links):
+        if i % 3 == 0:
+            href = 'https://other-%d.example.net/p/%d' % (i % 50, i)
+        else:
+            href = 'item-%d.html?ref=%d#top' % (i % 700, i)
+        parts.append('<li><a href="%s" rel="nofollow">%s</a></li>' % (href, _sentence(rng, 2)))
+    parts.append('</ul></body></html>')
+    return ''.join(parts)
+
+
+def nested_div_page(count=10000, nested=True):
+    """Pathological page-builder markup: thousands of divs, deeply nested or side by side"""
+    if nested:
+        return '<html><body>' + '<div><span>x</span>' * count + '</div>' * count + '</body></html>'
+    return '<html><body>' + '<div><div></div><p>x</p></div>' * count + '</body></html>'
+
+
+# Small documents exercising the parser recovery and pruning rules the engines have to agree on
+EDGE_CASES = {
+    'anchor-without-href': '<p>a<a>gone</a>b<a href="">gone</a><a href="#top">gone</a><a href="/x">kept</a></p>',
+    'nested-anchors': '<a href="#"><a href="/inner">inner</a>outer</a><a href="/y"><a href="#">z</a>w</a>',
+    'div-with-removed-anchor': '<div>dropped<a href="#">x</a></div><div>kept<a href="/k">k</a></div>',
+    'script-in-removed-anchor': '<a href="#top"><script type="application/ld+json">{"@type": "WebPage",'
+                                ' "url": "https://artist.example.com/hidden"}</script></a>'
+                                '<a><script type="application/json">{"props": {"href": "/nope"}}</script></a><p>x</p>',
+    'title-with-removed-anchor': '<head><title>Jane<a href="#">menu</a> Doe<a>x</a><title>Inner</title>'
+                                 ' Studio</title></head><body><p>body</p></body>',
+    'childless-divs': '<div>only text</div><div><div>inner</div>outer</div><div> </div><div><br>br</div>',
+    'unclosed-tags': '<div>one<p>two<span>three<div>four',
+    'stray-end-tags': '</p>a</div>b<div>c</span>d</div>e</a></br>f',
+    'void-elements': '<div>a<img src=x>b<br/>c</br><input>d</div><p>e<hr>f</p>',
+    'string-containers': '<template><p>tpl</p></template><ruby>kan<rt>kan</rt><rp>(</rp></ruby>',
+    'comments-and-cdata': '<!DOCTYPE html><p>a<!-- c -->b<![CDATA[cdata]]>c<?pi x?>d</p>',
+    'entities': '<p>&amp; &lt;x&gt; &copy; &#169; &#x41; &#147; &nosuch; &amp</p><div>&nbsp;</div>',
+    'head-and-unwanted': '<head><title>t</title><a href="/in-head">h</a></head><form>'
+                         '<a href="/in-form">f</a>text</form><button>b</button><p>p</p>',
+    'scripts': '<script>var a = "<div>";</script><script src="x.js"></script>'
+               '<script type="application/json">{"text": "Some embedded text in a json blob here."}</script>'
+               '<div><script type="text/x-template"><p>tpl</p></script>after</div>',
+    'whitespace': '<pre>  keep  \n </pre><p>\n\t x \n</p><div>\n</div>',
+    'unicode-whitespace': '<p>\u00a0a\u2003</p><p>\u00a0</p>',
+    'metadata': '<head><title> Jane  Doe | Studio </title><meta property="og:site_name" content="Doe Studio">'
+                '<meta property="og:description" content="Paintings"><meta name="twitter:creator" content="@jd">'
+                '<link rel="Canonical" href="https://doe.example/"><script type="application/ld+json">'
+                '{"@graph": [{"@type": "WebPage", "name": "Home"}, {"@type": ["Person"], "name": "Jane Doe",'
+                ' "email": "mailto:jane@doe.example", "address": {"addressLocality": "Oslo",'
+                ' "addressCountry": "NO"}, "sameAs": "https://instagram.com/jd"}]}</script></head>'
+                '<body><p>body</p><meta name="description" content="late description"></body>',
+}
+
+
+def synthetic_pages():
+    pages = {'edge-' + name: html for name, html in EDGE_CASES.items()}
+    pages.update({'portfolio-%d' % seed: portfolio_page(seed) for seed in range(5)})
+    pages['link-index'] = link_index_page()
+    pages['nested-divs-1k'] = nested_div_page(1000)
+    pages['flat-divs-10k'] = nested_div_page(10000, nested=False)
+    return pages
+
+
+def load_pages(paths):
+    """Load .html files from the given files or directories, plus a fetch cache directory's bodies"""
+    pages = {}
+    for path in paths:
+        files = [path] if os.path.isfile(path) else [
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in sorted(names)]
+        for file_path in files:
+            if file_path.endswith(('.html', '.htm')):
+                with open(file_path, encoding='utf-8', errors='replace') as f:
+                    pages[file_path] = f.read()
+            elif file_path.endswith('.gz') and os.sep + 'bodies' + os.sep in file_path:
+                with open(file_path, 'rb') as f:
+                    pages[file_path] = gzip.decompress(f.read()).decode('utf-8', errors='replace')
+    return pages
@@ -0,0 +1,154 @@
+"""
+Per-domain boilerplate learning and removal.
+A text block is identified by its DOM path (see text_layout) and its text.
+The first BOILERPLATE_LEARN_PAGES pages scraped on a domain each record the hashes
+of their blocks; once enough pages are in, blocks found on most of them (menus,
+footers, "Close Menu") become the domain's model and are stripped from the text
+of every later page.
+
+State lives in the crawl state table under boilerplate#<domain>:
+    pages_seen      number of learning samples recorded
+    sample_<hash>   block hashes of one learning page, removed once the model is built
+    model           string set of boilerplate block hashes
+"""
+
+import hashlib
+import math
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+dynamodb = boto3.resource('dynamodb')
+
+BOILERPLATE_ENABLED = os.environ.get('BOILERPLATE_ENABLED', 'true').lower() == 'true'
+BOILERPLATE_LEARN_PAGES = int(os.environ.get('BOILERPLATE_LEARN_PAGES', '5'))
+# Share of learning pages a block has to appear on to count as boilerplate
+BOILERPLATE_MIN_FRACTION = float(os.environ.get('BOILERPLATE_MIN_FRACTION', '0.8'))
+BOILERPLATE_MAX_BLOCKS = int(os.environ.get('BOILERPLATE_MAX_BLOCKS', '2000'))
+
+# Learned models per domain for the lifetime of the container; models never change once built
+_models = {}
+_stats = {'blocks_removed': 0, 'pages_learned': 0, 'models_built': 0}
+
+
+def block_hash(path, text) -> str:
+    """Short stable hash of a block; 48 bits keeps a model compact and collisions irrelevant per domain"""
+    normalized = ' '.join(text.split()).lower()
+    return hashlib.blake2b(f'{path}\x00{normalized}'.encode('utf-8'), digest_size=6).hexdigest()
+
+
+def _state_table():
+    table_name = os.environ.get('CRAWL_STATE_TABLE_NAME', 'scraper-crawl-state')
+    return dynamodb.Table(table_name)
+
+
+def _state_key(domain):
+    return f'boilerplate#{domain}'
+
+
+def _build_model(domain):
+    """Turn the recorded learning samples into the domain's model. Returns the model or None."""
+    table = _state_table()
+    item = table.get_item(Key={'state_key': _state_key(domain)}, ConsistentRead=True).get('Item', {})
+    if 'model' in item:
+        return set(item['model']) - {''}
+    samples = {name: hashes for name, hashes in item.items() if name.startswith('sample_')}
+    if len(samples) < BOILERPLATE_LEARN_PAGES:
+        return None
+
+    counts = {}
+    for hashes in samples.values():
+        for value in hashes:
+            counts[value] = counts.get(value, 0) + 1
+    needed = max(2, math.ceil(BOILERPLATE_MIN_FRACTION * len(samples)))
+    model = {value for value, count in counts.items() if count >= needed}
+
+    # DynamoDB does not store empty sets, a model without blocks is kept as a placeholder value
+    stored = model or {''}
+    names = {f'#s{i}': name for i, name in enumerate(samples)}
+    try:
+        table.update_item(
+            Key={'state_key': _state_key(domain)},
+            UpdateExpression='SET model = :model, model_pages = :pages REMOVE ' + ', '.join(names),
+            ConditionExpression='attribute_not_exists(model)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={':model': stored, ':pages': len(samples)}
+        )
+        _stats['models_built'] += 1
+        print(f'Built boilerplate model for {domain}: {len(model)} blocks from {len(samples)} pages')
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    return model
+
+
+def _record_sample(domain, url, hashes):
+    """Store one learning page's block hashes and build the model if it was the last one needed"""
+    sample_name = 'sample_' + hashlib.blake2b(url.encode('utf-8'), digest_size=6).hexdigest()
+    response = _state_table().update_item(
+        Key={'state_key': _state_key(domain)},
+        UpdateExpression='SET #sample = :hashes ADD pages_seen :one',
+        ConditionExpression='attribute_not_exists(model) AND attribute_not_exists(#sample)',
+        ExpressionAttributeNames={'#sample': sample_name},
+        ExpressionAttributeValues={':hashes': hashes, ':one': 1},
+        ReturnValues='UPDATED_NEW'
+    )
+    _stats['pages_learned'] += 1
+    if int(response['Attributes']['pages_seen']) >= BOILERPLATE_LEARN_PAGES:
+        return _build_model(domain)
+    return None
+
+
+def get_model(domain):
+    """Return the domain's boilerplate hashes, or None while it is still learning"""
+    if domain in _models:
+        return _models[domain]
+    item = _state_table().get_item(
+        Key={'state_key': _state_key(domain)},
+        ProjectionExpression='model, pages_seen'
+    ).get('Item', {})
+    if 'model' in item:
+        _models[domain] = set(item['model']) - {''}
+        return _models[domain]
+    if int(item.get('pages_seen', 0)) >= BOILERPLATE_LEARN_PAGES:
+        # Enough samples, but the page that completed them did not get to build the model
+        model = _build_model(domain)
+        if model is not None:
+            _models[domain] = model
+        return model
+    return None
+
+
+def kept_indexes(domain, url, text, paths) -> list:
+    """
+    Return the indexes of the page's text strings that are not boilerplate of the domain
+    (paths are the DOM paths of the strings). While the domain has no model yet, the page is
+    recorded as a learning sample and everything is kept. Any state table error keeps everything.
+    """
+    everything = list(range(len(text)))
+    if not text:
+        return everything
+    hashes = [block_hash(path, string) for path, string in zip(paths, text)]
+    try:
+        model = get_model(domain)
+        if model is None:
+            model = _record_sample(domain, url, set(hashes[:BOILERPLATE_MAX_BLOCKS]))
+            if model is not None:
+                _models[domain] = model
+            return everything
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f'Error using boilerplate model for {domain}: {e}')
+        return everything
+    except Exception as e:
+        print(f'Error using boilerplate model for {domain}: {e}')
+        return everything
+
+    kept = [i for i, value in enumerate(hashes) if value not in model]
+    _stats['blocks_removed'] += len(text) - len(kept)
+    return kept
+
+
+def get_stats() -> dict:
+    return dict(_stats, models_cached=len(_models))
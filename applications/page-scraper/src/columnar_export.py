@@ -0,0 +1,313 @@
+"""
+Columnar export of a crawl's page records, one file per domain and crawl.
+Rows are sorted by (depth, url) and written in row groups, each with min/max
+statistics of url and depth, so readers skip row groups a filter rules out and
+decompress only the columns they ask for.
+
+With pyarrow installed the file is Parquet (exports/<domain>/<crawl id>.parquet).
+Without it, a stdlib format with the same layout is written (.cols):
+    MAGIC | column chunks | footer JSON | footer length (8 bytes, big endian) | MAGIC
+where every chunk is the gzipped JSON list of one column of one row group and the
+footer lists the columns, and per row group its row count, statistics and the
+[offset, length] of each column chunk.
+
+read_table() reads either format with pyarrow style filters, e.g.
+    read_table(path, columns=['url', 'text'], filters=[('depth', '<=', 1)])
+
+    python columnar_export.py <domain> <crawl id> [--output FILE]
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+
+import boto3
+
+import page_store
+import segment_writer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+s3 = boto3.client('s3')
+
+EXPORT_PREFIX = os.environ.get('EXPORT_PREFIX', 'exports')
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_ROW_GROUP_SIZE', '1000'))
+# 'auto' writes Parquet when pyarrow is installed, 'parquet' or 'cols' force a format
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'auto').lower()
+
+MAGIC = b'FANCOLS1'
+COLUMNS = ('url', 'depth', 'crawl_id', 'timestamp', 'title', 'text', 'block_kinds', 'internal_links',
+           'external_links', 'text_fingerprint', 'image_fingerprints', 'metadata')
+# Columns row group statistics are kept for
+STATS_COLUMNS = ('url', 'depth')
+FILTER_OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+}
+FILE_SUFFIXES = {'parquet': '.parquet', 'cols': '.cols'}
+
+
+def export_format() -> str:
+    if EXPORT_FORMAT == 'cols' or pyarrow is None:
+        return 'cols'
+    return 'parquet'
+
+
+# region rows
+def text_fingerprint(text) -> str:
+    """Hash of a page's normalized text, equal for pages with the same content"""
+    normalized = ' '.join(' '.join(text).split()).lower()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def record_row(record) -> dict:
+    """Flatten a stored page record (see page_store) into one export row"""
+    page_url = record['page_url']
+    data = record.get('data', {})
+    page = data.get(page_url) or next(iter(data.values()), {})
+    blocks = page.get('blocks')
+    text = blocks['text'] if blocks else page.get('text', [])
+    links = page.get('links', {})
+    metadata = page.get('metadata') or {}
+    return {
+        'url': page_url,
+        'depth': page.get('depth'),
+        'crawl_id': record.get('crawl_id'),
+        'timestamp': record.get('timestamp'),
+        'title': metadata.get('title'),
+        'text': text,
+        'block_kinds': blocks['kinds'] if blocks else None,
+        'internal_links': list(links.get('internal', {})),
+        'external_links': list(links.get('external', {})),
+        'text_fingerprint': text_fingerprint(text),
+        'image_fingerprints': [image['fingerprint'] for image in page.get('images', [])],
+        'metadata': json.dumps(metadata, separators=(',', ':'), ensure_ascii=False) if metadata else None,
+    }
+
+
+def crawl_records(domain, crawl_id, bucket=None):
+    """Yield the latest record of every page of a crawl, from both storage layouts"""
+    latest = {}
+    sources = [segment_writer.iter_segment(key, bucket)
+               for key in segment_writer.list_segments(domain, crawl_id, bucket)]
+    sources.append(page_store.iter_pages(domain, crawl_id, bucket))
+    for source in sources:
+        for record in source:
+            current = latest.get(record['page_url'])
+            if current is None or (record.get('timestamp') or 0) >= (current.get('timestamp') or 0):
+                latest[record['page_url']] = record
+    return latest.values()
+
+
+def _sort_key(row):
+    return (row['depth'] if row['depth'] is not None else sys.maxsize, row['url'])
+# endregion
+
+
+# region writers
+def _parquet_schema():
+    strings = pyarrow.list_(pyarrow.string())
+    return pyarrow.schema([
+        ('url', pyarrow.string()), ('depth', pyarrow.int32()), ('crawl_id', pyarrow.string()),
+        ('timestamp', pyarrow.int64()), ('title', pyarrow.string()), ('text', strings),
+        ('block_kinds', pyarrow.string()), ('internal_links', strings), ('external_links', strings),
+        ('text_fingerprint', pyarrow.string()), ('image_fingerprints', strings), ('metadata', pyarrow.string()),
+    ])
+
+
+def write_parquet(rows, stream):
+    table = pyarrow.Table.from_pylist(rows, schema=_parquet_schema())
+    pyarrow.parquet.write_table(table, stream, row_group_size=EXPORT_ROW_GROUP_SIZE, compression='zstd',
+                                write_statistics=list(STATS_COLUMNS))
+
+
+def _stats(values):
+    present = [value for value in values if value is not None]
+    return [min(present), max(present)] if present else None
+
+
+def write_cols(rows, stream):
+    """Write rows in the stdlib columnar format"""
+    stream.write(MAGIC)
+    offset = len(MAGIC)
+    footer = {'columns': list(COLUMNS), 'row_groups': []}
+    for start in range(0, len(rows), EXPORT_ROW_GROUP_SIZE):
+        group = rows[start:start + EXPORT_ROW_GROUP_SIZE]
+        entry = {'rows': len(group), 'stats': {}, 'chunks': {}}
+        for column in COLUMNS:
+            values = [row[column] for row in group]
+            if column in STATS_COLUMNS:
+                entry['stats'][column] = _stats(values)
+            chunk = gzip.compress(json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8'),
+                                  mtime=0)
+            stream.write(chunk)
+            entry['chunks'][column] = [offset, len(chunk)]
+            offset += len(chunk)
+        footer['row_groups'].append(entry)
+    encoded = json.dumps(footer, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    stream.write(encoded + struct.pack('>Q', len(encoded)) + MAGIC)
+
+
+def write_rows(rows, stream, file_format=None):
+    rows = sorted(rows, key=_sort_key)
+    if (file_format or export_format()) == 'parquet':
+        write_parquet(rows, stream)
+    else:
+        write_cols(rows, stream)
+    return len(rows)
+# endregion
+
+
+# region reader
+def check_filters(filters):
+    """Raise ValueError for a filter the readers cannot apply: an unknown op or a None value"""
+    for column, op, value in filters or []:
+        if op not in FILTER_OPS:
+            raise ValueError(f'Unknown filter op {op!r} on {column}, expected one of {list(FILTER_OPS)}')
+        values = value if op == 'in' else [value]
+        if value is None or any(item is None for item in values):
+            # Rows with a null column never pass a filter, so a None value matches nothing
+            raise ValueError(f'Filter on {column} compares with None, null columns never match a filter')
+
+
+def _may_match(stats, filters):
+    """False if a row group's statistics prove no row can pass the filters"""
+    for column, op, value in filters:
+        bounds = stats.get(column)
+        if column not in stats:
+            continue
+        if bounds is None:
+            return False
+        low, high = bounds
+        if op == '==' and not low <= value <= high:
+            return False
+        if op == '<' and not low < value:
+            return False
+        if op == '<=' and not low <= value:
+            return False
+        if op == '>' and not high > value:
+            return False
+        if op == '>=' and not high >= value:
+            return False
+        if op == 'in' and not any(low <= item <= high for item in value):
+            return False
+    return True
+
+
+def _matches(row, filters):
+    for column, op, value in filters:
+        if row[column] is None or not FILTER_OPS[op](row[column], value):
+            return False
+    return True
+
+
+def read_cols(stream, columns=None, filters=None) -> dict:
+    """Read selected columns of a .cols file, skipping row groups by their statistics"""
+    filters = filters or []
+    check_filters(filters)
+    stream.seek(-(8 + len(MAGIC)), io.SEEK_END)
+    footer_length = struct.unpack('>Q', stream.read(8))[0]
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a columnar export file')
+    stream.seek(-(footer_length + 8 + len(MAGIC)), io.SEEK_END)
+    footer = json.loads(stream.read(footer_length))
+
+    columns = list(columns or footer['columns'])
+    needed = columns + [column for column, _, _ in filters if column not in columns]
+    result = {column: [] for column in columns}
+    for group in footer['row_groups']:
+        if not _may_match(group['stats'], filters):
+            continue
+        values = {}
+        for column in needed:
+            offset, length = group['chunks'][column]
+            stream.seek(offset)
+            values[column] = json.loads(gzip.decompress(stream.read(length)))
+        for i in range(group['rows']):
+            row = {column: values[column][i] for column in needed}
+            if _matches(row, filters):
+                for column in columns:
+                    result[column].append(row[column])
+    return result
+
+
+def read_table(source, columns=None, filters=None) -> dict:
+    """
+    Read an export (a path or a binary file object) into {column: values}.
+    filters is a list of (column, op, value) with op one of ==, !=, <, <=, >, >=, in;
+    row groups are skipped by their url and depth statistics before anything is decompressed.
+    Raises ValueError for an unknown op or a None value, see check_filters.
+    """
+    check_filters(filters)
+    stream = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        if stream.read(len(MAGIC)) == MAGIC:
+            return read_cols(stream, columns, filters)
+        if pyarrow is None:
+            raise RuntimeError('Parquet export but pyarrow is not installed')
+        stream.seek(0)
+        table = pyarrow.parquet.read_table(stream, columns=columns, filters=filters or None)
+        return table.to_pydict()
+    finally:
+        if isinstance(source, str):
+            stream.close()
+# endregion
+
+
+def export_key(domain, crawl_id, file_format=None) -> str:
+    return f'{EXPORT_PREFIX}/{domain}/{crawl_id}{FILE_SUFFIXES[file_format or export_format()]}'
+
+
+def export_crawl(domain, crawl_id, bucket=None, output=None) -> str:
+    """Export a crawl of a domain to S3, or to a local file when output is given. Returns where it went."""
+    rows = [record_row(record) for record in crawl_records(domain, crawl_id, bucket)]
+    stream = io.BytesIO()
+    count = write_rows(rows, stream)
+    if output:
+        with open(output, 'wb') as f:
+            f.write(stream.getvalue())
+        destination = output
+    else:
+        destination = export_key(domain, crawl_id)
+        s3.put_object(Bucket=bucket or page_store.PAGE_BUCKET, Key=destination, Body=stream.getvalue(),
+                      ContentType='application/octet-stream')
+    print(f'Exported {count} pages of {domain} crawl {crawl_id} to {destination} ({export_format()})')
+    return destination
+
+
+def lambda_handler(event, context):
+    """Export the crawl named in the event: {"website_domain": ..., "crawl_id": ...}"""
+    try:
+        key = export_crawl(event['website_domain'], event['crawl_id'], event.get('bucket'))
+        return {'statusCode': 200, 'body': json.dumps({'key': key})}
+    except Exception as e:
+        print(f'Error exporting crawl: {e}')
+        return {'statusCode': 500, 'body': json.dumps(f'Error exporting crawl: {str(e)}')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('domain')
+    parser.add_argument('crawl_id')
+    parser.add_argument('--bucket', default=None)
+    parser.add_argument('--output', default=None, help='local file to write instead of S3')
+    args = parser.parse_args()
+    export_crawl(args.domain, args.crawl_id, args.bucket, args.output)
+
+
+if __name__ == '__main__':
+    main()
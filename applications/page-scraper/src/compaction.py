@@ -0,0 +1,296 @@
+"""
+Compaction of legacy per-page objects into per-domain segments.
+The scraper used to store every page as its own scraped-data-<epoch>.json object.
+This job lists them page by page over key prefixes derived from the epoch range of
+the keys (listing the next prefixes ahead in parallel), reads them in bounded
+batches, merges each batch into per-domain segments (see segment_writer; legacy
+records get crawl id 'legacy'), verifies every written segment record by record and
+only then optionally deletes the originals.
+
+Prefixes are processed in key order and a checkpoint (the current prefix, the last
+key compacted in it and the keys whose segment failed verification) is saved after
+every batch, so an interrupted run resumes where it stopped and the failed keys are
+retried first. Memory stays bounded by the listing window of pages and one batch.
+
+    python compaction.py [--bucket B] [--delete] [--checkpoint FILE] [--max-objects N]
+
+As a Lambda it stops before its timeout and returns {"complete": false}; invoke it
+again to continue from the checkpoint.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import page_store
+import segment_writer
+
+s3 = boto3.client('s3')
+
+COMPACTION_SOURCE_PREFIX = os.environ.get('COMPACTION_SOURCE_PREFIX', 'scraped-data-')
+# Keys continue with a 10 digit epoch; prefixes are cut after this many digits, 6 is 10000 seconds each
+COMPACTION_PREFIX_DIGITS = int(os.environ.get('COMPACTION_PREFIX_DIGITS', '6'))
+COMPACTION_LIST_WORKERS = int(os.environ.get('COMPACTION_LIST_WORKERS', '8'))
+COMPACTION_READ_WORKERS = int(os.environ.get('COMPACTION_READ_WORKERS', '16'))
+COMPACTION_BATCH_OBJECTS = int(os.environ.get('COMPACTION_BATCH_OBJECTS', '1000'))
+COMPACTION_CHECKPOINT_KEY = os.environ.get('COMPACTION_CHECKPOINT_KEY', 'compaction/checkpoint.json')
+# Stop a Lambda run when less than this is left of its timeout
+COMPACTION_TIME_MARGIN_MS = int(os.environ.get('COMPACTION_TIME_MARGIN_MS', '60000'))
+LEGACY_CRAWL_ID = 'legacy'
+DELETE_BATCH = 1000
+
+_stats = {'listed': 0, 'compacted': 0, 'skipped': 0, 'segments': 0, 'verified': 0, 'deleted': 0}
+
+
+# region checkpoint
+def load_checkpoint(bucket, path=None) -> dict:
+    try:
+        if path:
+            if not os.path.exists(path):
+                return {}
+            with open(path) as f:
+                return json.load(f)
+        return json.load(s3.get_object(Bucket=bucket, Key=COMPACTION_CHECKPOINT_KEY)['Body'])
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+
+def save_checkpoint(bucket, checkpoint, path=None):
+    body = json.dumps(checkpoint)
+    if path:
+        with open(path, 'w') as f:
+            f.write(body)
+    else:
+        s3.put_object(Bucket=bucket, Key=COMPACTION_CHECKPOINT_KEY, Body=body.encode('utf-8'),
+                      ContentType='application/json')
+# endregion
+
+
+# region listing
+def key_prefixes(bucket, source_prefix=None, digits=None) -> list:
+    """
+    Key prefixes in key order: source_prefix plus the leading digits of every epoch from the
+    oldest legacy key until now, so the listing splits evenly over time
+    """
+    source_prefix = source_prefix or COMPACTION_SOURCE_PREFIX
+    digits = digits or COMPACTION_PREFIX_DIGITS
+    response = s3.list_objects_v2(Bucket=bucket, Prefix=source_prefix, MaxKeys=1)
+    if not response.get('Contents'):
+        return []
+    first = response['Contents'][0]['Key'][len(source_prefix):][:digits]
+    last = str(int(time.time()))[:digits]
+    if len(first) < digits or not first.isdigit() or first > last:
+        # Not epoch keys after all: one prefix, still listed page by page
+        return [source_prefix]
+    return [f'{source_prefix}{number:0{digits}d}' for number in range(int(first), int(last) + 1)]
+
+
+def list_page(bucket, prefix, start_after=None, token=None):
+    """One page of keys under prefix. Returns (keys, continuation token or None)."""
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if token:
+        params['ContinuationToken'] = token
+    elif start_after:
+        params['StartAfter'] = start_after
+    response = s3.list_objects_v2(**params)
+    keys = [item['Key'] for item in response.get('Contents', [])]
+    return keys, response.get('NextContinuationToken') if response.get('IsTruncated') else None
+
+
+def iter_pages(bucket, checkpoint):
+    """
+    Yield (prefix, keys) one listing page at a time in key order. The first pages of the next
+    COMPACTION_LIST_WORKERS prefixes are listed ahead in parallel (most prefixes fit in one
+    page or are empty), so at most that many pages are held at once.
+    """
+    prefixes = iter([prefix for prefix in key_prefixes(bucket) if prefix >= checkpoint.get('prefix', '')])
+    with ThreadPoolExecutor(max_workers=COMPACTION_LIST_WORKERS) as executor:
+        window = deque()
+
+        def list_ahead():
+            prefix = next(prefixes, None)
+            if prefix is not None:
+                start_after = checkpoint.get('after') if prefix == checkpoint.get('prefix') else None
+                window.append((prefix, executor.submit(list_page, bucket, prefix, start_after)))
+
+        for _ in range(COMPACTION_LIST_WORKERS):
+            list_ahead()
+        while window:
+            prefix, future = window.popleft()
+            list_ahead()
+            keys, token = future.result()
+            yield prefix, keys
+            while token:
+                keys, token = list_page(bucket, prefix, token=token)
+                yield prefix, keys
+
+
+def iter_batches(bucket, checkpoint):
+    """Yield (prefix, keys) batches of up to COMPACTION_BATCH_OBJECTS keys of one prefix"""
+    batch = []
+    batch_prefix = None
+    for prefix, keys in iter_pages(bucket, checkpoint):
+        _stats['listed'] += len(keys)
+        if batch and prefix != batch_prefix:
+            yield batch_prefix, batch
+            batch = []
+        batch_prefix = prefix
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= COMPACTION_BATCH_OBJECTS:
+                yield batch_prefix, batch
+                batch = []
+    if batch:
+        yield batch_prefix, batch
+# endregion
+
+
+def read_legacy(bucket, key):
+    """Read one legacy object as a page record, or None if it is not one"""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    with page_store.open_record(body, key) as stream:
+        legacy = json.load(stream)
+    if not isinstance(legacy, dict) or 'page_url' not in legacy or 'data' not in legacy:
+        return None
+    return {
+        'page_url': legacy['page_url'],
+        'crawl_id': LEGACY_CRAWL_ID,
+        'timestamp': legacy.get('timestamp'),
+        'data': legacy['data'],
+        'source_key': key,
+    }
+
+
+def _digest(record) -> str:
+    return hashlib.sha256(json.dumps(record, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def verify_segment(bucket, key, expected) -> bool:
+    """Re-read a written segment and compare it with the [(source key, digest)] appended to it"""
+    try:
+        found = [(record.get('source_key'), _digest(record)) for record in segment_writer.iter_segment(key, bucket)]
+    except Exception as e:
+        # Not written (its records fell back to page objects) or not readable
+        print(f'Error reading segment {key}: {e}')
+        return False
+    return found == expected
+
+
+def compact_batch(bucket, keys, executor, delete=False):
+    """
+    Compact one batch of legacy keys. Returns (source keys verified in a segment, source keys
+    that are not); keys that are not page records are in neither.
+    """
+    appended = {}
+    for key, record in zip(keys, executor.map(lambda key: read_legacy(bucket, key), keys)):
+        if record is None:
+            _stats['skipped'] += 1
+            continue
+        # The record is decoded from JSON again on verification, so digest its JSON form
+        record = json.loads(json.dumps(record))
+        segment_key = segment_writer.append_record(record, bucket)
+        appended.setdefault(segment_key, []).append((key, _digest(record)))
+        _stats['compacted'] += 1
+    try:
+        segment_writer.flush(bucket)
+    except segment_writer.SegmentFlushError as e:
+        # Their segments do not verify below, so their sources are kept and retried
+        print(f'Error writing segments: {e}')
+    verified = []
+    failed = []
+    for segment_key, expected in appended.items():
+        _stats['segments'] += 1
+        if verify_segment(bucket, segment_key, expected):
+            verified.extend(source for source, _ in expected)
+            _stats['verified'] += len(expected)
+        else:
+            failed.extend(source for source, _ in expected)
+            print(f'Segment {segment_key} failed verification, keeping its {len(expected)} source objects')
+    if delete:
+        delete_sources(bucket, verified)
+    return verified, failed
+
+
+def delete_sources(bucket, keys):
+    for start in range(0, len(keys), DELETE_BATCH):
+        batch = keys[start:start + DELETE_BATCH]
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in batch],
+                                                            'Quiet': True})
+        for error in response.get('Errors', []):
+            print(f'Error deleting {error.get("Key")}: {error.get("Message")}')
+        _stats['deleted'] += len(batch) - len(response.get('Errors', []))
+
+
+def run(bucket=None, delete=False, checkpoint_path=None, max_objects=None, time_left_ms=None) -> dict:
+    """
+    Compact legacy objects until done, max_objects are compacted, or time_left_ms() (a Lambda
+    context's remaining time) drops below COMPACTION_TIME_MARGIN_MS. Returns the run's stats.
+    """
+    bucket = bucket or page_store.PAGE_BUCKET
+    checkpoint = load_checkpoint(bucket, checkpoint_path)
+    # Keys whose segment failed verification in an earlier run are retried first
+    retry = checkpoint.get('failed', [])
+    if checkpoint.get('complete') and not retry:
+        print('Compaction already complete according to the checkpoint')
+        return dict(_stats, complete=True, failed=0)
+    started = time.time()
+    failed = []
+    position = {name: checkpoint[name] for name in ('prefix', 'after', 'complete') if name in checkpoint}
+
+    def done_with(batch):
+        save_checkpoint(bucket, dict(position, failed=failed + retry), checkpoint_path)
+        out_of_objects = max_objects is not None and _stats['compacted'] + _stats['skipped'] >= max_objects
+        out_of_time = time_left_ms is not None and time_left_ms() < COMPACTION_TIME_MARGIN_MS
+        if out_of_objects or out_of_time:
+            print(f'Compaction paused at {batch[-1]} after {time.time() - started:.0f}s: {json.dumps(_stats)}')
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=COMPACTION_READ_WORKERS) as executor:
+        while retry:
+            batch = retry[:COMPACTION_BATCH_OBJECTS]
+            retry = retry[COMPACTION_BATCH_OBJECTS:]
+            failed.extend(compact_batch(bucket, batch, executor, delete)[1])
+            if done_with(batch):
+                return dict(_stats, complete=False, failed=len(failed) + len(retry))
+        if not checkpoint.get('complete'):
+            for prefix, batch in iter_batches(bucket, checkpoint):
+                failed.extend(compact_batch(bucket, batch, executor, delete)[1])
+                position = {'prefix': prefix, 'after': batch[-1]}
+                if done_with(batch):
+                    return dict(_stats, complete=False, failed=len(failed))
+    # Complete as far as listing goes; a later run only retries the failed keys
+    save_checkpoint(bucket, {'complete': True, 'failed': failed}, checkpoint_path)
+    print(f'Compaction complete after {time.time() - started:.0f}s, {len(failed)} keys failed: {json.dumps(_stats)}')
+    return dict(_stats, complete=not failed, failed=len(failed))
+
+
+def lambda_handler(event, context):
+    """event: {"bucket": optional, "delete": false, "max_objects": optional}"""
+    try:
+        result = run(event.get('bucket'), bool(event.get('delete')), max_objects=event.get('max_objects'),
+                     time_left_ms=context.get_remaining_time_in_millis if context else None)
+        return {'statusCode': 200, 'body': json.dumps(result)}
+    except Exception as e:
+        print(f'Error compacting: {e}')
+        return {'statusCode': 500, 'body': json.dumps(f'Error compacting: {str(e)}')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', default=None)
+    parser.add_argument('--delete', action='store_true', help='delete source objects once verified')
+    parser.add_argument('--checkpoint', default=None, help='local checkpoint file instead of the S3 one')
+    parser.add_argument('--max-objects', type=int, default=None)
+    args = parser.parse_args()
+    run(args.bucket, args.delete, args.checkpoint, args.max_objects)
+
+
+if __name__ == '__main__':
+    main()
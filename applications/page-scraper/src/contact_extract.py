@@ -0,0 +1,222 @@
+"""
+Deterministic contact details: emails, phone numbers and social profiles.
+One precompiled pattern scans the page text once for plain emails, obfuscated
+emails ("jane [at] studio [dot] com") and phone numbers; mailto:/tel: links and
+links to social networks are read from the external links. Whatever a page yields
+is added to its domain's contacts in the crawl state table under contacts#<domain>
+(string sets emails, phones, social), so contact data is there while the crawl runs.
+"""
+
+import os
+import re
+import time
+from urllib.parse import unquote, urlsplit
+
+import boto3
+from botocore.exceptions import ClientError
+
+dynamodb = boto3.resource('dynamodb')
+
+CONTACTS_ENABLED = os.environ.get('CONTACTS_ENABLED', 'true').lower() == 'true'
+# Index and link farm pages can list hundreds of addresses, only the first few are kept
+CONTACTS_MAX_PER_PAGE = int(os.environ.get('CONTACTS_MAX_PER_PAGE', '20'))
+
+_AT = r'(?:\s*[\[({<]\s*(?:at|@)\s*[\])}>]\s*|\s+at\s+)'
+_DOT = r'(?:\s*[\[({<]\s*dot\s*[\])}>]\s*|\s+dot\s+|\.)'
+CONTACT_PATTERN = re.compile(
+    r'(?P<email>(?<![\w.%+-])[a-z0-9][a-z0-9._%+-]*@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,24})(?![\w-])'
+    r'|(?P<obfuscated>(?<![\w.%+-])[a-z0-9][a-z0-9._%+-]*' + _AT +
+    r'[a-z0-9-]+(?:' + _DOT + r'[a-z0-9-]+)*' + _DOT + r'[a-z]{2,24})(?![\w-])'
+    r'|(?P<phone>(?<![\w+])(?:\+\d{1,3}[ .-]?)?(?:\(\d{1,4}\)[ .-]?)?\d{2,4}(?:[ .-]\d{2,4}){1,4})(?![\w])',
+    re.IGNORECASE
+)
+AT_PATTERN = re.compile(_AT, re.IGNORECASE)
+DOT_PATTERN = re.compile(_DOT, re.IGNORECASE)
+PHONE_DIGITS = (9, 15)
+DIGIT_GROUPS = re.compile(r'\d+')
+YEAR = re.compile(r'(?:19|20)\d\d')
+# Image names such as logo@2x.png look like emails
+EMAIL_FALSE_TLDS = frozenset(['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'avif'])
+
+# Social networks by host, and first path segments that are content or pages rather than profiles
+SOCIAL_NETWORKS = {
+    'instagram.com': 'instagram', 'facebook.com': 'facebook', 'twitter.com': 'twitter', 'x.com': 'twitter',
+    'vimeo.com': 'vimeo', 'youtube.com': 'youtube', 'linkedin.com': 'linkedin', 'tiktok.com': 'tiktok',
+    'behance.net': 'behance', 'artstation.com': 'artstation', 'soundcloud.com': 'soundcloud',
+    'threads.net': 'threads', 'pinterest.com': 'pinterest', 'bsky.app': 'bluesky', 'patreon.com': 'patreon',
+}
+# Cheap test run on every external link before it is split and looked at as a profile
+SOCIAL_LINK_PATTERN = re.compile(
+    r'https?://(?:www\.|m\.|mobile\.)?(?:' + '|'.join(re.escape(host) for host in SOCIAL_NETWORKS) + r')[:/]',
+    re.IGNORECASE
+)
+SOCIAL_PROFILE_PREFIXES = {'linkedin.com': ('in', 'company'), 'youtube.com': ('c', 'channel', 'user'),
+                           'bsky.app': ('profile',)}
+SOCIAL_RESERVED_PATHS = frozenset([
+    'p', 'reel', 'reels', 'tv', 'stories', 'explore', 'share', 'sharer', 'sharer.php', 'intent', 'hashtag',
+    'watch', 'embed', 'video', 'videos', 'shorts', 'playlist', 'login', 'signup', 'home', 'search', 'i',
+    'plugins', 'dialog', 'tr', 'legal', 'about', 'help', 'privacy', 'policies', 'terms', 'pin', 'status',
+])
+
+# Contacts already stored per domain for the lifetime of the container, to skip writes that add nothing
+_known = {}
+_stats = {'pages': 0, 'emails': 0, 'phones': 0, 'social': 0, 'writes': 0}
+
+
+def normalize_phone(value):
+    """Digits of a phone number with a leading + when given, or None if it cannot be one"""
+    digits = ''.join(char for char in value if char.isdigit())
+    if not PHONE_DIGITS[0] <= len(digits) <= PHONE_DIGITS[1]:
+        return None
+    return ('+' if value.lstrip().startswith('+') else '') + digits
+
+
+def _text_phone(value):
+    # Runs of numbers separated only by spaces are mostly years and dimensions; a number
+    # found in text needs a country code, an area code in parentheses or - / . separators
+    if not (value.startswith(('+', '(')) or '-' in value or '.' in value):
+        return None
+    # and is not a run of years ("Edition 2019-2020-2021")
+    if all(YEAR.fullmatch(group) for group in DIGIT_GROUPS.findall(value)):
+        return None
+    return normalize_phone(value)
+
+
+def normalize_email(value):
+    value = value.strip().lower()
+    if value.rsplit('.', 1)[-1] in EMAIL_FALSE_TLDS:
+        return None
+    return value
+
+
+def _deobfuscate(value):
+    # A plain ' at ' is only taken for an email together with a spelled out 'dot'
+    at = AT_PATTERN.search(value)
+    user, domain = value[:at.start()], value[at.end():]
+    if at.group().strip().lower() == 'at' and '.' not in DOT_PATTERN.sub('.', domain.replace('.', '')):
+        return None
+    return normalize_email(user + '@' + DOT_PATTERN.sub('.', domain))
+
+
+def social_profile(url):
+    """Return (network, canonical profile URL) for a link to a social profile, or None"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower().split(':')[0]
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    network = SOCIAL_NETWORKS.get(host)
+    if network is None:
+        return None
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if not segments:
+        return None
+    prefixes = SOCIAL_PROFILE_PREFIXES.get(host, ())
+    if segments[0].lower() in prefixes:
+        if len(segments) < 2:
+            return None
+        handle = segments[0].lower() + '/' + segments[1]
+    else:
+        handle = segments[0]
+        if handle.lower() in SOCIAL_RESERVED_PATHS or (network == 'vimeo' and handle.isdigit()):
+            return None
+    return network, f'https://{host}/{handle.lower()}'
+
+
+def _add(found, kind, value):
+    if value and value not in found[kind] and len(found[kind]) < CONTACTS_MAX_PER_PAGE:
+        found[kind].append(value)
+
+
+def extract_contacts(links, text, summary=None) -> dict:
+    """
+    Contacts of one page from its links ({'internal': {...}, 'external': {...}}), its text strings
+    and optionally its metadata summary (see page_metadata). Returns only the kinds found.
+    """
+    found = {'emails': [], 'phones': [], 'social': []}
+    for url in links.get('external', {}):
+        scheme = url[:7].lower()
+        if scheme == 'mailto:':
+            for address in unquote(url[7:]).split('?')[0].split(','):
+                if '@' in address:
+                    _add(found, 'emails', normalize_email(address))
+        elif scheme.startswith(('tel:', 'callto:')):
+            _add(found, 'phones', normalize_phone(unquote(url.split(':', 1)[1])))
+        elif SOCIAL_LINK_PATTERN.match(url):
+            profile = social_profile(url)
+            if profile:
+                _add(found, 'social', profile[1])
+
+    for match in CONTACT_PATTERN.finditer('\n'.join(text)):
+        kind = match.lastgroup
+        if kind == 'email':
+            _add(found, 'emails', normalize_email(match.group()))
+        elif kind == 'obfuscated':
+            _add(found, 'emails', _deobfuscate(match.group()))
+        else:
+            _add(found, 'phones', _text_phone(match.group()))
+
+    if summary:
+        _add(found, 'emails', summary.get('email') and normalize_email(summary['email']))
+        _add(found, 'phones', summary.get('telephone') and normalize_phone(summary['telephone']))
+        for link in summary.get('social', []):
+            profile = social_profile(link) if SOCIAL_LINK_PATTERN.match(link) else None
+            if profile:
+                _add(found, 'social', profile[1])
+
+    _stats['pages'] += 1
+    for kind, values in found.items():
+        _stats[kind] += len(values)
+    return {kind: values for kind, values in found.items() if values}
+
+
+def _state_table():
+    table_name = os.environ.get('CRAWL_STATE_TABLE_NAME', 'scraper-crawl-state')
+    return dynamodb.Table(table_name)
+
+
+def _state_key(domain):
+    return f'contacts#{domain}'
+
+
+def record_contacts(domain, contacts) -> bool:
+    """Add a page's contacts to the domain's string sets. Returns True if anything new was written."""
+    known = _known.setdefault(domain, set())
+    new = {kind: set(values) - known for kind, values in contacts.items()}
+    new = {kind: values for kind, values in new.items() if values}
+    if not new:
+        return False
+    names = {f'#{kind}': kind for kind in new}
+    values = {f':{kind}': values for kind, values in new.items()}
+    values[':now'] = int(time.time())
+    try:
+        _state_table().update_item(
+            Key={'state_key': _state_key(domain)},
+            UpdateExpression='ADD ' + ', '.join(f'#{kind} :{kind}' for kind in new) + ' SET updated_at = :now',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        print(f'Error recording contacts for {domain}: {e.response["Error"]["Code"]}')
+        return False
+    except Exception as e:
+        print(f'Error recording contacts for {domain}: {e}')
+        return False
+    for values in new.values():
+        known.update(values)
+    _stats['writes'] += 1
+    return True
+
+
+def get_contacts(domain) -> dict:
+    """All contacts recorded for a domain so far, as sorted lists"""
+    try:
+        item = _state_table().get_item(Key={'state_key': _state_key(domain)}).get('Item', {})
+    except Exception as e:
+        print(f'Error reading contacts for {domain}: {e}')
+        return {}
+    return {kind: sorted(item[kind]) for kind in ('emails', 'phones', 'social') if item.get(kind)}
+
+
+def get_stats() -> dict:
+    return dict(_stats, domains_cached=len(_known))
@@ -0,0 +1,73 @@
+"""
+Typed content blocks built from the extracted text strings.
+Strings of the same block (see text_layout) are merged into one entry, so
+'<p>Oil on <b>linen</b>, 2021</p>' becomes one paragraph instead of three strings.
+
+A block is [kind, offset, text]: kind is h1-h6, p, li, caption, link (a block made
+only of link text), text for anything else, or data for text merged in from embedded
+JSON; offset is where the block starts in the page text, the block texts joined with
+newlines. Offsets follow from the texts, so the compact form stored in scrape results
+keeps only one character per block kind next to the texts:
+    {"kinds": "1pplc", "text": ["Jane Doe", "Oil on linen, 2021", ...]}
+"""
+
+KIND_CODES = {
+    'h1': '1', 'h2': '2', 'h3': '3', 'h4': '4', 'h5': '5', 'h6': '6',
+    'p': 'p', 'li': 'l', 'caption': 'c', 'link': 'a', 'text': 't', 'data': 'd',
+}
+# No space is put between merged fragments around these, e.g. 'linen' + ', 2021'
+NO_SPACE_BEFORE = tuple(',.;:!?)]}%')
+NO_SPACE_AFTER = tuple('([{')
+
+
+def _merge(parts):
+    merged = parts[0]
+    for part in parts[1:]:
+        if part.startswith(NO_SPACE_BEFORE) or merged.endswith(NO_SPACE_AFTER):
+            merged += part
+        else:
+            merged += ' ' + part
+    return merged
+
+
+def build_blocks(text, blocks) -> list:
+    """Merge consecutive strings of the same block into [kind, offset, text] entries"""
+    result = []
+    offset = 0
+    current = current_kind = None
+    parts = []
+    all_links = True
+    for string, (number, kind, in_link) in zip(text, blocks):
+        if number != current and parts:
+            offset = _append_block(result, offset, current_kind, all_links, parts)
+            parts = []
+        if not parts:
+            current, current_kind, all_links = number, kind, True
+        parts.append(string)
+        all_links = all_links and in_link
+    if parts:
+        _append_block(result, offset, current_kind, all_links, parts)
+    return result
+
+
+def _append_block(result, offset, kind, all_links, parts):
+    block_text = _merge(parts)
+    if kind == 'text' and all_links:
+        kind = 'link'
+    result.append([kind, offset, block_text])
+    # The next block starts after this one and its newline separator
+    return offset + len(block_text) + 1
+
+
+def append_strings(result, strings, kind='data') -> list:
+    """Add standalone strings (such as embedded JSON text) as blocks of their own"""
+    offset = result[-1][1] + len(result[-1][2]) + 1 if result else 0
+    for string in strings:
+        result.append([kind, offset, string])
+        offset += len(string) + 1
+    return result
+
+
+def compact_blocks(blocks) -> dict:
+    return {'kinds': ''.join(KIND_CODES[kind] for kind, _, _ in blocks),
+            'text': [text for _, _, text in blocks]}
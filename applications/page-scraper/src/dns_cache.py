@@ -0,0 +1,129 @@
+"""
+In-process DNS resolution cache for the page fetcher.
+Lambda has no local caching resolver, so every new connection would otherwise
+pay for a full lookup. The cache is plugged into urllib3's create_connection,
+which is what requests uses underneath.
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from urllib3.util import connection as urllib3_connection
+
+DNS_CACHE_TTL = int(os.environ.get('DNS_CACHE_TTL', '300'))
+DNS_CACHE_STALE_TTL = int(os.environ.get('DNS_CACHE_STALE_TTL', '3600'))
+DNS_CACHE_MAX_ENTRIES = int(os.environ.get('DNS_CACHE_MAX_ENTRIES', '512'))
+
+_original_create_connection = urllib3_connection.create_connection
+_cache = OrderedDict()  # (host, port, family) -> (expires_at, stale_until, addresses)
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stale_fallbacks': 0,
+    'evictions': 0,
+    'failures': 0,
+}
+
+
+def _is_ip_address(host):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (OSError, ValueError):
+            continue
+    return False
+
+
+def resolve(host, port, family=socket.AF_UNSPEC):
+    """
+    Resolve host to a list of IP addresses, serving from the cache while the entry is fresh.
+    If a lookup fails and an expired entry is still within the stale window, the stale
+    addresses are returned instead of raising.
+    """
+    key = (host, port, family)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[2]
+        _stats['misses'] += 1
+
+    try:
+        results = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+    except OSError:
+        with _lock:
+            _stats['failures'] += 1
+            if entry and entry[1] > now:
+                _stats['stale_fallbacks'] += 1
+                return entry[2]
+        raise
+
+    # Keep resolver order but drop duplicates, getaddrinfo may repeat addresses per protocol
+    addresses = list(dict.fromkeys(res[4][0] for res in results))
+    with _lock:
+        _cache[key] = (now + DNS_CACHE_TTL, now + DNS_CACHE_STALE_TTL, addresses)
+        _cache.move_to_end(key)
+        while len(_cache) > DNS_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+            _stats['evictions'] += 1
+    return addresses
+
+
+def create_connection(address, *args, **kwargs):
+    """
+    Drop-in replacement for urllib3.util.connection.create_connection that resolves
+    through the cache and then connects to each address in turn.
+    TLS hostname verification is unaffected since urllib3 passes the server hostname separately.
+    """
+    host, port = address
+    if host.startswith('['):
+        host = host.strip('[]')
+    if _is_ip_address(host):
+        return _original_create_connection(address, *args, **kwargs)
+
+    err = None
+    for ip in resolve(host, port, urllib3_connection.allowed_gai_family()):
+        try:
+            return _original_create_connection((ip, port), *args, **kwargs)
+        except OSError as e:
+            err = e
+    if err is not None:
+        # The cached addresses may be outdated, drop them so the next attempt re-resolves
+        invalidate(host)
+        raise err
+    raise OSError('getaddrinfo returns an empty list')
+
+
+def invalidate(host=None):
+    """Remove cached entries for a host, or all entries if no host is given"""
+    with _lock:
+        if host is None:
+            _cache.clear()
+            return
+        for key in [key for key in _cache if key[0] == host]:
+            del _cache[key]
+
+
+def install():
+    """Route urllib3 connection setup through the cache. Safe to call more than once."""
+    urllib3_connection.create_connection = create_connection
+
+
+def uninstall():
+    urllib3_connection.create_connection = _original_create_connection
+
+
+def get_stats():
+    """Return cache counters for logging alongside the scrape result"""
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_cache)
+    return stats
@@ -0,0 +1,128 @@
+"""
+Extraction of content that JavaScript-rendered sites ship as embedded JSON.
+Wix, Squarespace and Next.js pages often carry their real text in script blobs
+(__NEXT_DATA__, application/json state, JSON-LD) and render almost nothing as HTML.
+Reading those blobs gives us the rendered content without running a browser.
+"""
+
+import html
+import json
+import os
+import re
+
+EMBEDDED_TEXT_MIN_LENGTH = int(os.environ.get('EMBEDDED_TEXT_MIN_LENGTH', '20'))
+EMBEDDED_MAX_STRINGS = int(os.environ.get('EMBEDDED_MAX_STRINGS', '2000'))
+
+EMBEDDED_SCRIPT_TYPES = {'application/json', 'application/ld+json'}
+
+# Inline scripts that assign page state to a global, e.g. "window.__INITIAL_STATE__ = {...};"
+KNOWN_STATE_VARIABLES = [
+    'window.__INITIAL_STATE__',
+    'window.__PRELOADED_STATE__',
+    'window.__APOLLO_STATE__',
+    'window.__NUXT__',
+    'Static.SQUARESPACE_CONTEXT',
+]
+STATE_ASSIGNMENT_PATTERN = re.compile(
+    r'(?:%s)\s*=\s*' % '|'.join(re.escape(name) for name in KNOWN_STATE_VARIABLES))
+
+# Keys whose string values are identifiers, styling or code rather than page content
+SKIPPED_KEYS = {
+    '@context', '@type', 'id', '_id', 'type', 'typename', '__typename', 'buildId', 'hash',
+    'className', 'class', 'style', 'css', 'script', 'locale', 'lang', 'mimeType', 'contentType',
+    'format', 'token', 'key', 'slug', 'query', 'assetPrefix', 'runtimeConfig', 'page',
+}
+LINK_KEYS = {'url', 'href', 'link', 'sameAs', 'mainEntityOfPage', 'fullUrl', 'canonicalUrl'}
+ASSET_EXTENSIONS = (
+    '.js', '.css', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.avif', '.ico',
+    '.woff', '.woff2', '.ttf', '.otf', '.mp4', '.webm', '.json', '.map',
+)
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+WORD_PATTERN = re.compile(r'[^\W\d_]{2,}')
+
+
+def parse_script_payload(script_text: str, script_type: str = ''):
+    """
+    Parse the JSON carried by a script tag.
+    Returns None for scripts that are neither JSON nor a known state assignment.
+    """
+    script_text = script_text.strip()
+    if not script_text:
+        return None
+    if script_type in EMBEDDED_SCRIPT_TYPES or script_text[0] in '{[':
+        try:
+            return json.loads(script_text)
+        except ValueError:
+            pass
+
+    match = STATE_ASSIGNMENT_PATTERN.search(script_text)
+    if not match:
+        return None
+    try:
+        payload, _ = json.JSONDecoder().raw_decode(script_text, match.end())
+        return payload
+    except ValueError:
+        return None
+
+
+def _looks_like_link(value: str, key: str) -> bool:
+    if ' ' in value or len(value) > 2048:
+        return False
+    path = value.split('?')[0].split('#')[0].lower()
+    if path.endswith(ASSET_EXTENSIONS):
+        return False
+    if value.startswith(('http://', 'https://')):
+        return True
+    # Relative paths are only trusted under link-like keys, elsewhere they are usually routes or asset ids
+    return key in LINK_KEYS and value.startswith('/') and not value.startswith('//')
+
+
+def _clean_text(value: str):
+    if '<' in value:
+        value = TAG_PATTERN.sub(' ', value)
+    value = WHITESPACE_PATTERN.sub(' ', html.unescape(value)).strip()
+    if len(value) < EMBEDDED_TEXT_MIN_LENGTH or ' ' not in value:
+        return None
+    # Skip code, data URIs and other strings that are mostly not words
+    if len(''.join(WORD_PATTERN.findall(value))) < len(value) / 2:
+        return None
+    return value
+
+
+def collect_strings(payload, text: dict, links: dict):
+    """
+    Walk a decoded JSON payload and collect readable text and link targets.
+    text and links are dicts used as ordered sets so repeated values are kept once.
+    """
+    stack = [(payload, '')]
+    while stack and len(text) + len(links) < EMBEDDED_MAX_STRINGS:
+        value, key = stack.pop()
+        if isinstance(value, dict):
+            stack.extend((child, child_key) for child_key, child in reversed(list(value.items()))
+                         if child_key not in SKIPPED_KEYS)
+        elif isinstance(value, list):
+            stack.extend((child, key) for child in reversed(value))
+        elif isinstance(value, str):
+            if _looks_like_link(value, key):
+                links[value] = None
+                continue
+            cleaned = _clean_text(value)
+            if cleaned:
+                text[cleaned] = None
+
+
+def extract_from_scripts(scripts) -> dict:
+    """
+    Extracts text and links from (type, text) pairs of inline scripts.
+    Scripts typed as anything other than JSON or JavaScript are ignored.
+    """
+    text, links = {}, {}
+    for script_type, script_text in scripts:
+        if script_type and script_type not in EMBEDDED_SCRIPT_TYPES and 'javascript' not in script_type:
+            continue
+        payload = parse_script_payload(script_text, script_type)
+        if payload is not None:
+            collect_strings(payload, text, links)
+    return {'text': list(text), 'links': list(links)}
@@ -0,0 +1,137 @@
+"""
+Raw response cache for the page fetcher.
+Recording stores every fetched response (status, headers, compressed body) so
+extraction changes can be replayed against the same corpus without touching
+the network. Bodies are content-addressed, so identical pages are stored once.
+
+Layout under the cache root (S3 bucket/prefix or local directory):
+    responses/<sha256 of url>.json   url, status, headers, encoding, body hash
+    bodies/<sha256 of body>.gz       gzip compressed body bytes
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import boto3
+
+s3 = boto3.client('s3')
+
+# 'off', 'record' (store every live fetch) or 'replay' (serve fetches from the cache only)
+FETCH_CACHE_MODE = os.environ.get('FETCH_CACHE_MODE', 'off').lower()
+FETCH_CACHE_BUCKET = os.environ.get('FETCH_CACHE_BUCKET')
+FETCH_CACHE_PREFIX = os.environ.get('FETCH_CACHE_PREFIX', 'fetch-cache')
+# Local directory backend for development, used instead of S3 when set
+FETCH_CACHE_DIR = os.environ.get('FETCH_CACHE_DIR')
+
+
+class S3Backend:
+    def __init__(self, bucket, prefix):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, name):
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def get(self, name):
+        try:
+            response = s3.get_object(Bucket=self.bucket, Key=self._key(name))
+        except s3.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+    def put(self, name, data, content_type):
+        s3.put_object(Bucket=self.bucket, Key=self._key(name), Body=data, ContentType=content_type)
+
+
+class LocalBackend:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, name, data, content_type):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a reader never sees a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def get_backend():
+    """Return the configured cache backend, or None if no location is configured"""
+    if FETCH_CACHE_DIR:
+        return LocalBackend(FETCH_CACHE_DIR)
+    if FETCH_CACHE_BUCKET:
+        return S3Backend(FETCH_CACHE_BUCKET, FETCH_CACHE_PREFIX)
+    return None
+
+
+def is_recording() -> bool:
+    return FETCH_CACHE_MODE == 'record' and get_backend() is not None
+
+
+def is_replaying() -> bool:
+    return FETCH_CACHE_MODE == 'replay'
+
+
+def _url_key(url):
+    return 'responses/' + hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json'
+
+
+def store_response(url, response):
+    """
+    Record a requests response. Failures are logged and ignored so the cache never breaks a scrape.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        body = response.content
+        body_hash = hashlib.sha256(body).hexdigest()
+        backend.put(f'bodies/{body_hash}.gz', gzip.compress(body), 'application/gzip')
+
+        record = {
+            'url': url,
+            'final_url': response.url,
+            'status': response.status_code,
+            'headers': {name.lower(): value for name, value in response.headers.items()},
+            # Effective encoding, so replay decodes exactly like response.text did
+            'encoding': response.encoding or response.apparent_encoding,
+            'body_sha256': body_hash,
+            'fetched_at': int(time.time()),
+        }
+        backend.put(_url_key(url), json.dumps(record, separators=(',', ':')).encode('utf-8'),
+                    'application/json')
+        return record
+    except Exception as e:
+        print(f'Error storing {url} in fetch cache: {e}')
+        return None
+
+
+def load_response(url):
+    """
+    Load a recorded response for the URL.
+    Returns the record with its decoded 'text' added, or None if the URL was never recorded.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    data = backend.get(_url_key(url))
+    if data is None:
+        return None
+    record = json.loads(data)
+    body = backend.get(f'bodies/{record["body_sha256"]}.gz')
+    if body is None:
+        return None
+    record['text'] = str(gzip.decompress(body), record.get('encoding') or 'utf-8', errors='replace')
+    return record
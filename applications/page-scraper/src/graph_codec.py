@@ -0,0 +1,221 @@
+"""
+Compact encoding of a domain's link graph.
+Sitemap entries repeat the same scheme, host and path prefixes in every link. Here
+every URL of a domain gets an integer id from an append only dictionary, so an id
+never changes once it is given out, and an adjacency list is stored as its sorted
+ids, delta encoded as varints: a page linking to 40 pages of its site takes about
+50 bytes instead of a few kilobytes of URLs.
+
+Dictionary entries are URLs relative to the domain (the path of https://<domain>
+URLs, the full URL otherwise). A whole dictionary is front coded: every entry is the
+length of the prefix it shares with the previous entry and the rest.
+
+encode_graph() / decode_graph() turn a whole sitemap into one zlib compressed blob for
+snapshots and the dashboard; encode_update() / apply_update() carry one page's links
+plus the dictionary entries a reader has not seen yet. Adjacency lists are sets, so
+duplicate links collapse and links come back in id order.
+"""
+
+import base64
+import zlib
+
+MAGIC = b'FANG1'
+
+
+# region varints
+def encode_varint(value, out):
+    """Append an unsigned LEB128 varint to a bytearray"""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset=0):
+    """Read a varint at offset. Returns (value, offset after it)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_ids(ids) -> bytes:
+    """Sorted, distinct ids as varint deltas (the first delta is the smallest id)"""
+    out = bytearray()
+    previous = -1
+    for value in sorted(set(ids)):
+        encode_varint(value - previous - 1, out)
+        previous = value
+    return bytes(out)
+
+
+def decode_ids(data) -> list:
+    ids = []
+    offset = 0
+    previous = -1
+    while offset < len(data):
+        delta, offset = decode_varint(data, offset)
+        previous += delta + 1
+        ids.append(previous)
+    return ids
+# endregion
+
+
+class UrlDictionary:
+    """Append only URL <-> id mapping of one domain; ids are positions in the entry list"""
+
+    def __init__(self, domain, entries=()):
+        self.domain = domain
+        self.origin = f'https://{domain}'
+        self.entries = []
+        self._ids = {}
+        self.extend_entries(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return self.relative(url) in self._ids
+
+    def relative(self, url) -> str:
+        if url.startswith(self.origin) and url[len(self.origin):len(self.origin) + 1] in ('', '/', '?'):
+            return url[len(self.origin):]
+        return url
+
+    def absolute(self, entry) -> str:
+        # relative() leaves other URLs whole, its own entries are empty or start with / or ?
+        return self.origin + entry if entry == '' or entry[0] in '/?' else entry
+
+    def extend_entries(self, entries):
+        """Append stored entries; a repeated entry (two writers added it at once) keeps its first id"""
+        for entry in entries:
+            self._ids.setdefault(entry, len(self.entries))
+            self.entries.append(entry)
+
+    def id(self, url):
+        return self._ids.get(self.relative(url))
+
+    def add(self, url) -> int:
+        entry = self.relative(url)
+        if entry not in self._ids:
+            self.extend_entries([entry])
+        return self._ids[entry]
+
+    def missing(self, urls) -> list:
+        """Relative entries of the urls that have no id yet, each once, in order"""
+        return list(dict.fromkeys(entry for entry in map(self.relative, urls) if entry not in self._ids))
+
+    def url(self, url_id) -> str:
+        return self.absolute(self.entries[url_id])
+
+
+def encode_links(dictionary, links) -> bytes:
+    """A page's links as delta encoded ids; links without an id are added to the dictionary"""
+    return encode_ids(dictionary.add(link) for link in links)
+
+
+def decode_links(dictionary, data) -> list:
+    return [dictionary.url(url_id) for url_id in decode_ids(bytes(data))]
+
+
+# region front coding
+def front_code(entries, out):
+    previous = b''
+    for entry in entries:
+        encoded = entry.encode('utf-8')
+        shared = 0
+        limit = min(len(previous), len(encoded))
+        while shared < limit and previous[shared] == encoded[shared]:
+            shared += 1
+        encode_varint(shared, out)
+        encode_varint(len(encoded) - shared, out)
+        out += encoded[shared:]
+        previous = encoded
+
+
+def front_decode(data, offset, count):
+    """Read count front coded entries. Returns (entries, offset after them)."""
+    entries = []
+    previous = b''
+    for _ in range(count):
+        shared, offset = decode_varint(data, offset)
+        length, offset = decode_varint(data, offset)
+        previous = previous[:shared] + data[offset:offset + length]
+        offset += length
+        entries.append(previous.decode('utf-8'))
+    return entries, offset
+# endregion
+
+
+# region graphs
+def encode_graph(sitemap, dictionary) -> bytes:
+    """
+    A whole sitemap ({url: [links]}) as one compressed blob. URLs the dictionary lacks are
+    added to it, so pass a dictionary whose ids are stored (see sitemap_store) to keep them stable.
+    """
+    rows = sorted((dictionary.add(url), encode_links(dictionary, links)) for url, links in sitemap.items())
+    domain = dictionary.domain.encode('utf-8')
+    out = bytearray()
+    encode_varint(len(domain), out)
+    out += domain
+    encode_varint(len(dictionary), out)
+    front_code(dictionary.entries, out)
+    encode_varint(len(rows), out)
+    previous = -1
+    for url_id, links in rows:
+        encode_varint(url_id - previous - 1, out)
+        encode_varint(len(links), out)
+        out += links
+        previous = url_id
+    return MAGIC + zlib.compress(bytes(out), 6)
+
+
+def decode_graph(blob):
+    """Returns (dictionary, sitemap) of an encode_graph blob"""
+    if not blob.startswith(MAGIC):
+        raise ValueError('Not an encoded link graph')
+    data = zlib.decompress(blob[len(MAGIC):])
+    length, offset = decode_varint(data)
+    domain = data[offset:offset + length].decode('utf-8')
+    count, offset = decode_varint(data, offset + length)
+    entries, offset = front_decode(data, offset, count)
+    dictionary = UrlDictionary(domain, entries)
+    rows, offset = decode_varint(data, offset)
+    sitemap = {}
+    previous = -1
+    for _ in range(rows):
+        delta, offset = decode_varint(data, offset)
+        previous += delta + 1
+        length, offset = decode_varint(data, offset)
+        sitemap[dictionary.url(previous)] = decode_links(dictionary, data[offset:offset + length])
+        offset += length
+    return dictionary, sitemap
+
+
+def encode_update(dictionary, url, links, known=0) -> dict:
+    """
+    One page's links for a reader that already holds the first known dictionary entries:
+    JSON ready, with the newer entries and the ids base64 encoded.
+    """
+    url_id = dictionary.add(url)
+    encoded = encode_links(dictionary, links)
+    return {
+        'base': known,
+        'entries': dictionary.entries[known:],
+        'node': url_id,
+        'links': base64.b64encode(encoded).decode('ascii'),
+    }
+
+
+def apply_update(dictionary, update):
+    """Bring a reader's dictionary up to date with an encode_update. Returns (url, links)."""
+    if update['base'] > len(dictionary):
+        raise ValueError(f'Update starts at entry {update["base"]} but only {len(dictionary)} are known')
+    dictionary.extend_entries(update['entries'][len(dictionary) - update['base']:])
+    return dictionary.url(update['node']), decode_links(dictionary, base64.b64decode(update['links']))
+# endregion
@@ -0,0 +1,380 @@
+"""
+Link graph metrics kept next to the sitemap, so the dashboard never recomputes them.
+Per node (by its graph_codec dictionary id) the website-sitemap-parts table holds
+in-degree, out-degree, link depth and PageRank in chunk items of GRAPH_METRICS_CHUNK ids:
+    website_domain=<domain> part=metrics#<N>   in_degree, out_degree, depth, pagerank (maps by id)
+    website_domain=<domain> part=metrics       summary: version, nodes, edges, top pages
+On write, record_page() sets the page's out-degree, counts one more in-link for each
+page it links to and records depths (the first depth seen wins: the crawl runs
+roughly breadth first). With GRAPH_METRICS_SOURCE=stream the scraper leaves the
+degrees to apply_delta(), fed with the change events of sitemap_stream. A periodic
+run of compute() replaces all of it with exact degrees, BFS depth from the home
+page and PageRank from power iteration over the id adjacency (numpy when
+installed), and stores the most linked and highest ranked pages in the summary:
+"most linked page" questions are one item read.
+
+The incremental updates are off by default (GRAPH_METRICS_ENABLED), as they cost
+writes on every page: assign_ids() appends the page's new URLs to the urls#N
+dictionary items even with SITEMAP_ENCODING=lists, and every page adds one or more
+conditional updates of metric chunks. The in-degree increments are not idempotent,
+so an SQS redelivery (of the scraper's message or of a stream event) counts its
+links twice; the counts are only exact again after the next compute(), which runs
+whether or not incremental updates are enabled.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+import sitemap_store
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+dynamodb = boto3.resource('dynamodb')
+
+GRAPH_METRICS_ENABLED = os.environ.get('GRAPH_METRICS_ENABLED', 'false').lower() == 'true'
+# 'write': the scraper updates metrics as it stores links, 'stream': sitemap_stream events do
+GRAPH_METRICS_SOURCE = os.environ.get('GRAPH_METRICS_SOURCE', 'write').lower()
+GRAPH_METRICS_CHUNK = int(os.environ.get('GRAPH_METRICS_CHUNK', '4096'))
+PAGERANK_DAMPING = float(os.environ.get('PAGERANK_DAMPING', '0.85'))
+PAGERANK_TOLERANCE = float(os.environ.get('PAGERANK_TOLERANCE', '1e-6'))
+PAGERANK_MAX_ITERATIONS = int(os.environ.get('PAGERANK_MAX_ITERATIONS', '100'))
+METRICS_PART = 'metrics'
+METRIC_NAMES = ('in_degree', 'out_degree', 'depth', 'pagerank')
+# Short value placeholders keep update expressions small
+METRIC_LETTERS = {'in_degree': 'i', 'out_degree': 'o', 'depth': 'd'}
+# Pages per update expression, which DynamoDB limits to 4 KB
+PAGES_PER_UPDATE = 25
+TOP_PAGES = 10
+
+_stats = {'pages': 0, 'updates': 0, 'computed': 0, 'iterations': 0}
+
+
+def metrics_key(domain, chunk=None) -> dict:
+    """The key of the summary item of a domain, or of the item of one chunk of ids"""
+    return sitemap_store.part_key(domain, METRICS_PART if chunk is None else f'{METRICS_PART}#{chunk}')
+
+
+def _table():
+    return dynamodb.Table(sitemap_store.SITEMAP_PARTS_TABLE_NAME)
+
+
+# region write path
+def _update_chunk(domain, chunk, clauses, names, values):
+    """Apply SET clauses to a chunk item, creating it with empty maps first if needed"""
+    key = metrics_key(domain, chunk)
+    for _ in range(2):
+        try:
+            _table().update_item(Key=key, UpdateExpression='SET ' + ', '.join(clauses),
+                                 ConditionExpression='attribute_exists(in_degree)',
+                                 ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+            _stats['updates'] += 1
+            return
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+        try:
+            _table().put_item(Item=dict(key, **{name: {} for name in METRIC_NAMES}),
+                              ConditionExpression='attribute_not_exists(website_domain)')
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+    raise RuntimeError(f'Could not update metrics chunk {chunk} of {domain}')
+
+
+def _update_nodes(domain, changes):
+    """
+    Apply changes {url id: {metric: (op, value)}} with one update per chunk and batch of pages.
+    op is 'set', 'add' (to 0 when missing) or 'first' (only if not set yet).
+    """
+    by_chunk = {}
+    for url_id in sorted(changes):
+        by_chunk.setdefault(url_id // GRAPH_METRICS_CHUNK, []).append(url_id)
+    for chunk, url_ids in by_chunk.items():
+        for start in range(0, len(url_ids), PAGES_PER_UPDATE):
+            names = {}
+            values = {}
+            clauses = []
+            for url_id in url_ids[start:start + PAGES_PER_UPDATE]:
+                name = f'#n{url_id}'
+                names[name] = str(url_id)
+                for metric, (op, value) in changes[url_id].items():
+                    path = f'{metric}.{name}'
+                    placeholder = f':{METRIC_LETTERS[metric]}{url_id}'
+                    values[placeholder] = value
+                    if op == 'add':
+                        values[':zero'] = 0
+                        clauses.append(f'{path} = if_not_exists({path}, :zero) + {placeholder}')
+                    elif op == 'first':
+                        clauses.append(f'{path} = if_not_exists({path}, {placeholder})')
+                    else:
+                        clauses.append(f'{path} = {placeholder}')
+            _update_chunk(domain, chunk, clauses, names, values)
+
+
+def record_page(domain, url, links, depth) -> bool:
+    """Update the metrics of a page whose links were just stored, and of the pages it links to"""
+    if not GRAPH_METRICS_ENABLED or GRAPH_METRICS_SOURCE != 'write':
+        return False
+    dictionary = sitemap_store.assign_ids(domain, [url] + list(links))
+    page_id = dictionary.id(url)
+    link_ids = {dictionary.id(link) for link in links} - {page_id}
+    changes = {link_id: {'in_degree': ('add', 1), 'depth': ('first', depth + 1)} for link_id in link_ids}
+    changes[page_id] = {'out_degree': ('set', len(link_ids)), 'depth': ('first', depth)}
+    _update_nodes(domain, changes)
+    _stats['pages'] += 1
+    return True
+
+
+def apply_delta(domain, edges_added, edges_removed) -> bool:
+    """
+    Update degrees from a sitemap_stream change event ({url: [links]} added and removed),
+    for GRAPH_METRICS_SOURCE=stream. Depths are left to the periodic BFS.
+    """
+    if not GRAPH_METRICS_ENABLED or GRAPH_METRICS_SOURCE != 'stream':
+        return False
+    urls = list(edges_added) + list(edges_removed)
+    for links in list(edges_added.values()) + list(edges_removed.values()):
+        urls.extend(links)
+    dictionary = sitemap_store.assign_ids(domain, urls)
+    in_changes = {}
+    out_changes = {}
+    for edges, sign in ((edges_added, 1), (edges_removed, -1)):
+        for url, links in edges.items():
+            source = dictionary.id(url)
+            targets = {dictionary.id(link) for link in links} - {source}
+            out_changes[source] = out_changes.get(source, 0) + sign * len(targets)
+            for target in targets:
+                in_changes[target] = in_changes.get(target, 0) + sign
+    changes = {}
+    for metric, counts in (('in_degree', in_changes), ('out_degree', out_changes)):
+        for url_id, count in counts.items():
+            if count:
+                changes.setdefault(url_id, {})[metric] = ('add', count)
+    _update_nodes(domain, changes)
+    _stats['pages'] += len(edges_added) + len(edges_removed)
+    return True
+# endregion
+
+
+# region computation
+def pagerank(count, sources, targets, damping=None, tolerance=None, max_iterations=None):
+    """
+    PageRank of count nodes over the edges (sources[i] -> targets[i]) by power iteration.
+    Rank of pages without links is spread over all pages. Returns (ranks summing to 1, iterations).
+    """
+    damping = PAGERANK_DAMPING if damping is None else damping
+    tolerance = PAGERANK_TOLERANCE if tolerance is None else tolerance
+    max_iterations = PAGERANK_MAX_ITERATIONS if max_iterations is None else max_iterations
+    if count == 0:
+        return [], 0
+    if numpy is not None:
+        return _pagerank_numpy(count, sources, targets, damping, tolerance, max_iterations)
+    out_degree = [0] * count
+    for source in sources:
+        out_degree[source] += 1
+    dangling_nodes = [node for node in range(count) if not out_degree[node]]
+    rank = [1.0 / count] * count
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        share = [rank[node] / out_degree[node] if out_degree[node] else 0.0 for node in range(count)]
+        incoming = [0.0] * count
+        for source, target in zip(sources, targets):
+            incoming[target] += share[source]
+        base = (1 - damping + damping * sum(rank[node] for node in dangling_nodes)) / count
+        new_rank = [base + damping * value for value in incoming]
+        delta = sum(abs(new - old) for new, old in zip(new_rank, rank))
+        rank = new_rank
+        if delta < tolerance:
+            break
+    return rank, iterations
+
+
+def _pagerank_numpy(count, sources, targets, damping, tolerance, max_iterations):
+    sources = numpy.asarray(sources, dtype=numpy.int64)
+    targets = numpy.asarray(targets, dtype=numpy.int64)
+    out_degree = numpy.bincount(sources, minlength=count).astype(numpy.float64)
+    dangling = out_degree == 0
+    inverse = numpy.divide(1.0, out_degree, out=numpy.zeros(count), where=~dangling)
+    rank = numpy.full(count, 1.0 / count)
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        incoming = numpy.bincount(targets, weights=(rank * inverse)[sources], minlength=count)
+        new_rank = (1 - damping + damping * rank[dangling].sum()) / count + damping * incoming
+        delta = numpy.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tolerance:
+            break
+    return rank.tolist(), iterations
+
+
+def bfs_depths(count, sources, targets, root) -> list:
+    """Link distance of every node from root, None where it cannot be reached"""
+    adjacency = [[] for _ in range(count)]
+    for source, target in zip(sources, targets):
+        adjacency[source].append(target)
+    depths = [None] * count
+    depths[root] = 0
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        for target in adjacency[node]:
+            if depths[target] is None:
+                depths[target] = depths[node] + 1
+                queue.append(target)
+    return depths
+
+
+def graph_metrics(sitemap, dictionary, root_url=None) -> dict:
+    """Exact metrics of a sitemap by dictionary id: {id: {in_degree, out_degree, depth, pagerank}}"""
+    node_ids = sorted({dictionary.id(url) for url in sitemap}
+                      | {dictionary.id(link) for links in sitemap.values() for link in links})
+    index = {url_id: position for position, url_id in enumerate(node_ids)}
+    sources = []
+    targets = []
+    for url, links in sitemap.items():
+        source = dictionary.id(url)
+        for target in {dictionary.id(link) for link in links} - {source}:
+            sources.append(index[source])
+            targets.append(index[target])
+    count = len(node_ids)
+    in_degree = [0] * count
+    out_degree = [0] * count
+    for source, target in zip(sources, targets):
+        out_degree[source] += 1
+        in_degree[target] += 1
+    ranks, iterations = pagerank(count, sources, targets)
+    _stats['iterations'] += iterations
+    root_id = dictionary.id(root_url) if root_url else None
+    root = index.get(root_id, 0) if count else None
+    depths = bfs_depths(count, sources, targets, root) if count else []
+    return {
+        url_id: {'in_degree': in_degree[i], 'out_degree': out_degree[i], 'depth': depths[i],
+                 # Scaled so the average page has rank 1
+                 'pagerank': ranks[i] * count}
+        for i, url_id in enumerate(node_ids)
+    }
+# endregion
+
+
+# region storage
+def store_metrics(domain, dictionary, metrics, version, edges):
+    """Replace a domain's metric chunks and summary with freshly computed metrics"""
+    chunks = {}
+    for url_id, values in metrics.items():
+        chunk = chunks.setdefault(url_id // GRAPH_METRICS_CHUNK, {name: {} for name in METRIC_NAMES})
+        for name in METRIC_NAMES:
+            if values[name] is not None:
+                value = values[name]
+                chunk[name][str(url_id)] = Decimal(f'{value:.6g}') if isinstance(value, float) else value
+    for chunk, maps in chunks.items():
+        _table().put_item(Item=dict(metrics_key(domain, chunk), **maps))
+
+    def top(name):
+        ranked = sorted(metrics.items(), key=lambda item: -item[1][name])[:TOP_PAGES]
+        return [[dictionary.url(url_id), Decimal(f'{values[name]:.6g}')] for url_id, values in ranked]
+
+    _table().put_item(Item=dict(
+        metrics_key(domain),
+        version=version,
+        nodes=len(metrics),
+        edges=edges,
+        chunks=max(chunks, default=-1) + 1,
+        top_in_degree=top('in_degree'),
+        top_pagerank=top('pagerank'),
+        computed_at=int(time.time()),
+    ))
+
+
+def read_metrics(domain) -> dict:
+    """{'summary': summary item or None, 'nodes': {url: {in_degree, out_degree, depth, pagerank}}}"""
+    summary = _table().get_item(Key=metrics_key(domain)).get('Item')
+    dictionary = sitemap_store.load_dictionary(domain)
+    chunk_count = int(summary['chunks']) if summary else (len(dictionary) - 1) // GRAPH_METRICS_CHUNK + 1
+    nodes = {}
+    for chunk in range(chunk_count):
+        item = _table().get_item(Key=metrics_key(domain, chunk)).get('Item')
+        for name in METRIC_NAMES:
+            for url_id, value in (item or {}).get(name, {}).items():
+                if int(url_id) < len(dictionary):
+                    number = float(value) if name == 'pagerank' else int(value)
+                    nodes.setdefault(dictionary.url(int(url_id)), {})[name] = number
+    return {'summary': summary, 'nodes': nodes}
+
+
+def compute(domain, force=False):
+    """Recompute and store a domain's metrics unless they are at the sitemap's version. Returns the summary."""
+    current = sitemap_store.read_sitemap(domain)
+    if current is None:
+        return None
+    if not force:
+        summary = _table().get_item(Key=metrics_key(domain)).get('Item')
+        if summary and int(summary.get('version', -1)) == current['version']:
+            return summary
+    started = time.time()
+    sitemap = current['sitemap']
+    urls = list(sitemap)
+    for links in sitemap.values():
+        urls.extend(links)
+    dictionary = sitemap_store.assign_ids(domain, urls)
+    metrics = graph_metrics(sitemap, dictionary, root_url=f'https://{domain}')
+    edges = sum(values['out_degree'] for values in metrics.values())
+    store_metrics(domain, dictionary, metrics, current['version'], edges)
+    _stats['computed'] += 1
+    print(f'Metrics of {domain} v{current["version"]}: {len(metrics)} nodes, {edges} edges '
+          f'in {time.time() - started:.2f}s')
+    return _table().get_item(Key=metrics_key(domain)).get('Item')
+# endregion
+
+
+def list_domains():
+    """Domains with a sitemap: the head items of the sitemap table"""
+    params = {'ProjectionExpression': 'website_domain'}
+    while True:
+        response = dynamodb.Table(sitemap_store.SITEMAP_TABLE_NAME).scan(**params)
+        for item in response.get('Items', []):
+            yield item['website_domain']
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def lambda_handler(event, context):
+    """
+    Periodic recomputation: {"website_domain": ...} for one domain, otherwise every domain
+    whose sitemap changed since its metrics were computed. An SQS batch of sitemap_stream
+    events is applied as degree changes instead.
+    """
+    try:
+        if 'Records' in event:
+            applied = 0
+            for record in event['Records']:
+                change = json.loads(record['body'])
+                data = change.get('data', {})
+                if apply_delta(change['website_domain'], data.get('edges_added', {}), data.get('edges_removed', {})):
+                    applied += 1
+            return {'statusCode': 200, 'body': json.dumps({'applied': applied})}
+        domains = [event['website_domain']] if event.get('website_domain') else list_domains()
+        computed = {}
+        for domain in domains:
+            summary = compute(domain, bool(event.get('force')))
+            computed[domain] = int(summary['version']) if summary else None
+            if context and context.get_remaining_time_in_millis() < 30000:
+                print('Stopping metrics run before the Lambda timeout')
+                break
+        return {'statusCode': 200, 'body': json.dumps(computed)}
+    except Exception as e:
+        print(f'Error computing graph metrics: {e}')
+        return {'statusCode': 500, 'body': json.dumps(f'Error computing graph metrics: {str(e)}')}
+
+
+def get_stats() -> dict:
+    return dict(_stats, numpy=numpy is not None)
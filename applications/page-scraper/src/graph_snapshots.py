@@ -0,0 +1,300 @@
+"""
+Precomputed level-of-detail snapshots of a domain's link graph for the 3D dashboard.
+Instead of pulling the raw sitemap and laying it out in the browser, the dashboard
+fetches ready to render graph files from S3 (or CloudFront in front of it):
+    snapshots/<domain>/manifest.json
+    snapshots/<domain>/v<sitemap version>/level<N>.json.gz
+Coarse levels cluster pages by path prefix (/work, /work/2019, ...); every level
+is a finer split of the one before and the last one holds every page; cluster levels
+keep only their strongest links (weighted by the page links they merge). Nodes carry
+their degree and an initial position, so the force layout starts close to
+settled, and a cluster and its pages share a neighbourhood: positions come from
+the path tree, every child placed on a sphere around its parent.
+
+The first level has at most MAX_NODES_PER_WEBSITE nodes. With
+ENABLE_PROGRESSIVE_LOADING the finer levels follow in the manifest, for the
+dashboard to load one after another; without it only that first level is written.
+Level files are immutable (versioned keys), the manifest is short lived.
+
+Nodes and links use the 3d-force-graph shape:
+    {"nodes": [{"id", "name", "group", "val", "degree", "x", "y", "z", "rank", "link_depth"}],
+     "links": [{"source", "target", "value"}]}
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import time
+from urllib.parse import urlparse
+
+import boto3
+
+import graph_metrics
+import sitemap_store
+
+s3 = boto3.client('s3')
+
+SNAPSHOT_BUCKET = os.environ.get('SNAPSHOT_BUCKET', 'artist-scraped-data')
+SNAPSHOT_PREFIX = os.environ.get('SNAPSHOT_PREFIX', 'snapshots')
+MAX_NODES_PER_WEBSITE = int(os.environ.get('MAX_NODES_PER_WEBSITE', '500'))
+ENABLE_PROGRESSIVE_LOADING = os.environ.get('ENABLE_PROGRESSIVE_LOADING', 'true').lower() == 'true'
+# A finer level is only written when it has at least this many times the nodes of the level before
+SNAPSHOT_LEVEL_GROWTH = float(os.environ.get('SNAPSHOT_LEVEL_GROWTH', '2'))
+# Cluster levels keep only their strongest links, this many per node; the level of single pages keeps all
+SNAPSHOT_LINKS_PER_NODE = int(os.environ.get('SNAPSHOT_LINKS_PER_NODE', '10'))
+# Distance of the first path segments from the center; deeper segments are placed closer to their parent
+SNAPSHOT_SPREAD = float(os.environ.get('SNAPSHOT_SPREAD', '400'))
+LEVEL_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_CACHE_CONTROL = 'public, max-age=30'
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+FULL = None
+
+_stats = {'snapshots': 0, 'skipped': 0, 'levels': 0, 'bytes': 0}
+
+
+def path_segments(url) -> tuple:
+    return tuple(segment for segment in urlparse(url).path.split('/') if segment)
+
+
+def graph_edges(sitemap):
+    """(sorted node URLs, sorted distinct (source, target) edges) of a sitemap; link targets are nodes too"""
+    nodes = set(sitemap)
+    edges = set()
+    for url, links in sitemap.items():
+        for link in links:
+            nodes.add(link)
+            if link != url:
+                edges.add((url, link))
+    return sorted(nodes), sorted(edges)
+
+
+# region layout
+def _sphere_point(index, count):
+    """Point index of count spread evenly over the unit sphere (Fibonacci lattice)"""
+    y = 1 - 2 * (index + 0.5) / count
+    radius = math.sqrt(max(0.0, 1 - y * y))
+    theta = GOLDEN_ANGLE * index
+    return math.cos(theta) * radius, y, math.sin(theta) * radius
+
+
+def path_positions(paths) -> dict:
+    """Position of every path prefix: the children of a prefix on a sphere around it"""
+    children = {}
+    for path in paths:
+        for depth in range(len(path)):
+            children.setdefault(path[:depth], set()).add(path[:depth + 1])
+    positions = {(): (0.0, 0.0, 0.0)}
+    pending = [()]
+    while pending:
+        parent = pending.pop()
+        siblings = sorted(children.get(parent, ()))
+        if not siblings:
+            continue
+        px, py, pz = positions[parent]
+        # Crowded branches get more room, deeper ones less
+        radius = SNAPSHOT_SPREAD / (len(parent) + 1) * max(1.0, len(siblings) ** (1 / 3) / 2)
+        for index, child in enumerate(siblings):
+            x, y, z = _sphere_point(index, len(siblings))
+            positions[child] = (px + x * radius, py + y * radius, pz + z * radius)
+            pending.append(child)
+    return positions
+
+
+def _jitter(url):
+    """Small stable offset that separates URLs with the same path (http and https, case variants)"""
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=3).digest()
+    return tuple((byte - 127.5) / 127.5 for byte in digest)
+# endregion
+
+
+# region levels
+def cluster_id(segments, depth) -> str:
+    return '/' + '/'.join(segments[:depth])
+
+
+def choose_depths(paths, max_nodes=None, progressive=None) -> list:
+    """
+    Prefix depths of the levels to write, FULL for the level of single pages. The first is the
+    finest one with at most max_nodes nodes; progressive levels follow as they grow enough.
+    """
+    max_nodes = MAX_NODES_PER_WEBSITE if max_nodes is None else max_nodes
+    progressive = ENABLE_PROGRESSIVE_LOADING if progressive is None else progressive
+    deepest = max((len(path) for path in paths), default=0)
+    counts = [(depth, len({path[:depth] for path in paths})) for depth in range(deepest + 1)]
+    counts.append((FULL, len(paths)))
+    fitting = [entry for entry in counts if entry[1] <= max_nodes] or counts[:1]
+    depths = [fitting[-1]]
+    if progressive:
+        for depth, count in counts[counts.index(fitting[-1]) + 1:]:
+            if count >= depths[-1][1] * SNAPSHOT_LEVEL_GROWTH or depth is FULL:
+                if depth is FULL and count == depths[-1][1] and depths[-1][0] is not FULL:
+                    depths.pop()
+                depths.append((depth, count))
+    return [depth for depth, _ in depths]
+
+
+def build_level(nodes, edges, paths, positions, depth, metrics=None) -> dict:
+    """
+    One level: pages merged into their path prefix of the given depth (every page for FULL).
+    With graph_metrics per URL, nodes get their PageRank (summed over a cluster) and link depth
+    (the smallest of a cluster).
+    """
+    cluster_of = {}
+    members = {}
+    for url in nodes:
+        cluster = url if depth is FULL else cluster_id(paths[url], depth)
+        cluster_of[url] = cluster
+        members.setdefault(cluster, []).append(url)
+
+    weights = {}
+    degree = dict.fromkeys(members, 0)
+    for source, target in edges:
+        pair = (cluster_of[source], cluster_of[target])
+        if pair[0] == pair[1]:
+            continue
+        weights[pair] = weights.get(pair, 0) + 1
+        degree[pair[0]] += 1
+        degree[pair[1]] += 1
+
+    level_nodes = []
+    for cluster, urls in members.items():
+        first = urls[0]
+        if depth is FULL:
+            dx, dy, dz = _jitter(first)
+            x, y, z = positions[paths[first]]
+            position = (x + dx, y + dy, z + dz)
+            name = first
+        else:
+            prefix = paths[first][:depth]
+            position = positions[prefix]
+            name = cluster
+        level_nodes.append({
+            'id': cluster,
+            'name': name,
+            'group': paths[first][0] if paths[first] else '',
+            'val': len(urls),
+            'degree': degree[cluster],
+            'x': round(position[0], 1),
+            'y': round(position[1], 1),
+            'z': round(position[2], 1),
+        })
+        known = [metrics[url] for url in urls if url in metrics] if metrics else []
+        if known:
+            level_nodes[-1]['rank'] = round(sum(values.get('pagerank', 0) for values in known), 3)
+            depths = [values['depth'] for values in known if values.get('depth') is not None]
+            if depths:
+                level_nodes[-1]['link_depth'] = min(depths)
+    pairs = sorted(weights.items())
+    if depth is not FULL and len(pairs) > len(members) * SNAPSHOT_LINKS_PER_NODE:
+        strongest = sorted(pairs, key=lambda pair: -pair[1])[:len(members) * SNAPSHOT_LINKS_PER_NODE]
+        pairs = sorted(strongest)
+    links = [{'source': source, 'target': target, 'value': weight} for (source, target), weight in pairs]
+    return {'depth': depth, 'nodes': level_nodes, 'links': links}
+
+
+def build_snapshots(sitemap, max_nodes=None, progressive=None, metrics=None) -> list:
+    """The levels of detail of a sitemap ({url: [internal links]}), coarsest first"""
+    nodes, edges = graph_edges(sitemap)
+    paths = {url: path_segments(url) for url in nodes}
+    positions = path_positions(set(paths.values()))
+    return [build_level(nodes, edges, paths, positions, depth, metrics)
+            for depth in choose_depths(list(paths.values()), max_nodes, progressive)]
+# endregion
+
+
+# region publishing
+def manifest_key(domain) -> str:
+    return f'{SNAPSHOT_PREFIX}/{domain}/manifest.json'
+
+
+def level_key(domain, version, index) -> str:
+    return f'{SNAPSHOT_PREFIX}/{domain}/v{version}/level{index}.json.gz'
+
+
+def load_manifest(domain):
+    try:
+        return json.load(s3.get_object(Bucket=SNAPSHOT_BUCKET, Key=manifest_key(domain))['Body'])
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def publish(domain, version, levels) -> dict:
+    """Write the level files, then the manifest that points at them. Returns the manifest."""
+    entries = []
+    for index, level in enumerate(levels):
+        key = level_key(domain, version, index)
+        body = gzip.compress(json.dumps({'nodes': level['nodes'], 'links': level['links']},
+                                        separators=(',', ':'), ensure_ascii=False).encode('utf-8'), mtime=0)
+        s3.put_object(Bucket=SNAPSHOT_BUCKET, Key=key, Body=body, ContentType='application/json',
+                      ContentEncoding='gzip', CacheControl=LEVEL_CACHE_CONTROL)
+        entries.append({'level': index, 'depth': level['depth'], 'nodes': len(level['nodes']),
+                        'links': len(level['links']), 'key': key, 'bytes': len(body)})
+        _stats['levels'] += 1
+        _stats['bytes'] += len(body)
+    manifest = {
+        'website_domain': domain,
+        'version': version,
+        'generated_at': int(time.time()),
+        'max_nodes': MAX_NODES_PER_WEBSITE,
+        'progressive': ENABLE_PROGRESSIVE_LOADING,
+        'levels': entries,
+    }
+    s3.put_object(Bucket=SNAPSHOT_BUCKET, Key=manifest_key(domain), ContentType='application/json',
+                  CacheControl=MANIFEST_CACHE_CONTROL,
+                  Body=json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+    return manifest
+
+
+def snapshot_domain(domain, force=False):
+    """Rebuild a domain's snapshots unless the manifest is already at the sitemap's version"""
+    current = sitemap_store.read_sitemap(domain)
+    if current is None:
+        print(f'No sitemap for {domain}, no snapshot written')
+        return None
+    manifest = None if force else load_manifest(domain)
+    if manifest and manifest.get('version') == current['version']:
+        _stats['skipped'] += 1
+        return manifest
+    started = time.time()
+    try:
+        metrics = graph_metrics.read_metrics(domain)['nodes']
+    except Exception as e:
+        print(f'Error reading graph metrics of {domain}, snapshot without them: {e}')
+        metrics = None
+    levels = build_snapshots(current['sitemap'], metrics=metrics)
+    manifest = publish(domain, current['version'], levels)
+    _stats['snapshots'] += 1
+    print(f'Snapshot of {domain} v{current["version"]}: '
+          f'{", ".join(str(entry["nodes"]) for entry in manifest["levels"])} nodes in {time.time() - started:.2f}s')
+    return manifest
+# endregion
+
+
+def lambda_handler(event, context):
+    """
+    Rebuild snapshots for {"website_domain": ..., "force": false}, or for the domains of an
+    SQS batch of such messages (each domain once per batch)
+    """
+    try:
+        if 'Records' in event:
+            requests = [json.loads(record['body']) for record in event['Records']]
+        else:
+            requests = [event]
+        domains = {}
+        for request in requests:
+            if request.get('website_domain'):
+                domains[request['website_domain']] = domains.get(request['website_domain']) or bool(request.get('force'))
+        manifests = {domain: snapshot_domain(domain, force) for domain, force in domains.items()}
+        return {
+            'statusCode': 200,
+            'body': json.dumps({domain: manifest and manifest['version'] for domain, manifest in manifests.items()})
+        }
+    except Exception as e:
+        print(f'Error building snapshots: {e}')
+        return {'statusCode': 500, 'body': json.dumps(f'Error building snapshots: {str(e)}')}
+
+
+def get_stats() -> dict:
+    return dict(_stats)
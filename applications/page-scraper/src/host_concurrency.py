@@ -0,0 +1,171 @@
+"""
+Adaptive per-host concurrency control.
+Each host gets an in-flight limit that grows additively while responses stay fast
+and healthy, and is halved when the host errors or slows down (AIMD). The limit and
+in-flight count live in DynamoDB so every Lambda instance works against the same budget.
+"""
+
+import os
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+dynamodb = boto3.resource('dynamodb')
+
+HOST_CONCURRENCY_INITIAL = float(os.environ.get('HOST_CONCURRENCY_INITIAL', '4'))
+HOST_CONCURRENCY_MIN = float(os.environ.get('HOST_CONCURRENCY_MIN', '1'))
+HOST_CONCURRENCY_MAX = float(os.environ.get('HOST_CONCURRENCY_MAX', '32'))
+# A response slower than this multiple of the host's average latency counts as a slowdown
+HOST_SLOWDOWN_FACTOR = float(os.environ.get('HOST_SLOWDOWN_FACTOR', '2.0'))
+HOST_DECREASE_FACTOR = float(os.environ.get('HOST_DECREASE_FACTOR', '0.5'))
+# Slots not released within this window (crashed or timed out invocations) are reclaimed
+HOST_SLOT_LEASE_SECONDS = int(os.environ.get('HOST_SLOT_LEASE_SECONDS', '900'))
+LATENCY_EWMA_WEIGHT = 0.2
+
+# Per host state from the last acquire and the fetch observations made since
+_acquired = {}
+_observations = {}
+
+
+def _state_table():
+    table_name = os.environ.get('CRAWL_STATE_TABLE_NAME', 'scraper-crawl-state')
+    return dynamodb.Table(table_name)
+
+
+def _state_key(host):
+    return f'concurrency#{host}'
+
+
+def _decimal(value):
+    return Decimal(str(round(value, 3)))
+
+
+def acquire(host) -> bool:
+    """
+    Take an in-flight slot for the host. Returns False when the host is at its limit.
+    Fails open if the state table is unavailable.
+    """
+    now = int(time.time())
+    table = _state_table()
+    try:
+        response = table.update_item(
+            Key={'state_key': _state_key(host)},
+            UpdateExpression='SET in_flight = if_not_exists(in_flight, :zero) + :one, '
+                             'concurrency_limit = if_not_exists(concurrency_limit, :initial), '
+                             'last_acquired = :now',
+            ConditionExpression='attribute_not_exists(in_flight) OR in_flight < concurrency_limit',
+            ExpressionAttributeValues={
+                ':zero': 0, ':one': 1, ':now': now,
+                ':initial': _decimal(HOST_CONCURRENCY_INITIAL),
+            },
+            ReturnValues='ALL_NEW'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f'Error acquiring slot for {host}: {e}')
+            return True
+        try:
+            # The host looks full, but if nothing has moved for a whole lease window the
+            # counter only holds slots leaked by crashed invocations
+            response = table.update_item(
+                Key={'state_key': _state_key(host)},
+                UpdateExpression='SET in_flight = :one, last_acquired = :now',
+                ConditionExpression='last_acquired < :stale AND '
+                                    '(attribute_not_exists(last_released) OR last_released < :stale)',
+                ExpressionAttributeValues={':one': 1, ':now': now,
+                                           ':stale': now - HOST_SLOT_LEASE_SECONDS},
+                ReturnValues='ALL_NEW'
+            )
+            print(f'Reclaimed stale in-flight slots for {host}')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f'Error reclaiming slots for {host}: {e}')
+                return True
+            return False
+    except Exception as e:
+        print(f'Error acquiring slot for {host}: {e}')
+        return True
+
+    _acquired[host] = response['Attributes']
+    return True
+
+
+def holds(host) -> bool:
+    """Whether this invocation holds a slot of the host taken by acquire"""
+    return host in _acquired
+
+
+def observe(host, latency_seconds, ok: bool):
+    """Record the outcome of one fetch against the host, called from the fetch layer"""
+    _observations.setdefault(host, []).append((latency_seconds, ok))
+
+
+def _next_state(state, observations):
+    limit = float(state.get('concurrency_limit', HOST_CONCURRENCY_INITIAL))
+    latency = float(state.get('latency_ms', 0))
+    error_rate = float(state.get('error_rate', 0))
+
+    for latency_seconds, ok in observations:
+        slowdown = False
+        if latency_seconds is not None:
+            latency_ms = latency_seconds * 1000
+            slowdown = latency > 0 and latency_ms > latency * HOST_SLOWDOWN_FACTOR
+            latency = latency_ms if latency == 0 else (
+                (1 - LATENCY_EWMA_WEIGHT) * latency + LATENCY_EWMA_WEIGHT * latency_ms)
+        error_rate = (1 - LATENCY_EWMA_WEIGHT) * error_rate + LATENCY_EWMA_WEIGHT * (0 if ok else 1)
+
+        if not ok or slowdown:
+            limit = max(HOST_CONCURRENCY_MIN, limit * HOST_DECREASE_FACTOR)
+        else:
+            limit = min(HOST_CONCURRENCY_MAX, limit + 1 / limit)
+
+    return {'concurrency_limit': limit, 'latency_ms': latency, 'error_rate': error_rate}
+
+
+def release(host):
+    """
+    Give back the slot taken by acquire and fold this invocation's fetch outcomes into the host's limit.
+    Concurrent releases may overwrite each other's estimate, which only delays adaptation by a step.
+    """
+    state = _acquired.pop(host, None)
+    observations = _observations.pop(host, [])
+    if state is None:
+        return None
+
+    new_state = _next_state(state, observations)
+    try:
+        _state_table().update_item(
+            Key={'state_key': _state_key(host)},
+            UpdateExpression='SET in_flight = in_flight - :one, concurrency_limit = :limit, '
+                             'latency_ms = :latency, error_rate = :error_rate, last_released = :now',
+            ConditionExpression='in_flight > :zero',
+            ExpressionAttributeValues={
+                ':one': 1, ':zero': 0, ':now': int(time.time()),
+                ':limit': _decimal(new_state['concurrency_limit']),
+                ':latency': _decimal(new_state['latency_ms']),
+                ':error_rate': _decimal(new_state['error_rate']),
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f'Error releasing slot for {host}: {e}')
+    except Exception as e:
+        print(f'Error releasing slot for {host}: {e}')
+
+    new_state['in_flight'] = int(state.get('in_flight', 1)) - 1
+    return new_state
+
+
+def get_stats(host, state=None) -> dict:
+    """Return the host's controller state in a form suitable for logging"""
+    if state is None:
+        state = _acquired.get(host, {})
+    return {
+        'host': host,
+        'concurrency_limit': round(float(state.get('concurrency_limit', HOST_CONCURRENCY_INITIAL)), 2),
+        'in_flight': int(state.get('in_flight', 0)),
+        'latency_ms': round(float(state.get('latency_ms', 0)), 1),
+        'error_rate': round(float(state.get('error_rate', 0)), 3),
+    }
@@ -0,0 +1,330 @@
+"""
+Image metadata pipeline.
+Image URLs are taken from <img> and <picture><source> tags, preferring lazy-load
+attributes and the largest srcset candidate over placeholder src values. Each image
+is probed with a range request for its first IMAGE_PROBE_BYTES, which is enough to
+read the format and dimensions from the file header (PNG, GIF, JPEG, WebP). Images
+smaller than MIN_IMG_DIMENSIONS are dropped, duplicates are dropped by URL and by
+content fingerprint, and only the survivors are downloaded in full, when
+IMAGE_BUCKET is set to store them.
+
+Off by default (IMAGES_ENABLED): every page then costs up to IMAGE_MAX_PER_PAGE extra
+requests. They run on a bounded thread pool with one request at a time per image host,
+inside that host's host_concurrency slot (the page's own slot when the images are on
+its host, otherwise one taken for them; a busy host's images are skipped), and their
+outcomes feed the host's concurrency limit. Probes use a plain session without the
+fetcher's retries: a failed probe only drops an image.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import boto3
+import requests
+
+import host_concurrency
+import link_resolver
+import retry_policy
+
+s3 = boto3.client('s3')
+
+IMAGES_ENABLED = os.environ.get('IMAGES_ENABLED', 'false').lower() == 'true'
+MIN_IMG_DIMENSIONS = {
+    'width': int(os.environ.get('IMAGE_MIN_WIDTH', '64')),
+    'height': int(os.environ.get('IMAGE_MIN_HEIGHT', '64')),
+}
+IMAGE_MAX_PER_PAGE = int(os.environ.get('IMAGE_MAX_PER_PAGE', '50'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '8'))
+IMAGE_PROBE_BYTES = int(os.environ.get('IMAGE_PROBE_BYTES', '16384'))
+# JPEGs with large EXIF blocks put their frame header further in; one wider probe is made for those
+IMAGE_PROBE_MAX_BYTES = int(os.environ.get('IMAGE_PROBE_MAX_BYTES', '131072'))
+IMAGE_PROBE_TIMEOUT = (
+    float(os.environ.get('IMAGE_CONNECT_TIMEOUT', '3')),
+    float(os.environ.get('IMAGE_READ_TIMEOUT', '5')),
+)
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+# Bucket full images are stored in under images/<domain>/<sha256>.<format>; unset probes only
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET', '')
+
+# Attributes holding the real image of lazy-loaded <img> tags, in order of preference
+LAZY_SRCSET_ATTRIBUTES = ('data-srcset', 'data-lazy-srcset', 'srcset')
+LAZY_SRC_ATTRIBUTES = ('data-src', 'data-lazy-src', 'data-original', 'data-lazy', 'src')
+CONTENT_TYPE_FORMATS = {'image/svg+xml': 'svg', 'image/avif': 'avif', 'image/x-icon': 'ico',
+                        'image/vnd.microsoft.icon': 'ico', 'image/bmp': 'bmp', 'image/tiff': 'tiff'}
+# JPEG start of frame markers, the ones carrying the dimensions
+JPEG_SOF_MARKERS = frozenset([0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF])
+
+# Best effort requests: no retries or backoff on top of the page fetch
+probe_session = requests.Session()
+
+_lock = threading.Lock()
+_stats = {'candidates': 0, 'probed': 0, 'probe_failures': 0, 'too_small': 0, 'duplicates': 0,
+          'downloaded': 0, 'download_failures': 0, 'probe_bytes': 0, 'host_busy': 0}
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+# region candidates
+def parse_srcset(srcset):
+    """Return the URL of the largest candidate of a srcset, by width or density descriptor"""
+    best, best_size = None, -1.0
+    for candidate in srcset.split(','):
+        parts = candidate.split()
+        if not parts:
+            continue
+        size = 1.0
+        if len(parts) > 1 and parts[1][-1:] in ('w', 'x'):
+            try:
+                size = float(parts[1][:-1])
+            except ValueError:
+                pass
+        if size > best_size:
+            best, best_size = parts[0], size
+    return best
+
+
+def _image_source(name, attrs):
+    # <source> also appears in <video> and <audio> with src; only picture sources use srcset
+    attributes = LAZY_SRCSET_ATTRIBUTES if name == 'source' else LAZY_SRCSET_ATTRIBUTES + LAZY_SRC_ATTRIBUTES
+    for attribute in attributes:
+        value = (attrs.get(attribute) or '').strip()
+        if not value:
+            continue
+        if attribute.endswith('srcset'):
+            value = parse_srcset(value)
+        if value and not value.startswith('data:'):
+            return value
+    return None
+
+
+def image_candidates(page_url, base_href, tags) -> list:
+    """
+    Absolute, deduplicated image URLs of a page in document order, from (tag name, attributes)
+    pairs of its <img> and <source> tags. Relative URLs resolve like links (see link_resolver).
+    """
+    resolver = link_resolver.LinkResolver(page_url, base_href)
+    candidates = []
+    seen = set()
+    for name, attrs in tags:
+        source = _image_source(name, attrs)
+        resolved = resolver.resolve(source) if source else None
+        if resolved is None or not resolved[0].startswith(('http://', 'https://')):
+            continue
+        if resolved[0] not in seen:
+            seen.add(resolved[0])
+            candidates.append(resolved[0])
+    return candidates
+# endregion
+
+
+# region header probing
+def _jpeg_size(data):
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        offset += 2 + struct.unpack('>H', data[offset + 2:offset + 4])[0]
+    return None
+
+
+def image_header(data):
+    """Return (format, width, height) read from the first bytes of an image; sizes are None if not found"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n') and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            b0, b1, b2, b3 = data[21:25]
+            return 'webp', 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+        if chunk == b'VP8X':
+            return ('webp', 1 + int.from_bytes(data[24:27], 'little'), 1 + int.from_bytes(data[27:30], 'little'))
+        return 'webp', None, None
+    if data[:2] == b'\xff\xd8':
+        size = _jpeg_size(data)
+        return ('jpeg',) + (size or (None, None))
+    return None, None, None
+
+
+def _read_range(session, url, size):
+    """First size bytes of url and its total length; servers ignoring Range are cut off after size bytes"""
+    response = session.get(url, headers={'Range': f'bytes=0-{size - 1}'}, stream=True,
+                           timeout=IMAGE_PROBE_TIMEOUT)
+    try:
+        response.raise_for_status()
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=8192):
+            data += chunk
+            if len(data) >= size:
+                break
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if not total.isdigit():
+            total = response.headers.get('Content-Length', '')
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        return bytes(data[:size]), int(total) if total.isdigit() else None, content_type
+    finally:
+        response.close()
+
+
+def probe_image(session, url):
+    """Probe one image. Returns its metadata dict or None if it could not be read."""
+    host = urlparse(url).netloc
+    started = time.monotonic()
+    try:
+        data, total, content_type = _read_range(session, url, IMAGE_PROBE_BYTES)
+        image_format, width, height = image_header(data)
+        if image_format == 'jpeg' and width is None and len(data) < (total or 0) \
+                and IMAGE_PROBE_MAX_BYTES > IMAGE_PROBE_BYTES:
+            data, total, content_type = _read_range(session, url, IMAGE_PROBE_MAX_BYTES)
+            image_format, width, height = image_header(data)
+    except Exception as e:
+        _count('probe_failures')
+        if retry_policy.counts_against_host(e):
+            host_concurrency.observe(host, None, False)
+        print(f'Error probing image {url}: {e}')
+        return None
+    host_concurrency.observe(host, time.monotonic() - started, True)
+    _count('probed')
+    _count('probe_bytes', len(data))
+    if image_format is None:
+        image_format = CONTENT_TYPE_FORMATS.get(content_type)
+        if image_format is None:
+            # Neither a known header nor an image content type, e.g. an HTML error page
+            return None
+    # Same leading bytes and the same size: the same image served under another URL
+    fingerprint = hashlib.sha256(data + str(total).encode('ascii')).hexdigest()
+    return {'url': url, 'format': image_format, 'width': width, 'height': height, 'bytes': total,
+            'fingerprint': fingerprint}
+# endregion
+
+
+def large_enough(image) -> bool:
+    """Images whose dimensions could not be read (SVG, unknown formats) are kept"""
+    if image['width'] is None or image['height'] is None:
+        return True
+    return image['width'] >= MIN_IMG_DIMENSIONS['width'] and image['height'] >= MIN_IMG_DIMENSIONS['height']
+
+
+def store_image(session, image, domain):
+    """Download a surviving image in full and store it content addressed in IMAGE_BUCKET"""
+    try:
+        with session.get(image['url'], timeout=IMAGE_PROBE_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            content = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                content += chunk
+                if len(content) > IMAGE_MAX_BYTES:
+                    print(f'Image {image["url"]} is larger than {IMAGE_MAX_BYTES} bytes, not stored')
+                    return None
+        content = bytes(content)
+        digest = hashlib.sha256(content).hexdigest()
+        key = f'images/{domain}/{digest}.{image["format"]}'
+        s3.put_object(Bucket=IMAGE_BUCKET, Key=key, Body=content,
+                      ContentType=response.headers.get('Content-Type', 'application/octet-stream'))
+        _count('downloaded')
+        return digest, key
+    except Exception as e:
+        _count('download_failures')
+        print(f'Error storing image {image["url"]}: {e}')
+        return None
+
+
+def _per_host(urls, work, executor) -> dict:
+    """
+    {url: work(url)} with one request at a time per host, inside the host's concurrency
+    slot. The URLs of a host whose slot cannot be taken are left out.
+    """
+    by_host = {}
+    for url in urls:
+        by_host.setdefault(urlparse(url).netloc, []).append(url)
+    results = {}
+
+    def run(host, host_urls):
+        # The page's own host is already held by the scraper
+        owned = not host_concurrency.holds(host)
+        if owned and not host_concurrency.acquire(host):
+            _count('host_busy', len(host_urls))
+            return
+        try:
+            for url in host_urls:
+                results[url] = work(url)
+        finally:
+            if owned:
+                host_concurrency.release(host)
+
+    list(executor.map(lambda item: run(*item), by_host.items()))
+    return results
+
+
+def process_images(candidates, session, domain) -> list:
+    """
+    Probe, filter and deduplicate a page's image candidates, storing the survivors when
+    IMAGE_BUCKET is set. Returns the metadata of the kept images in candidate order.
+    """
+    candidates = candidates[:IMAGE_MAX_PER_PAGE]
+    _count('candidates', len(candidates))
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=min(IMAGE_WORKERS, len(candidates))) as executor:
+        probes = _per_host(candidates, lambda url: probe_image(session, url), executor)
+        probed = [probes.get(url) for url in candidates]
+
+        kept = []
+        fingerprints = set()
+        for image in probed:
+            if image is None:
+                continue
+            if not large_enough(image):
+                _count('too_small')
+                continue
+            if image['fingerprint'] in fingerprints:
+                _count('duplicates')
+                continue
+            fingerprints.add(image['fingerprint'])
+            kept.append(image)
+
+        if IMAGE_BUCKET:
+            by_url = {image['url']: image for image in kept}
+            downloads = _per_host(list(by_url), lambda url: store_image(session, by_url[url], domain), executor)
+            stored = [downloads.get(image['url']) for image in kept]
+            hashes = set()
+            deduplicated = []
+            for image, result in zip(kept, stored):
+                if result is not None:
+                    if result[0] in hashes:
+                        _count('duplicates')
+                        continue
+                    hashes.add(result[0])
+                    image['sha256'], image['s3_key'] = result
+                deduplicated.append(image)
+            kept = deduplicated
+    return kept
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_stats)
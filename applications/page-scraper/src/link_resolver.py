@@ -0,0 +1,121 @@
+"""
+Batch resolution and classification of the links found on a page.
+The page URL (or its <base href>) is parsed once, every href is resolved to an
+absolute, canonical URL, and links are grouped as internal or external with
+duplicates merged. Anchor text and rel values are kept per link as cheap extras.
+"""
+
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+# Schemes whose URLs have no host to canonicalize, kept as written
+OPAQUE_SCHEMES = ('mailto:', 'tel:', 'sms:', 'callto:')
+IGNORED_SCHEMES = ('javascript:', 'data:', 'about:', 'blob:')
+
+
+def canonical_host(netloc: str, scheme: str) -> str:
+    """Lowercase host and drop the scheme's default port"""
+    netloc = netloc.lower()
+    host, _, port = netloc.rpartition(':')
+    if host and port == DEFAULT_PORTS.get(scheme) and not netloc.endswith(']'):
+        return host
+    return netloc
+
+
+class LinkResolver:
+    def __init__(self, page_url: str, base_href: str = None):
+        self.page_url = page_url
+        page = urlsplit(page_url)
+        self.page_host = canonical_host(page.netloc, page.scheme.lower())
+        # <base href> changes what relative links resolve against, not which site the page is on
+        self.base_url = urljoin(page_url, base_href.strip()) if base_href else page_url
+        base = urlsplit(self.base_url)
+        self.base_scheme = base.scheme.lower()
+        # Prefix for root-relative hrefs and directory for path-relative ones, when the fast path applies
+        self.origin = None
+        if self.base_scheme in DEFAULT_PORTS:
+            self.origin = f'{self.base_scheme}://{canonical_host(base.netloc, self.base_scheme)}'
+            self.base_is_internal = canonical_host(base.netloc, self.base_scheme) == self.page_host
+            self.base_directory = (base.path or '/').rpartition('/')[0] + '/'
+        self._cache = {}
+
+    def resolve(self, href: str):
+        """
+        Return (canonical absolute URL, 'internal' or 'external') for an href,
+        or None for hrefs that do not point anywhere (fragments, javascript:).
+        """
+        if href in self._cache:
+            return self._cache[href]
+        result = self._resolve(href)
+        self._cache[href] = result
+        return result
+
+    def _resolve(self, href):
+        href = href.strip()
+        if not href or href.startswith('#'):
+            return None
+        lowered = href[:11].lower()
+        if lowered.startswith(IGNORED_SCHEMES):
+            return None
+        if lowered.startswith(OPAQUE_SCHEMES):
+            return href, 'external'
+
+        fast = self._resolve_relative(href)
+        if fast is not None:
+            return fast
+        absolute = href if lowered.startswith(('http://', 'https://')) else urljoin(self.base_url, href)
+        parts = urlsplit(absolute)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            return absolute, 'external'
+        host = canonical_host(parts.netloc, scheme)
+        canonical = urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+        return canonical, 'internal' if host == self.page_host else 'external'
+
+    def _resolve_relative(self, href):
+        """
+        String-only resolution of the common relative forms ('/about', 'work/2.html?p=1'),
+        or None when the href needs the general urljoin path (schemes, dot segments, queries
+        or fragments on their own, empty segments, characters urlsplit would strip).
+        """
+        if self.origin is None or href[0] in '?#' or href.startswith('//') or not href.isprintable():
+            return None
+        path = href.split('#', 1)[0]
+        path_only = path.split('?', 1)[0]
+        if ':' in path_only.split('/', 1)[0] or '/.' in '/' + path_only or '//' in path_only:
+            return None
+        if len(path) == len(path_only) + 1:
+            # An empty query is dropped, as urlunsplit does
+            path = path_only
+        if href[0] == '/':
+            return self.origin + path, 'internal' if self.base_is_internal else 'external'
+        return self.origin + self.base_directory + path, 'internal' if self.base_is_internal else 'external'
+
+
+def resolve_links(page_url, anchors, base_href=None) -> dict:
+    """
+    Resolve (href, text, rel) anchors in one batch.
+    Returns {'internal': {url: [extras]}, 'external': {url: [extras]}} in first-seen order,
+    where extras are the distinct {'text', 'rel'} combinations the URL was linked with.
+    """
+    resolver = LinkResolver(page_url, base_href)
+    links = {'internal': {}, 'external': {}}
+    seen_extras = set()
+    for href, text, rel in anchors:
+        resolved = resolver.resolve(href)
+        if resolved is None:
+            continue
+        url, link_type = resolved
+        entries = links[link_type].setdefault(url, [])
+        extra = {}
+        if text:
+            extra['text'] = text
+        if rel:
+            extra['rel'] = rel
+        if not extra:
+            continue
+        key = (url, text, tuple(rel or ()))
+        if key not in seen_extras:
+            seen_extras.add(key)
+            entries.append(extra)
+    return links
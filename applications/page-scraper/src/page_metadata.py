@@ -0,0 +1,195 @@
+"""
+Page metadata: <title>, meta description, OpenGraph and Twitter cards, the
+canonical link and schema.org JSON-LD entities.
+All of it lives in <head>, which clean_soup removes, so it is collected from the
+same parse before cleaning. The summary gathers what the analyzer otherwise asks an
+LLM for (name, location, contact) when the page states it explicitly.
+"""
+
+import os
+import re
+
+import embedded_data
+
+METADATA_TEXT_MAX_LENGTH = int(os.environ.get('METADATA_TEXT_MAX_LENGTH', '1000'))
+
+# Tags the soup engine collects metadata, scripts, the base URL and images from, in one find_all
+PART_TAGS = ['title', 'meta', 'link', 'script', 'base', 'img', 'source']
+META_FIELDS = {'description': 'description', 'keywords': 'keywords', 'author': 'author'}
+JSON_LD_FIELDS = ('name', 'alternateName', 'jobTitle', 'description', 'url', 'email', 'telephone',
+                  'address', 'location', 'sameAs', 'image')
+# JSON-LD types that describe the site's owner rather than a piece of content
+OWNER_TYPES = ('Person', 'Organization', 'LocalBusiness', 'ProfessionalService', 'ArtGallery',
+               'Museum', 'WebSite')
+ADDRESS_PARTS = ('streetAddress', 'addressLocality', 'addressRegion', 'postalCode', 'addressCountry')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _clean(value):
+    if not isinstance(value, str):
+        return None
+    value = WHITESPACE_PATTERN.sub(' ', value).strip()
+    return value[:METADATA_TEXT_MAX_LENGTH] or None
+
+
+def soup_parts(soup) -> dict:
+    """
+    Collect the title, meta and link attributes, inline scripts, the <base href> and the
+    (name, attributes) of <img> and <source> tags of a soup in one pass
+    """
+    parts = {'title': None, 'metas': [], 'links': [], 'scripts': [], 'base_href': None, 'images': []}
+    for tag in soup.find_all(PART_TAGS):
+        if tag.name in ('img', 'source'):
+            parts['images'].append((tag.name, tag.attrs))
+        elif tag.name == 'base':
+            if parts['base_href'] is None and tag.get('href'):
+                parts['base_href'] = tag['href']
+        elif tag.name == 'meta':
+            parts['metas'].append(tag.attrs)
+        elif tag.name == 'link':
+            parts['links'].append(tag.attrs)
+        elif tag.name == 'script':
+            if not tag.get('src'):
+                script_type = (tag.get('type') or '').split(';')[0].strip().lower()
+                parts['scripts'].append((script_type, tag.string or ''))
+        elif parts['title'] is None:
+            parts['title'] = tag.get_text()
+    return parts
+
+
+def _address_text(value):
+    if isinstance(value, str):
+        return _clean(value)
+    if isinstance(value, list):
+        return next((text for text in map(_address_text, value) if text), None)
+    if not isinstance(value, dict):
+        return None
+    if 'address' in value:
+        # A Place with a nested PostalAddress
+        return _address_text(value['address'])
+    parts = []
+    for key in ADDRESS_PARTS:
+        part = value.get(key)
+        if isinstance(part, dict):
+            part = part.get('name')
+        part = _clean(part)
+        if part and part not in parts:
+            parts.append(part)
+    return ', '.join(parts) or _clean(value.get('name'))
+
+
+def _first_text(value):
+    if isinstance(value, list):
+        return next((text for text in map(_first_text, value) if text), None)
+    if isinstance(value, dict):
+        return _clean(value.get('url') or value.get('name') or value.get('@id'))
+    return _clean(value)
+
+
+def _entities(payload):
+    """Yield every JSON-LD object with a @type, including those in @graph and nested lists"""
+    if isinstance(payload, list):
+        for item in payload:
+            yield from _entities(item)
+    elif isinstance(payload, dict):
+        if '@type' in payload:
+            yield payload
+        if '@graph' in payload:
+            yield from _entities(payload['@graph'])
+
+
+def _entity_fields(entity) -> dict:
+    entity_type = entity['@type']
+    fields = {'type': entity_type[0] if isinstance(entity_type, list) and entity_type else entity_type}
+    for key in JSON_LD_FIELDS:
+        value = entity.get(key)
+        if value is None:
+            continue
+        if key in ('address', 'location'):
+            value = _address_text(value)
+        elif key == 'sameAs':
+            value = [link for link in map(_first_text, value if isinstance(value, list) else [value]) if link]
+        else:
+            value = _first_text(value)
+        if value:
+            fields[key] = value
+    return fields
+
+
+def _summary(metadata) -> dict:
+    entities = metadata.get('json_ld', [])
+    owners = [entity for entity in entities if entity['type'] in OWNER_TYPES]
+    # A Person says more about the artist than the Organization or WebSite around them
+    owners.sort(key=lambda entity: entity['type'] != 'Person')
+    summary = {}
+    for entity in owners:
+        for key, summary_key in (('name', 'name'), ('email', 'email'), ('telephone', 'telephone')):
+            if key in entity and summary_key not in summary:
+                summary[summary_key] = entity[key]
+        location = entity.get('address') or entity.get('location')
+        if location and 'location' not in summary:
+            summary['location'] = location
+        for link in entity.get('sameAs', []):
+            summary.setdefault('social', [])
+            if link not in summary['social']:
+                summary['social'].append(link)
+    if 'name' not in summary and metadata.get('opengraph', {}).get('site_name'):
+        summary['name'] = metadata['opengraph']['site_name']
+    if 'email' in summary and summary['email'].lower().startswith('mailto:'):
+        summary['email'] = summary['email'][len('mailto:'):]
+    creator = metadata.get('twitter', {}).get('creator')
+    if creator and creator not in summary.get('social', []):
+        summary.setdefault('social', []).append(creator)
+    return summary
+
+
+def extract_metadata(parts) -> dict:
+    """
+    Build the metadata of a page from its parts: 'title', 'metas' and 'links' (attribute dicts)
+    and 'scripts' ((type, text) pairs). Only fields the page actually has are returned.
+    """
+    metadata = {}
+    title = _clean(parts.get('title'))
+    if title:
+        metadata['title'] = title
+
+    opengraph, twitter = {}, {}
+    for attrs in parts.get('metas', []):
+        key = (attrs.get('property') or attrs.get('name') or '').strip().lower()
+        content = _clean(attrs.get('content'))
+        if not key or not content:
+            continue
+        if key.startswith('og:'):
+            opengraph.setdefault(key[3:], content)
+        elif key.startswith('twitter:'):
+            twitter.setdefault(key[8:], content)
+        elif key in META_FIELDS:
+            metadata.setdefault(META_FIELDS[key], content)
+    if 'description' not in metadata and 'description' in opengraph:
+        metadata['description'] = opengraph['description']
+    if opengraph:
+        metadata['opengraph'] = opengraph
+    if twitter:
+        metadata['twitter'] = twitter
+
+    for attrs in parts.get('links', []):
+        rel = attrs.get('rel') or []
+        if isinstance(rel, str):
+            rel = rel.split()
+        if 'canonical' in [value.lower() for value in rel] and _clean(attrs.get('href')):
+            metadata['canonical_url'] = _clean(attrs['href'])
+            break
+
+    entities = []
+    for script_type, text in parts.get('scripts', []):
+        if script_type != 'application/ld+json':
+            continue
+        payload = embedded_data.parse_script_payload(text, script_type)
+        entities.extend(_entity_fields(entity) for entity in _entities(payload))
+    if entities:
+        metadata['json_ld'] = entities
+
+    summary = _summary(metadata)
+    if summary:
+        metadata['summary'] = summary
+    return metadata
@@ -0,0 +1,160 @@
+"""
+Compressed, content addressed page objects in S3.
+Every scraped page is one object keyed by where it came from:
+    pages/<domain>/<crawl id>/<sha256 of the page URL>.json.gz    (.json.zst with zstd)
+so pages stored in the same second no longer overwrite each other and a page scraped
+again in the same crawl replaces its earlier copy. Records are compact JSON, compressed
+with gzip (zstd when PAGE_COMPRESSION=zstd and the zstandard package is installed), and
+carry Content-Type and Content-Encoding so S3 and HTTP clients know how to read them.
+The reader functions stream-decode objects, legacy uncompressed ones included.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from urllib.parse import quote, urlparse
+
+import boto3
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+s3 = boto3.client('s3')
+
+PAGE_BUCKET = os.environ.get('PAGE_BUCKET', 'artist-scraped-data')
+PAGE_KEY_PREFIX = os.environ.get('PAGE_KEY_PREFIX', 'pages')
+# 'gzip', 'zstd' or 'none'
+PAGE_COMPRESSION = os.environ.get('PAGE_COMPRESSION', 'gzip').lower()
+PAGE_COMPRESSION_LEVEL = int(os.environ.get('PAGE_COMPRESSION_LEVEL', '6'))
+
+CONTENT_TYPE = 'application/json'
+KEY_SUFFIXES = {'gzip': '.json.gz', 'zstd': '.json.zst', 'none': '.json'}
+
+_stats = {'pages': 0, 'json_bytes': 0, 'stored_bytes': 0}
+
+
+def compression() -> str:
+    """The compression in effect; zstd falls back to gzip when zstandard is not installed"""
+    if PAGE_COMPRESSION == 'zstd' and zstandard is None:
+        return 'gzip'
+    return PAGE_COMPRESSION if PAGE_COMPRESSION in KEY_SUFFIXES else 'gzip'
+
+
+def url_hash(url) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def page_key(page_url, crawl_id, encoding=None) -> str:
+    domain = urlparse(page_url).netloc.lower() or 'unknown'
+    return f'{PAGE_KEY_PREFIX}/{domain}/{crawl_id}/{url_hash(page_url)}{KEY_SUFFIXES[encoding or compression()]}'
+
+
+def serialize(record) -> bytes:
+    """Compact UTF-8 JSON of a record"""
+    raw = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    _stats['json_bytes'] += len(raw)
+    return raw
+
+
+def page_record(page_url, data, crawl_id) -> dict:
+    return {
+        'page_url': page_url,
+        'crawl_id': crawl_id,
+        'timestamp': int(time.time()),
+        'data': data,
+    }
+
+
+def encode(record, encoding=None) -> bytes:
+    """Compact JSON of a record, compressed with encoding (default: the configured compression)"""
+    encoding = encoding or compression()
+    raw = serialize(record)
+    if encoding == 'gzip':
+        # mtime=0 keeps the bytes of a record stable
+        return gzip.compress(raw, compresslevel=PAGE_COMPRESSION_LEVEL, mtime=0)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=PAGE_COMPRESSION_LEVEL).compress(raw)
+    return raw
+
+
+def store_page(page_url, data, crawl_id) -> str:
+    """Store one scraped page under its content addressed key. Returns the key."""
+    encoding = compression()
+    body = encode(page_record(page_url, data, crawl_id), encoding)
+    key = page_key(page_url, crawl_id, encoding)
+    extra = {'ContentEncoding': encoding} if encoding != 'none' else {}
+    s3.put_object(
+        Bucket=PAGE_BUCKET,
+        Key=key,
+        Body=body,
+        ContentType=CONTENT_TYPE,
+        Metadata={'page-url': quote(page_url, safe=':/?&=#%'), 'crawl-id': str(crawl_id)},
+        **extra
+    )
+    _stats['pages'] += 1
+    _stats['stored_bytes'] += len(body)
+    return key
+
+
+# region reader
+def _encoding_of(key, content_encoding=None):
+    if content_encoding:
+        return content_encoding.lower()
+    if key.endswith('.gz'):
+        return 'gzip'
+    if key.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+
+def open_record(stream, key='', content_encoding=None):
+    """Wrap a binary stream of a stored object into a stream of its decoded JSON bytes"""
+    encoding = _encoding_of(key, content_encoding)
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError(f'{key} is zstd compressed but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    return stream
+
+
+def decode(body, key='', content_encoding=None):
+    """Decode a stored object's bytes back into its record"""
+    return json.load(open_record(io.BytesIO(body), key, content_encoding))
+
+
+def read_page(key, bucket=None):
+    """Fetch and stream-decode one stored page record"""
+    response = s3.get_object(Bucket=bucket or PAGE_BUCKET, Key=key)
+    # S3 reports the ContentEncoding the object was stored with, the key suffix is the fallback
+    with open_record(response['Body'], key, response.get('ContentEncoding')) as stream:
+        return json.load(stream)
+
+
+def list_page_keys(domain, crawl_id=None, bucket=None):
+    """Yield the keys of a domain's stored pages, of one crawl or all of them"""
+    prefix = f'{PAGE_KEY_PREFIX}/{domain.lower()}/' + (f'{crawl_id}/' if crawl_id else '')
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket or PAGE_BUCKET, Prefix=prefix):
+        for item in page.get('Contents', []):
+            yield item['Key']
+
+
+def iter_pages(domain, crawl_id=None, bucket=None):
+    """Yield the records of a domain's stored pages one at a time"""
+    for key in list_page_keys(domain, crawl_id, bucket):
+        try:
+            yield read_page(key, bucket)
+        except Exception as e:
+            print(f'Error reading page {key}: {e}')
+# endregion
+
+
+def get_stats() -> dict:
+    return dict(_stats, compression=compression())
@@ -4,57 +4,80 @@ individual page. Modified to store sitemap data in DynamoDB for dashboard integr
 """
 
 import requests
-from bs4 import BeautifulSoup
 import json
 import os
+import random
 import time
-from collections import defaultdict
 from urllib.parse import urlparse, urljoin
-from functools import reduce
 import boto3
 
+import boilerplate
+import contact_extract
+import content_blocks
+import dns_cache
+import embedded_data
+import fetch_cache
+import graph_metrics
+import host_concurrency
+import image_pipeline
+import link_resolver
+import page_metadata
+import page_store
+import parse_profiles
+import parser_backend
+import retry_policy
+import segment_writer
+import sitemap_store
+import soup_prune
+import stream_extract
+import text_layout
+
 # Initialize AWS clients
 s3 = boto3.client('s3')
 sqs = boto3.client('sqs')
 dynamodb = boto3.resource('dynamodb')
 
+# Cache hostname lookups for the lifetime of the container
+dns_cache.install()
+
+# (connect, read) timeouts in seconds; retries are handled by the session's adapter
+FETCH_TIMEOUT = (
+    float(os.environ.get('FETCH_CONNECT_TIMEOUT', '5')),
+    float(os.environ.get('FETCH_READ_TIMEOUT', '15')),
+)
+session = retry_policy.build_session()
+# Upper bound of the random delay before retrying a URL whose host is at its concurrency limit
+HOST_BUSY_DELAY_SECONDS = int(os.environ.get('HOST_BUSY_DELAY_SECONDS', '30'))
+# A page failing with a retryable error is re-queued this many times, after PAGE_RETRY_DELAY_SECONDS
+# doubling per attempt, before it is marked processed without links
+PAGE_RETRY_ATTEMPTS = int(os.environ.get('PAGE_RETRY_ATTEMPTS', '3'))
+PAGE_RETRY_DELAY_SECONDS = int(os.environ.get('PAGE_RETRY_DELAY_SECONDS', '60'))
+
 UNWANTED_TAGS = ['head', 'button', 'form', 'input', 'script', 'style', 'link']
 UNWANTED_ENCLOSING_TAGS = []
+# How clean_soup prunes the tree: drop with contents, drop when holding no child tag, replace by contents
+PRUNE_RULES = {
+    'decompose': UNWANTED_TAGS,
+    'collapse_empty': ['div'],
+    'unwrap': UNWANTED_ENCLOSING_TAGS,
+}
+# 'soup' builds a BeautifulSoup tree, 'stream' extracts links and text in one pass without a DOM
+EXTRACTION_ENGINE = os.environ.get('EXTRACTION_ENGINE', 'soup').lower()
+EXTRACT_EMBEDDED_DATA = os.environ.get('EXTRACT_EMBEDDED_DATA', 'true').lower() == 'true'
+EXTRACT_METADATA = os.environ.get('EXTRACT_METADATA', 'true').lower() == 'true'
+# 'strings' returns the page text as a flat list, 'blocks' as typed blocks (see content_blocks)
+TEXT_OUTPUT = os.environ.get('TEXT_OUTPUT', 'strings').lower()
+# 'objects' stores one S3 object per page, 'segments' rolling per-domain segments flushed per invocation
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'objects').lower()
 
 # region helper functions
-def get_link_type(href, url):
-    if urlparse(url).netloc == urlparse(urljoin(url, href)).netloc:
-        return 'internal'
-    return 'external'
-
-def link_reduce(url, acc, link_data):
-    """
-    The 'ancestor tag list' is a list of the link's parents all the way up to the root of the document
-    It is intended to help identify common patterns in link structures and what tags are important
-    By identifying common patterns, we can better understand the structure of pages and optimize our scraping strategy
-    """
-    href = link_data['href']
-    acc[get_link_type(href, url)][href] = []
-    return acc
-
-def clean_soup(soup):
-    """
-    Cleans the soup object by removing unwanted tags and attributes
-    """
-    tags_to_remove = {'decompose' : [],
-                      'unwrap' : []
-                     }
-    # Remove childless divs
-    tags_to_remove['decompose'] += [x for x in soup.find_all('div') if not x.find_all()]
-    tags_to_remove['decompose'] += soup.find_all(UNWANTED_TAGS)
-    tags_to_remove['unwrap'] += soup.find_all(UNWANTED_ENCLOSING_TAGS)
-    for tag in tags_to_remove['decompose']:
-        tag.decompose()
-    for tag in tags_to_remove['unwrap']:
-        if tag.contents:
-            tag.unwrap()
-        else:
-            tag.decompose()
+def clean_soup(soup, rules=None):
+    """
+    Cleans the soup object by removing unwanted tags and attributes.
+    Removes UNWANTED_TAGS, childless divs and unwraps UNWANTED_ENCLOSING_TAGS (see PRUNE_RULES)
+    in a single walk over the tree.
+    """
+    soup_prune.prune_soup(soup, PRUNE_RULES if rules is None else rules)
 
 def format_soup(soup) -> str:
     """
@@ -117,19 +140,7 @@ def check_url_exists_in_dynamodb(url, website_domain):
     Returns True if URL exists, False otherwise.
     """
     try:
-        table_name = os.environ.get('SITEMAP_TABLE_NAME', 'website-sitemaps')
-        table = dynamodb.Table(table_name)
-        
-        response = table.get_item(
-            Key={'website_domain': website_domain}
-        )
-        
-        if 'Item' not in response:
-            return False
-            
-        sitemap = response['Item'].get('sitemap', {})
-        return normalize_url(url) in sitemap
-        
+        return sitemap_store.contains(website_domain, normalize_url(url))
     except Exception as e:
         print(f'Error checking URL in DynamoDB: {e}')
         return False
@@ -140,53 +151,17 @@ def lock_url_in_dynamodb(url, website_domain):
     Returns True if successfully locked, False if already exists.
     """
     try:
-        table_name = os.environ.get('SITEMAP_TABLE_NAME', 'website-sitemaps')
-        table = dynamodb.Table(table_name)
         normalized_url = normalize_url(url)
-        
-        # First, try to get existing domain record
-        try:
-            response = table.get_item(
-                Key={'website_domain': website_domain}
-            )
-            
-            if 'Item' in response:
-                # Domain record exists, check if URL already exists
-                sitemap = response['Item'].get('sitemap', {})
-                if normalized_url in sitemap:
-                    print(f'URL {normalized_url} already exists in sitemap')
-                    return False
-                
-                # Add URL placeholder to existing sitemap
-                sitemap[normalized_url] = []  # Empty list as placeholder
-                
-                table.update_item(
-                    Key={'website_domain': website_domain},
-                    UpdateExpression='SET sitemap = :sitemap, last_updated = :timestamp',
-                    ExpressionAttributeValues={
-                        ':sitemap': sitemap,
-                        ':timestamp': int(time.time())
-                    }
-                )
-            else:
-                # Create new domain record with URL placeholder
-                table.put_item(
-                    Item={
-                        'website_domain': website_domain,
-                        'sitemap': {normalized_url: []},
-                        'last_updated': int(time.time())
-                    }
-                )
-                
-            print(f'URL {normalized_url} locked in DynamoDB for domain: {website_domain}')
-            return True
-            
-        except Exception as e:
-            print(f'Error locking URL in DynamoDB: {e}')
+        # Empty list as placeholder, only written if no other instance wrote one first
+        if not sitemap_store.put_entry(website_domain, normalized_url, [], only_new=True):
+            print(f'URL {normalized_url} already exists in sitemap')
             return False
-            
+
+        print(f'URL {normalized_url} locked in DynamoDB for domain: {website_domain}')
+        return True
+
     except Exception as e:
-        print(f'Error in lock_url_in_dynamodb: {e}')
+        print(f'Error locking URL in DynamoDB: {e}')
         return False
 
 def update_url_sitemap_in_dynamodb(url, discovered_links, website_domain):
@@ -194,98 +169,138 @@ def update_url_sitemap_in_dynamodb(url, discovered_links, website_domain):
     Update the specific URL entry in DynamoDB with discovered internal links.
     """
     try:
-        table_name = os.environ.get('SITEMAP_TABLE_NAME', 'website-sitemaps')
-        table = dynamodb.Table(table_name)
         normalized_url = normalize_url(url)
-        
-        # Get current sitemap
-        response = table.get_item(
-            Key={'website_domain': website_domain}
-        )
-        
-        if 'Item' not in response:
-            print(f'Warning: Domain {website_domain} not found when updating URL {normalized_url}')
-            return False
-            
-        sitemap = response['Item'].get('sitemap', {})
-        
-        # Update the specific URL with discovered links
-        sitemap[normalized_url] = discovered_links
-        
-        # Update the record
-        table.update_item(
-            Key={'website_domain': website_domain},
-            UpdateExpression='SET sitemap = :sitemap, last_updated = :timestamp',
-            ExpressionAttributeValues={
-                ':sitemap': sitemap,
-                ':timestamp': int(time.time())
-            }
-        )
-        
+        sitemap_store.put_entry(website_domain, normalized_url, discovered_links)
         print(f'Updated sitemap for {normalized_url} with {len(discovered_links)} internal links')
         return True
-        
+
     except Exception as e:
         print(f'Error updating URL sitemap in DynamoDB: {e}')
         return False
 
+def unmark_url_in_dynamodb(url, website_domain):
+    """
+    Remove the URL's entry again when its page could not be scraped or its data could not
+    be stored, so the next message for it scrapes it instead of skipping it as already processed.
+    """
+    try:
+        sitemap_store.remove_entry(website_domain, normalize_url(url))
+        print(f'URL {url} unmarked in DynamoDB')
+        return True
+
+    except Exception as e:
+        print(f'Error unmarking URL {url} in DynamoDB: {e}')
+        return False
+
 def store_sitemap_to_dynamodb(sitemap_data, website_domain):
     """
     Store sitemap data in DynamoDB table.
-    Each website gets one record with the sitemap as a JSON object.
+    Each website gets one record with the sitemap as a JSON object, sharded when it is too large.
     DEPRECATED: Use update_url_sitemap_in_dynamodb for concurrent execution.
     """
     try:
-        table_name = os.environ.get('SITEMAP_TABLE_NAME', 'website-sitemaps')
-        table = dynamodb.Table(table_name)
-        
-        # Store the sitemap data
-        response = table.put_item(
-            Item={
-                'website_domain': website_domain,
-                'sitemap': sitemap_data,
-                'last_updated': int(time.time())
-            }
-        )
-        
-        print(f'Sitemap stored in DynamoDB for domain: {website_domain}')
-        return response
-        
+        shards = sitemap_store.replace_sitemap(website_domain, sitemap_data)
+        print(f'Sitemap stored in DynamoDB for domain: {website_domain} ({shards} overflow shards)')
+        return shards
+
     except Exception as e:
         print(f'Error storing sitemap to DynamoDB: {e}')
         raise
 
 # endregion helper functions
 
-def fetch_page(url: str) -> object:
+def fetch_cached_html(url: str) -> object:
+    """
+    Returns the HTML of a recorded response without any network access
     """
-    Fetches the content of a webpage and returns a BeautifulSoup object
+    cached = fetch_cache.load_response(url)
+    if cached is None:
+        return {"error": f"No cached response for {url}",
+                "error_class": retry_policy.ERROR_PERMANENT}
+    if cached['status'] >= 400:
+        return {"error": f"Failed to fetch {url}: cached status {cached['status']}",
+                "error_class": retry_policy.classify_status(cached['status'])}
+    return cached['text']
+
+def fetch_html(url: str, replay: bool = False, circuit_checked: bool = False) -> object:
     """
+    Fetches the HTML of a webpage as a string.
+    Transient failures are retried by the session. On failure an error dict is returned whose
+    'error_class' is 'retryable', 'permanent' or 'circuit_open'.
+    With replay the page is served from the fetch cache instead of the network.
+    circuit_checked skips the circuit breaker lookup when the caller has just done it.
+    """
+    if replay:
+        return fetch_cached_html(url)
+
+    domain = urlparse(url).netloc
+    opened_until = None if circuit_checked else retry_policy.circuit_open_until(domain)
+    if opened_until:
+        return {"error": f"Circuit open for {domain} until {opened_until}",
+                "error_class": retry_policy.ERROR_CIRCUIT_OPEN}
     try:
-        response = requests.get(url)
+        response = session.get(url, timeout=FETCH_TIMEOUT)
+        host_concurrency.observe(domain, response.elapsed.total_seconds(),
+                                 retry_policy.classify_status(response.status_code) != retry_policy.ERROR_RETRYABLE)
+        if fetch_cache.is_recording():
+            fetch_cache.store_response(url, response)
         response.raise_for_status()  # Raise error for bad status codes
-        soup = BeautifulSoup(response.text, 'html.parser')
-        test = ' '.join(soup.stripped_strings)
-        return soup
+        html = response.text
+        retry_policy.record_success(domain)
+        return html
+    except Exception as e:
+        if retry_policy.counts_against_host(e):
+            retry_policy.record_failure(domain)
+            host_concurrency.observe(domain, None, False)
+        return {"error": f"Failed to fetch {url}: {e}",
+                "error_class": retry_policy.classify_exception(e)}
+
+def fetch_page(url: str, replay: bool = False, profile: str = 'full', parser: str = None) -> object:
+    """
+    Fetches the content of a webpage and returns a BeautifulSoup object holding
+    the part of the document the parse profile needs, or the error dict from fetch_html.
+    parser names a parser backend (default: see parser_backend.get_backend).
+    """
+    html = fetch_html(url, replay=replay)
+    if isinstance(html, dict):
+        return html
+    try:
+        return parse_profiles.parse(html, profile, parser_backend.get_backend(parser))
     except Exception as e:
-        return {"error": f"Failed to fetch {url}: {e}"}
+        return {"error": f"Failed to parse {url}: {e}",
+                "error_class": retry_policy.ERROR_PERMANENT}
+
+def merge_embedded_data(url, links, text, embedded) -> list:
+    """
+    Merges text and links found in embedded JSON into the page's links and text.
+    Links and text already present on the page are not repeated.
+    """
+    found = link_resolver.resolve_links(url, ((href, None, None) for href in embedded['links']))
+    for link_type, hrefs in found.items():
+        for href in hrefs:
+            links[link_type].setdefault(href, [])
+    seen = set(text)
+    return text + [string for string in embedded['text'] if string not in seen]
 
 def scrape_links(url, soup: object) -> dict:
     """
-    Extracts all links from the BeautifulSoup object and categorizes them as internal or external
+    Extracts all links from the BeautifulSoup object and categorizes them as internal or external.
+    Links are absolute, canonical and deduplicated (see link_resolver), each with the anchor
+    texts and rel values it was linked with. Relative links resolve against <base href> if present.
     Has some side effects, such as removing links that start with '#' or link tags that don't have href attributes
     """
     for link_element in soup.find_all('a', href=lambda href: not href or href.startswith('#')):
         link_element.decompose()
-    links = reduce(
-        lambda acc, link_data: link_reduce(url, acc, link_data),
-        [{'tag': tag, 'href': tag.get('href')} for tag in soup.find_all('a')],
-        {'internal': defaultdict(list), 'external': defaultdict(list)})
-    return links
+    base = soup.find('base', href=True)
+    anchors = ((tag['href'], tag.get_text(' ', strip=True), list(tag.get('rel') or ()))
+               for tag in soup.find_all('a'))
+    return link_resolver.resolve_links(url, anchors, base['href'] if base else None)
 
-def send_urls_to_queue(urls, queue_url):
+def send_urls_to_queue(urls, queue_url, delay_seconds=0, message_fields=None):
     """
     Send a list of URLs to the SQS queue for processing by other Lambda instances.
+    delay_seconds (max 900) hides the messages from consumers for that long.
+    message_fields are job settings (such as parse_profile) carried along with every URL.
     """
     try:
         if not urls:
@@ -293,11 +308,12 @@ def send_urls_to_queue(urls, queue_url):
             
         messages_sent = 0
         for url in urls:
-            message_body = json.dumps({"page_url": url})
+            message_body = json.dumps({"page_url": url, **(message_fields or {})})
             
             response = sqs.send_message(
                 QueueUrl=queue_url,
-                MessageBody=message_body
+                MessageBody=message_body,
+                DelaySeconds=delay_seconds
             )
             
             if response.get('MessageId'):
@@ -313,30 +329,140 @@ def send_urls_to_queue(urls, queue_url):
         print(f'Error sending URLs to queue: {e}')
         return 0
 
-def scrape_single_page(url: str) -> dict:
+def defer_url(page_url, queue_url, delay_seconds, reason, message_fields=None):
+    """
+    Put the URL back on the queue to be picked up after delay_seconds and build the handler response.
+    """
+    delay_seconds = max(0, min(900, int(delay_seconds)))
+    send_urls_to_queue([page_url], queue_url, delay_seconds=delay_seconds, message_fields=message_fields)
+    print(f'{reason}, deferred {page_url} by {delay_seconds}s')
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'{reason}, URL deferred',
+            'url': page_url,
+            'status': 'deferred'
+        })
+    }
+
+def extract_with_soup(url, html, profile=None, parser=None) -> dict:
+    """
+    Builds the BeautifulSoup tree the parse profile needs and extracts from it:
+        links, text, embedded (text and links from embedded JSON), metadata (see page_metadata),
+        images (image URLs, see image_pipeline) and layout, the 'paths' and 'blocks' of the text
+        strings (see text_layout)
+    """
+    soup = parse_profiles.parse(html, profile, parser_backend.get_backend(parser))
+    links = scrape_links(url, soup)
+    # Metadata and embedded JSON live in <head> and script tags, so they have to be read
+    # before clean_soup drops them. One search collects both.
+    parts = page_metadata.soup_parts(soup)
+    extracted = {
+        'links': links,
+        'embedded': embedded_data.extract_from_scripts(parts['scripts']) if EXTRACT_EMBEDDED_DATA else None,
+        'metadata': page_metadata.extract_metadata(parts) if EXTRACT_METADATA else None,
+        'text': [],
+        'layout': {'paths': [], 'blocks': []},
+        'images': [],
+    }
+    if parse_profiles.includes_text(profile):
+        if image_pipeline.IMAGES_ENABLED:
+            extracted['images'] = image_pipeline.image_candidates(url, parts['base_href'], parts['images'])
+        clean_soup(soup)
+        text, paths, blocks = text_layout.stripped_strings_with_layout(soup)
+        extracted.update(text=text, layout={'paths': paths, 'blocks': blocks})
+    return extracted
+
+def extract_with_stream(url, html, profile=None) -> dict:
+    """
+    Extracts the same as extract_with_soup in one streaming pass.
+    The stream engine never builds a tree, so the profile only decides whether text and images are returned.
+    """
+    streamed = stream_extract.extract(html, PRUNE_RULES['decompose'], PRUNE_RULES['collapse_empty'])
+    extracted = {
+        'links': link_resolver.resolve_links(url, streamed['links'], streamed['base_href']),
+        'embedded': embedded_data.extract_from_scripts(streamed['scripts']) if EXTRACT_EMBEDDED_DATA else None,
+        'metadata': page_metadata.extract_metadata(streamed['head']) if EXTRACT_METADATA else None,
+        'text': [],
+        'layout': {'paths': [], 'blocks': []},
+        'images': [],
+    }
+    if parse_profiles.includes_text(profile):
+        if image_pipeline.IMAGES_ENABLED:
+            extracted['images'] = image_pipeline.image_candidates(url, streamed['base_href'], streamed['images'])
+        extracted.update(text=streamed['text'], layout={'paths': streamed['paths'], 'blocks': streamed['blocks']})
+    return extracted
+
+def scrape_single_page(url: str, replay: bool = None, engine: str = None, profile: str = None,
+                       parser: str = None, text_output: str = None, circuit_checked: bool = False) -> dict:
     """
     Scrape a single webpage and return its content and links.
     This function processes only ONE URL, not multiple URLs.
+    With replay (default: FETCH_CACHE_MODE=replay) the page comes from the fetch cache
+    so extraction changes can be re-run over a recorded corpus without network calls.
+    engine selects 'soup' or 'stream' extraction (default: EXTRACTION_ENGINE).
+    profile selects the parse profile (default: DEFAULT_PARSE_PROFILE), see parse_profiles.
+    parser selects the soup engine's parser backend (default: PARSER_BACKEND), see parser_backend.
+    text_output 'blocks' returns typed 'blocks' instead of the flat 'text' list (default: TEXT_OUTPUT).
+    circuit_checked is passed to fetch_html when the caller already checked the host's circuit breaker.
     """
+    if replay is None:
+        replay = fetch_cache.is_replaying()
+    profile = parse_profiles.get_profile(profile)
     try:
-        soup = fetch_page(url)
-        if isinstance(soup, dict) and 'error' in soup:
-            print(f'Error fetching page {url}: {soup["error"]}')
+        html = fetch_html(url, replay=replay, circuit_checked=circuit_checked)
+        if isinstance(html, dict) and 'error' in html:
+            print(f'Error fetching page {url}: {html["error"]}')
             return {
                 'url': url,
                 'links': {'internal': {}, 'external': {}},
                 'text': [],
-                'error': soup['error']
+                'error': html['error'],
+                'error_class': html.get('error_class')
             }
-            
-        links = scrape_links(url, soup)
-        clean_soup(soup)
-        
+
+        if (engine or EXTRACTION_ENGINE) == 'stream':
+            extracted = extract_with_stream(url, html, profile)
+        else:
+            extracted = extract_with_soup(url, html, profile, parser)
+        links, text, embedded, layout = (extracted['links'], extracted['text'], extracted['embedded'],
+                                         extracted['layout'])
+        if boilerplate.BOILERPLATE_ENABLED:
+            # Menus, footers and other blocks repeated across the domain's pages
+            kept = boilerplate.kept_indexes(urlparse(url).netloc, url, text, layout['paths'])
+            if len(kept) < len(text):
+                text = [text[i] for i in kept]
+                layout = {name: [values[i] for i in kept] for name, values in layout.items()}
+        page_text_count = len(text)
+        if embedded:
+            if not parse_profiles.includes_text(profile):
+                embedded = {'links': embedded['links'], 'text': []}
+            text = merge_embedded_data(url, links, text, embedded)
+
         result = {
             'url': url,
             'links': links,
-            'text': list(soup.stripped_strings),
+            'parse_profile': profile,
         }
+        if extracted['metadata']:
+            result['metadata'] = extracted['metadata']
+        if contact_extract.CONTACTS_ENABLED:
+            contacts = contact_extract.extract_contacts(links, text, (extracted['metadata'] or {}).get('summary'))
+            if contacts:
+                result['contacts'] = contacts
+        if extracted['images'] and replay:
+            # Replay makes no network calls: the candidates, without probing them
+            result['images'] = [{'url': image_url} for image_url in extracted['images']]
+        elif extracted['images']:
+            # Only images at least MIN_IMG_DIMENSIONS in size, probed from their headers
+            result['images'] = image_pipeline.process_images(extracted['images'], image_pipeline.probe_session,
+                                                             urlparse(url).netloc)
+        if (text_output or TEXT_OUTPUT) == 'blocks':
+            blocks = content_blocks.build_blocks(text[:page_text_count], layout['blocks'])
+            content_blocks.append_strings(blocks, text[page_text_count:])
+            result['blocks'] = content_blocks.compact_blocks(blocks)
+        else:
+            result['text'] = text
         
         print(f'Successfully scraped {url}: found {len(links["internal"])} internal links, {len(links["external"])} external links')
         return result
@@ -368,11 +494,6 @@ def scrape_page(url: str) -> object:
         'links': links,
         'text': list(soup.stripped_strings),
     }
-
-    # not implement
-    potential_dublicate = [
-        'Close', 'Open', 'Close Menu', 'Open Menu', 'Portfolio', 'view fullsize', 'Next', '0', 'Previous', 'home', 'contacts'
-    ]
     
     # new
     numInternalLinksToscrape = 6 if len(links['internal']) > 6 else len(links['internal'])
@@ -407,36 +528,53 @@ def scrape_page(url: str) -> object:
     print(final_result)
     return final_result
 
-def storeDataToS3(data, page_url):
-    bucket_name = 'artist-scraped-data'
-    fileName = f'scraped-data-{int(time.time())}.json'
-
-    # Add page_url at the top of the data
-    structured_data = {
-        "page_url": page_url,
-        "timestamp": int(time.time()),
-        "data": data
-    }
+def storeDataToS3(data, page_url, crawl_id):
+    """
+    Store the page's data as compact, compressed JSON: one object under
+    pages/<domain>/<crawl_id>/<url hash> (see page_store), or with STORAGE_LAYOUT=segments
+    a record of the domain's rolling segment, written when the handler flushes (see segment_writer)
+    """
+    if STORAGE_LAYOUT == 'segments':
+        key = segment_writer.append(page_url, data, crawl_id)
+        print(f'Data buffered for URL: {page_url} ({key})')
+        return
+    key = page_store.store_page(page_url, data, crawl_id)
+    print(f'Data stored in S3 for URL: {page_url} ({key})')
 
-    uploadByteStream = bytes(json.dumps(structured_data, indent=4).encode('UTF-8'))
+def lambda_handler(event, context):
+    print("Received event:", json.dumps(event))  # debug
 
-    # Store the data in S3
-    s3.put_object(Bucket=bucket_name, Key=fileName, Body=uploadByteStream)
+    # Extract messages from SQS event
+    records = event.get('Records', [])
+    if not records:
+        return {'statusCode': 400, 'body': json.dumps('Error: No SQS records found')}
 
-    print(f'Data stored in S3 for URL: {page_url}')
+    try:
+        results = [process_record(record) for record in records]
+        if STORAGE_LAYOUT == 'segments':
+            # SQS deletes the batch's messages once the handler returns, so their records have to
+            # be in S3 by then
+            segment_writer.flush()
+            print(f'Segment stats: {json.dumps(segment_writer.get_stats())}')
+    except segment_writer.SegmentFlushError as e:
+        # The pages are already in the sitemap: unmark them so the redelivered batch scrapes
+        # them again instead of skipping them, then fail the batch
+        unstored = e.page_urls + segment_writer.discard()
+        print(f'Error storing segments, {len(unstored)} pages not stored: {e}')
+        for url in unstored:
+            unmark_url_in_dynamodb(url, urlparse(url).netloc)
+        raise
 
-def lambda_handler(event, context):
-    print("Received event:", json.dumps(event))  # debug
+    if len(results) == 1:
+        return results[0]
+    return {
+        'statusCode': max(result['statusCode'] for result in results),
+        'body': json.dumps([json.loads(result['body']) for result in results])
+    }
 
-    # Process SQS event
+def process_record(record):
+    """Scrape the page of one SQS record, store its data and queue the new URLs it links to"""
     try:
-        # Extract message from SQS event
-        records = event.get('Records', [])
-        if not records:
-            return {'statusCode': 400, 'body': json.dumps('Error: No SQS records found')}
-        
-        # Process the first record (batch_size is set to 1)
-        record = records[0]
         message_body = json.loads(record['body'])
         
         # Extract page_url from the message
@@ -444,6 +582,19 @@ def lambda_handler(event, context):
         if not page_url:
             return {'statusCode': 400, 'body': json.dumps('Error: page_url is missing from message')}
 
+        # The parse profile, parser backend and text output are chosen per job and travel
+        # with every URL queued for it
+        parse_profile = parse_profiles.get_profile(message_body.get('parse_profile'))
+        job_fields = {'parse_profile': parse_profile}
+        for field in ('parser_backend', 'text_output'):
+            if message_body.get(field):
+                job_fields[field] = message_body[field]
+        # A seed URL starts a new crawl; every page of the crawl is stored under its id
+        job_fields['crawl_id'] = message_body.get('crawl_id') or time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        # Link distance from the seed URL; deferred messages keep it, discovered URLs are one further
+        depth = int(message_body.get('depth') or 0)
+        job_fields['depth'] = depth
+
         # Get environment variables
         queue_url = os.environ.get('URL_QUEUE_URL')
         if not queue_url:
@@ -465,24 +616,52 @@ def lambda_handler(event, context):
                 })
             }
         
-        # STEP 2: Lock the URL to prevent race conditions
-        if not lock_url_in_dynamodb(page_url, website_domain):
-            print(f'Failed to lock URL {page_url}, another instance may be processing it')
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'URL being processed by another instance',
-                    'url': page_url,
-                    'status': 'locked'
-                })
-            }
+        # STEP 2: Defer hosts whose circuit breaker is open. This has to happen before locking,
+        # otherwise the re-queued message would be skipped as already processed
+        opened_until = retry_policy.circuit_open_until(website_domain)
+        if opened_until:
+            return defer_url(page_url, queue_url, opened_until - int(time.time()),
+                             f'Host circuit open for {website_domain}', job_fields)
+
+        # STEP 3: Wait for a free slot in the host's adaptive concurrency budget
+        if not host_concurrency.acquire(website_domain):
+            return defer_url(page_url, queue_url, random.randint(5, HOST_BUSY_DELAY_SECONDS),
+                             f'Host {website_domain} at its concurrency limit', job_fields)
+
+        try:
+            # STEP 4: Lock the URL to prevent race conditions
+            if not lock_url_in_dynamodb(page_url, website_domain):
+                print(f'Failed to lock URL {page_url}, another instance may be processing it')
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': 'URL being processed by another instance',
+                        'url': page_url,
+                        'status': 'locked'
+                    })
+                }
         
-        # STEP 3: Scrape the single page
-        print(f'Processing URL: {page_url}')
-        scraping_result = scrape_single_page(page_url)
+            # STEP 5: Scrape the single page
+            print(f'Processing URL: {page_url} (parse profile {parse_profile})')
+            scraping_result = scrape_single_page(page_url, profile=parse_profile,
+                                                 parser=job_fields.get('parser_backend'),
+                                                 text_output=job_fields.get('text_output'),
+                                                 circuit_checked=True)
+        finally:
+            host_state = host_concurrency.release(website_domain)
+            if host_state:
+                print(f'Host concurrency stats: {json.dumps(host_concurrency.get_stats(website_domain, host_state))}')
         
         if 'error' in scraping_result:
             print(f'Error scraping {page_url}: {scraping_result["error"]}')
+            attempt = int(message_body.get('attempt') or 0)
+            if scraping_result.get('error_class') in (retry_policy.ERROR_RETRYABLE, retry_policy.ERROR_CIRCUIT_OPEN) \
+                    and attempt < PAGE_RETRY_ATTEMPTS:
+                # Timeouts, 429 and 5xx: release the lock and try again later instead of marking it processed
+                unmark_url_in_dynamodb(page_url, website_domain)
+                return defer_url(page_url, queue_url, PAGE_RETRY_DELAY_SECONDS * 2 ** attempt,
+                                 f'Retryable error (attempt {attempt + 1} of {PAGE_RETRY_ATTEMPTS})',
+                                 dict(job_fields, attempt=attempt + 1))
             # Still update DynamoDB to mark as processed (with empty links)
             update_url_sitemap_in_dynamodb(page_url, [], website_domain)
             return {
@@ -491,16 +670,24 @@ def lambda_handler(event, context):
                     'message': 'URL processed with errors',
                     'url': page_url,
                     'error': scraping_result['error'],
+                    'error_class': scraping_result.get('error_class'),
                     'status': 'error'
                 })
             }
         
-        # STEP 4: Extract internal links and normalize them
+        # STEP 6: Extract internal links and normalize them
         internal_links = scraping_result.get('links', {}).get('internal', {})
         base_domain = urlparse(page_url).netloc
         
         discovered_urls = []
         normalized_internal_links = []
+        # One read of the sitemap (all its shards) per container and SITEMAP_KNOWN_URLS_SECONDS instead
+        # of one per link or page; a URL queued again from a stale copy is skipped by its lock
+        try:
+            known_urls = sitemap_store.known_urls(website_domain, max_age=sitemap_store.SITEMAP_KNOWN_URLS_SECONDS)
+        except Exception as e:
+            print(f'Error reading sitemap of {website_domain}: {e}')
+            known_urls = set()
         
         for link_href in internal_links.keys():
             # Convert relative URLs to absolute URLs
@@ -512,26 +699,44 @@ def lambda_handler(event, context):
                 normalized_internal_links.append(normalized_link)
                 
                 # Check if this URL needs to be queued for processing
-                if not check_url_exists_in_dynamodb(normalized_link, website_domain):
+                if normalized_link not in known_urls:
                     discovered_urls.append(normalized_link)
         
-        # STEP 5: Update DynamoDB with discovered internal links
+        # STEP 7: Update DynamoDB with discovered internal links
         update_url_sitemap_in_dynamodb(page_url, normalized_internal_links, website_domain)
+        try:
+            graph_metrics.record_page(website_domain, normalize_url(page_url), normalized_internal_links, depth)
+        except Exception as e:
+            print(f'Error recording graph metrics for {page_url}: {e}')
         
-        # STEP 6: Queue new URLs for processing by other Lambda instances
+        # STEP 8: Queue new URLs for processing by other Lambda instances
         queued_count = 0
         if discovered_urls:
             print(f'Found {len(discovered_urls)} new URLs to process')
-            queued_count = send_urls_to_queue(discovered_urls, queue_url)
+            queued_count = send_urls_to_queue(discovered_urls, queue_url, message_fields=dict(job_fields, depth=depth + 1))
         else:
             print('No new URLs found to queue')
         
-        # STEP 7: Store full scraping data in S3 (preserve existing functionality)
-        legacy_format = {page_url: {
-            'links': scraping_result.get('links', {}),
-            'text': scraping_result.get('text', [])
-        }}
-        storeDataToS3(legacy_format, page_url)
+        # STEP 9: Store full scraping data in S3 (preserve existing functionality)
+        page_data = {'links': scraping_result.get('links', {}), 'depth': depth}
+        for field in ('metadata', 'contacts', 'images'):
+            if field in scraping_result:
+                page_data[field] = scraping_result[field]
+        if 'blocks' in scraping_result:
+            page_data['blocks'] = scraping_result['blocks']
+        else:
+            page_data['text'] = scraping_result.get('text', [])
+        legacy_format = {page_url: page_data}
+        storeDataToS3(legacy_format, page_url, job_fields['crawl_id'])
+        if 'contacts' in scraping_result:
+            contact_extract.record_contacts(website_domain, scraping_result['contacts'])
+        print(f'DNS cache stats: {json.dumps(dns_cache.get_stats())}')
+        if boilerplate.BOILERPLATE_ENABLED:
+            print(f'Boilerplate stats: {json.dumps(boilerplate.get_stats())}')
+        if image_pipeline.IMAGES_ENABLED:
+            print(f'Image stats: {json.dumps(image_pipeline.get_stats())}')
+        if contact_extract.CONTACTS_ENABLED:
+            print(f'Contact stats: {json.dumps(contact_extract.get_stats())}')
 
         return {
             'statusCode': 200,
@@ -545,8 +750,11 @@ def lambda_handler(event, context):
             })
         }
         
+    except segment_writer.SegmentFlushError:
+        # Handled for the whole batch by lambda_handler
+        raise
     except Exception as e:
-        print(f'Error in lambda_handler: {e}')
+        print(f'Error in process_record: {e}')
         import traceback
         traceback.print_exc()
         return {
@@ -0,0 +1,65 @@
+"""
+Named parse profiles that build only the part of the tree a job needs.
+A SoupStrainer keeps matching tags (with everything inside them) and skips the
+rest of the document, so a crawl that only maps site structure does not pay
+for building and cleaning the full DOM of every page.
+
+    links-only   <a>, <base>, <script> and the metadata tags (<title>, <meta>, <link>): links,
+                 embedded links and page metadata, no text
+    text+links   <head> and <body>: what a normal scrape keeps, metadata included
+    full         the whole document, for debugging
+"""
+
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+PARSE_PROFILES = {
+    'links-only': {
+        'parse_only': ['a', 'base', 'script', 'title', 'meta', 'link'],
+        'text': False,
+    },
+    'text+links': {
+        # clean_soup drops <head> after its metadata is read, so <body> holds all the text a scrape keeps
+        'parse_only': ['head', 'body', 'script'],
+        'text': True,
+        # Documents without a <body> tag are parsed in full, otherwise they would lose all their text
+        'requires': 'body',
+    },
+    'full': {
+        'parse_only': None,
+        'text': True,
+    },
+}
+DEFAULT_PARSE_PROFILE = os.environ.get('DEFAULT_PARSE_PROFILE', 'text+links')
+
+_strainers = {name: SoupStrainer(profile['parse_only'])
+              for name, profile in PARSE_PROFILES.items() if profile['parse_only']}
+
+
+def get_profile(name=None) -> str:
+    """Return a valid profile name, falling back to DEFAULT_PARSE_PROFILE for missing or unknown names"""
+    if not name:
+        name = DEFAULT_PARSE_PROFILE
+    if name not in PARSE_PROFILES:
+        print(f'Unknown parse profile {name}, using {DEFAULT_PARSE_PROFILE}')
+        name = DEFAULT_PARSE_PROFILE if DEFAULT_PARSE_PROFILE in PARSE_PROFILES else 'full'
+    return name
+
+
+def includes_text(profile) -> bool:
+    return PARSE_PROFILES[get_profile(profile)]['text']
+
+
+def parse(html, profile=None, features='html.parser'):
+    """Parse html into a BeautifulSoup object holding only what the profile needs"""
+    profile = get_profile(profile)
+    strainer = _strainers.get(profile)
+    if strainer is None:
+        return BeautifulSoup(html, features)
+
+    soup = BeautifulSoup(html, features, parse_only=strainer)
+    required = PARSE_PROFILES[profile].get('requires')
+    if required and soup.find(required, recursive=False) is None:
+        return BeautifulSoup(html, features)
+    return soup
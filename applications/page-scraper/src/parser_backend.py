@@ -0,0 +1,108 @@
+"""
+Parser backend selection for BeautifulSoup.
+bs4 registers a tree builder for every parser library it can import (html.parser
+always, lxml and html5lib when installed). With PARSER_BACKEND=auto the fastest
+available builder is picked once per container by timing each on a small sample
+page, and only among builders whose output agrees with html.parser on that sample.
+A backend can also be forced through PARSER_BACKEND or per job.
+"""
+
+import os
+import time
+
+from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+
+# Backends in order of preference when timings are equal
+BACKENDS = ('lxml', 'html.parser', 'html5lib')
+REFERENCE_BACKEND = 'html.parser'
+# 'auto' or one of BACKENDS
+PARSER_BACKEND = os.environ.get('PARSER_BACKEND', 'auto').lower()
+PARSER_BENCHMARK_ROUNDS = int(os.environ.get('PARSER_BENCHMARK_ROUNDS', '3'))
+
+_selected = None
+_stats = {'backend': None, 'selected_by': None, 'timings_ms': {}, 'rejected': []}
+
+
+def _sample_page(items=40):
+    parts = ['<!DOCTYPE html><html><head><title>Sample &amp; page</title>'
+             '<meta charset="utf-8"><script>var x = "<a href=/no>";</script></head><body>']
+    for i in range(items):
+        parts.append(f'<div class="card"><h2>Work {i}</h2><p>Oil on canvas &#8211; {i} &copy; '
+                     f'<a href="/work/{i}?s=1" rel="nofollow">view <b>work</b></a></p>'
+                     f'<ul><li>one</li><li>two <br> three</li></ul><img src="/img/{i}.jpg" alt=""></div>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+SAMPLE_PAGE = _sample_page()
+
+
+def available_backends() -> list:
+    """Backends whose parser library bs4 could import, in BACKENDS order"""
+    return [name for name in BACKENDS if builder_registry.builders_for_feature.get(name)]
+
+
+def signature(soup) -> tuple:
+    """What extraction depends on: link targets in order and the document's text"""
+    return ([tag['href'] for tag in soup.find_all('a', href=True)], list(soup.stripped_strings))
+
+
+def agrees(html, backend, reference=REFERENCE_BACKEND) -> bool:
+    """True if the backend yields the same links and text as the reference backend"""
+    return signature(BeautifulSoup(html, backend)) == signature(BeautifulSoup(html, reference))
+
+
+def time_backend(backend, html, rounds) -> float:
+    """Best of rounds CPU seconds to parse html with the backend"""
+    best = None
+    for _ in range(rounds):
+        start = time.process_time()
+        BeautifulSoup(html, backend)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def select_backend(html=SAMPLE_PAGE, rounds=PARSER_BENCHMARK_ROUNDS) -> str:
+    """Time every available backend that agrees with the reference and return the fastest"""
+    timings = {}
+    for backend in available_backends():
+        if backend != REFERENCE_BACKEND and not agrees(html, backend):
+            _stats['rejected'].append(backend)
+            continue
+        timings[backend] = time_backend(backend, html, rounds)
+    _stats['timings_ms'] = {backend: round(seconds * 1000, 2) for backend, seconds in timings.items()}
+    return min(timings, key=lambda backend: (timings[backend], BACKENDS.index(backend)))
+
+
+def get_backend(override=None) -> str:
+    """
+    Return the bs4 features string to parse with. override (a per job setting) and
+    PARSER_BACKEND take precedence when the named backend is installed; otherwise the
+    backend chosen by the cold start benchmark is used.
+    """
+    global _selected
+    for requested in (override, PARSER_BACKEND):
+        if requested and requested != 'auto':
+            if requested in available_backends():
+                return requested
+            print(f'Parser backend {requested} is not available, choosing automatically')
+
+    if _selected is None:
+        backends = available_backends()
+        if len(backends) == 1:
+            _selected, _stats['selected_by'] = backends[0], 'only available'
+        else:
+            try:
+                _selected, _stats['selected_by'] = select_backend(), 'benchmark'
+            except Exception as e:
+                print(f'Error benchmarking parser backends: {e}')
+                _selected, _stats['selected_by'] = REFERENCE_BACKEND, 'default'
+        _stats['backend'] = _selected
+        print(f'Parser backend: {_selected} ({_stats["selected_by"]}) timings {_stats["timings_ms"]}')
+    return _selected
+
+
+def get_stats() -> dict:
+    return dict(_stats, available=available_backends())
@@ -0,0 +1,204 @@
+"""
+Retry and circuit breaker policy for page fetches.
+Transient failures are retried inside the invocation with jittered backoff,
+permanent failures are reported immediately, and hosts that keep failing are
+skipped for a cool-down period shared between Lambda instances through DynamoDB.
+"""
+
+import os
+import time
+
+import boto3
+import requests
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NameResolutionError
+from urllib3.util.retry import Retry
+
+dynamodb = boto3.resource('dynamodb')
+
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', '3'))
+FETCH_BACKOFF_FACTOR = float(os.environ.get('FETCH_BACKOFF_FACTOR', '0.5'))
+FETCH_BACKOFF_JITTER = float(os.environ.get('FETCH_BACKOFF_JITTER', '0.5'))
+FETCH_BACKOFF_MAX = float(os.environ.get('FETCH_BACKOFF_MAX', '10'))
+# Never sleep longer than this on a Retry-After header, the Lambda timeout is the real limit
+RETRY_AFTER_MAX = float(os.environ.get('RETRY_AFTER_MAX', '15'))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN_SECONDS = int(os.environ.get('CIRCUIT_COOLDOWN_SECONDS', '600'))
+
+RETRYABLE_STATUS_CODES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+ERROR_RETRYABLE = 'retryable'
+ERROR_PERMANENT = 'permanent'
+ERROR_CIRCUIT_OPEN = 'circuit_open'
+
+# Open circuits seen by this container, so a cold host is not re-read for every URL
+_open_circuits = {}
+# Last failure count read per domain, so healthy hosts never cost a write on success
+_failure_counts = {}
+
+
+class FetchRetry(Retry):
+    """
+    Retry that honours Retry-After but caps it, so a server asking for an hour
+    does not hold the invocation until the Lambda timeout.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX)
+
+
+def build_retry() -> Retry:
+    return FetchRetry(
+        total=FETCH_RETRIES,
+        connect=FETCH_RETRIES,
+        read=FETCH_RETRIES,
+        status=FETCH_RETRIES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        status_forcelist=RETRYABLE_STATUS_CODES,
+        backoff_factor=FETCH_BACKOFF_FACTOR,
+        backoff_max=FETCH_BACKOFF_MAX,
+        backoff_jitter=FETCH_BACKOFF_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def build_session() -> requests.Session:
+    """Create a requests session whose adapters retry with the fetch policy"""
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=build_retry())
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def classify_status(status_code: int) -> str:
+    if status_code in RETRYABLE_STATUS_CODES:
+        return ERROR_RETRYABLE
+    return ERROR_PERMANENT
+
+
+def _is_name_resolution_failure(exc: Exception) -> bool:
+    if not isinstance(exc, requests.exceptions.ConnectionError) or not exc.args:
+        return False
+    return isinstance(getattr(exc.args[0], 'reason', None), NameResolutionError)
+
+
+def classify_exception(exc: Exception) -> str:
+    """
+    Decide whether a failed fetch is worth trying again later.
+    Bad URLs, client errors, unresolvable hosts and certificate problems will fail the same way every time.
+    """
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return classify_status(exc.response.status_code)
+    if _is_name_resolution_failure(exc):
+        return ERROR_PERMANENT
+    if isinstance(exc, (requests.exceptions.InvalidURL,
+                        requests.exceptions.MissingSchema,
+                        requests.exceptions.InvalidSchema,
+                        requests.exceptions.SSLError,
+                        requests.exceptions.TooManyRedirects)):
+        return ERROR_PERMANENT
+    if isinstance(exc, requests.exceptions.RequestException):
+        return ERROR_RETRYABLE
+    return ERROR_PERMANENT
+
+
+def counts_against_host(exc: Exception) -> bool:
+    """
+    Only failures that say something about the host itself trip the circuit.
+    A 404 on one page says nothing about the rest of the site, a host that no longer resolves does.
+    """
+    return _is_name_resolution_failure(exc) or classify_exception(exc) == ERROR_RETRYABLE
+
+
+# region circuit breaker
+def _state_table():
+    table_name = os.environ.get('CRAWL_STATE_TABLE_NAME', 'scraper-crawl-state')
+    return dynamodb.Table(table_name)
+
+
+def _circuit_key(domain):
+    return f'circuit#{domain}'
+
+
+def circuit_open_until(domain) -> int:
+    """
+    Return the timestamp until which the domain's circuit is open, or 0 if requests may proceed.
+    Fails open: if the state table cannot be read the fetch goes ahead.
+    """
+    now = int(time.time())
+    cached = _open_circuits.get(domain, 0)
+    if cached > now:
+        return cached
+
+    try:
+        response = _state_table().get_item(Key={'state_key': _circuit_key(domain)})
+        item = response.get('Item', {})
+        opened_until = int(item.get('opened_until', 0))
+        _failure_counts[domain] = int(item.get('failures', 0))
+    except Exception as e:
+        print(f'Error reading circuit state for {domain}: {e}')
+        return 0
+
+    if opened_until > now:
+        _open_circuits[domain] = opened_until
+        return opened_until
+    _open_circuits.pop(domain, None)
+    return 0
+
+
+def record_failure(domain):
+    """
+    Count a host-level failure and open the circuit once the threshold is reached.
+    After the cool-down one request is let through; if it fails again the circuit re-opens straight away.
+    """
+    now = int(time.time())
+    try:
+        table = _state_table()
+        response = table.update_item(
+            Key={'state_key': _circuit_key(domain)},
+            UpdateExpression='ADD failures :one SET last_failure = :now',
+            ExpressionAttributeValues={':one': 1, ':now': now},
+            ReturnValues='UPDATED_NEW'
+        )
+        failures = int(response['Attributes']['failures'])
+        _failure_counts[domain] = failures
+        if failures >= CIRCUIT_FAILURE_THRESHOLD:
+            opened_until = now + CIRCUIT_COOLDOWN_SECONDS
+            table.update_item(
+                Key={'state_key': _circuit_key(domain)},
+                UpdateExpression='SET opened_until = :until',
+                ExpressionAttributeValues={':until': opened_until}
+            )
+            _open_circuits[domain] = opened_until
+            print(f'Circuit opened for {domain} after {failures} failures, cooling down until {opened_until}')
+    except Exception as e:
+        print(f'Error recording failure for {domain}: {e}')
+
+
+def record_success(domain):
+    """Close the circuit for the domain. Writes only if there were failures to clear."""
+    if not _failure_counts.get(domain):
+        return
+    try:
+        _state_table().update_item(
+            Key={'state_key': _circuit_key(domain)},
+            UpdateExpression='SET failures = :zero, opened_until = :zero',
+            ConditionExpression='failures > :zero',
+            ExpressionAttributeValues={':zero': 0}
+        )
+        print(f'Circuit closed for {domain}')
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f'Error recording success for {domain}: {e}')
+    except Exception as e:
+        print(f'Error recording success for {domain}: {e}')
+    _open_circuits.pop(domain, None)
+    _failure_counts[domain] = 0
+# endregion circuit breaker
@@ -0,0 +1,199 @@
+"""
+Rolling NDJSON segments of page records per domain.
+Instead of one S3 object per page, records are buffered and written as segments:
+    segments/<domain>/<crawl id>/<segment id>.ndjson.gz
+    segments/<domain>/<crawl id>/<segment id>.index.json
+A segment is the concatenation of one gzip member per record, each holding one
+compact JSON line, so the whole object decompresses as ordinary gzipped NDJSON while
+a single record can be fetched with a range request. The index maps every page URL
+in the segment to [offset, length] of its member.
+
+A segment rolls over at SEGMENT_MAX_RECORDS records or SEGMENT_MAX_BYTES compressed
+bytes; flush() writes whatever is still buffered. The scraper flushes before its
+handler returns, which is when SQS deletes the messages, so a record is never
+acknowledged before it is in S3. A segment that cannot be written falls back to one
+page_store object per record; if that fails too, SegmentFlushError names the pages
+that were not stored. flush() still tries every open segment and leaves none open,
+so nothing of a failed batch is written by a later invocation.
+"""
+
+import gzip
+import json
+import os
+import time
+import uuid
+import zlib
+from urllib.parse import urlparse
+
+import boto3
+
+import page_store
+
+s3 = boto3.client('s3')
+
+SEGMENT_PREFIX = os.environ.get('SEGMENT_PREFIX', 'segments')
+SEGMENT_MAX_RECORDS = int(os.environ.get('SEGMENT_MAX_RECORDS', '5000'))
+SEGMENT_MAX_BYTES = int(os.environ.get('SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+CONTENT_TYPE = 'application/x-ndjson'
+SEGMENT_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.index.json'
+
+# Open segments of this container by (domain, crawl id)
+_open = {}
+_stats = {'records': 0, 'segments': 0, 'segment_bytes': 0, 'fallback_records': 0, 'failed_records': 0}
+
+
+class SegmentFlushError(Exception):
+    """Buffered records could not be stored; page_urls are the pages they belong to"""
+
+    def __init__(self, page_urls, cause):
+        super().__init__(f'{len(page_urls)} records not stored: {cause}')
+        self.page_urls = page_urls
+
+
+def segment_key(domain, crawl_id, segment_id) -> str:
+    return f'{SEGMENT_PREFIX}/{domain}/{crawl_id}/{segment_id}{SEGMENT_SUFFIX}'
+
+
+def index_key(key) -> str:
+    return key[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def encode_member(record) -> bytes:
+    """One record as a gzip member holding a single NDJSON line"""
+    return gzip.compress(page_store.serialize(record) + b'\n', compresslevel=page_store.PAGE_COMPRESSION_LEVEL,
+                         mtime=0)
+
+
+def _new_segment(domain, crawl_id):
+    # Millisecond time first so a crawl's segments list in the order they were written
+    segment_id = f'{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}'
+    return {'key': segment_key(domain, crawl_id, segment_id), 'members': [], 'size': 0, 'index': {}}
+
+
+def append_record(record, bucket=None) -> str:
+    """
+    Buffer a record ({'page_url', 'crawl_id', ...}) in its domain's open segment.
+    Returns the key of the segment it will be written to.
+    """
+    domain = urlparse(record['page_url']).netloc.lower() or 'unknown'
+    crawl_id = record.get('crawl_id') or 'unknown'
+    segment = _open.get((domain, crawl_id))
+    if segment is None:
+        segment = _open[(domain, crawl_id)] = _new_segment(domain, crawl_id)
+    member = encode_member(record)
+    segment['index'][record['page_url']] = [segment['size'], len(member)]
+    segment['members'].append(member)
+    segment['size'] += len(member)
+    _stats['records'] += 1
+    key = segment['key']
+    if len(segment['members']) >= SEGMENT_MAX_RECORDS or segment['size'] >= SEGMENT_MAX_BYTES:
+        del _open[(domain, crawl_id)]
+        _write_segment(segment, bucket)
+    return key
+
+
+def append(page_url, data, crawl_id, bucket=None) -> str:
+    """Buffer one scraped page, the segment counterpart of page_store.store_page"""
+    return append_record(page_store.page_record(page_url, data, crawl_id), bucket)
+
+
+def _write_segment(segment, bucket=None):
+    bucket = bucket or page_store.PAGE_BUCKET
+    body = b''.join(segment['members'])
+    try:
+        s3.put_object(Bucket=bucket, Key=segment['key'], Body=body, ContentType=CONTENT_TYPE,
+                      ContentEncoding='gzip')
+    except Exception as e:
+        print(f'Error writing segment {segment["key"]}, storing its {len(segment["members"])} records one by one: {e}')
+        try:
+            for member in segment['members']:
+                record = json.loads(gzip.decompress(member))
+                page_store.store_page(record['page_url'], record['data'], record['crawl_id'])
+                _stats['fallback_records'] += 1
+        except Exception as fallback_error:
+            # Some may be stored already, storing them again when re-scraped only overwrites them
+            _stats['failed_records'] += len(segment['index'])
+            raise SegmentFlushError(list(segment['index']), fallback_error)
+        return None
+    _stats['segments'] += 1
+    _stats['segment_bytes'] += len(body)
+    try:
+        s3.put_object(Bucket=bucket, Key=index_key(segment['key']), ContentType='application/json',
+                      Body=json.dumps(segment['index'], separators=(',', ':')).encode('utf-8'))
+    except Exception as e:
+        # The segment itself is stored; its index can be rebuilt with build_index
+        print(f'Error writing index of segment {segment["key"]}: {e}')
+    return segment['key']
+
+
+def flush(bucket=None) -> list:
+    """
+    Write every open segment. Returns the keys written, or raises SegmentFlushError with
+    the pages of every segment that could not be stored after trying all of them.
+    """
+    written = []
+    unstored = []
+    cause = None
+    while _open:
+        _, segment = _open.popitem()
+        try:
+            key = _write_segment(segment, bucket)
+        except SegmentFlushError as e:
+            unstored.extend(e.page_urls)
+            cause = e
+            continue
+        if key:
+            written.append(key)
+    if unstored:
+        raise SegmentFlushError(unstored, cause)
+    return written
+
+
+def discard() -> list:
+    """Drop every open segment without writing it. Returns the pages of the dropped records."""
+    page_urls = [url for segment in _open.values() for url in segment['index']]
+    _open.clear()
+    return page_urls
+
+
+def pending_records() -> int:
+    return sum(len(segment['members']) for segment in _open.values())
+
+
+# region reader
+def iter_segment(key, bucket=None):
+    """Stream the records of a segment in the order they were written"""
+    response = s3.get_object(Bucket=bucket or page_store.PAGE_BUCKET, Key=key)
+    with gzip.GzipFile(fileobj=response['Body'], mode='rb') as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_index(body) -> dict:
+    """Rebuild a segment's index from its bytes by walking its gzip members"""
+    index = {}
+    offset = 0
+    while offset < len(body):
+        decompressor = zlib.decompressobj(31)
+        line = decompressor.decompress(body[offset:])
+        length = len(body) - offset - len(decompressor.unused_data)
+        index[json.loads(line)['page_url']] = [offset, length]
+        offset += length
+    return index
+
+
+def list_segments(domain, crawl_id=None, bucket=None):
+    """Yield the segment keys of a domain, of one crawl or all of them"""
+    prefix = f'{SEGMENT_PREFIX}/{domain.lower()}/' + (f'{crawl_id}/' if crawl_id else '')
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket or page_store.PAGE_BUCKET, Prefix=prefix):
+        for item in page.get('Contents', []):
+            if item['Key'].endswith(SEGMENT_SUFFIX):
+                yield item['Key']
+# endregion
+
+
+def get_stats() -> dict:
+    return dict(_stats, open_segments=len(_open), pending_records=pending_records())
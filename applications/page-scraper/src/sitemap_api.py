@@ -0,0 +1,311 @@
+"""
+Read API for the dashboard's sitemaps (API Gateway proxy integration), so the
+dashboard no longer reads whole sitemap items from DynamoDB:
+    GET ?website_domain=<domain>
+        &prefix=<url prefix>          only pages whose URL starts with it
+        &depth=<n> / &max_depth=<n>   only pages at (or up to) that link depth
+        &fields=links,in_degree,...   what to return per page (default: links)
+        &since=<version>              only pages changed after that sitemap version
+        &after=<url>&limit=<n>        pagination: pass the previous page's "next"
+Responses carry the sitemap version as their ETag and answer 304 to a matching
+If-None-Match, so polling an unchanged site costs nothing.
+
+Pages are served from an in-memory cache per domain (SITEMAP_API_CACHE_DOMAINS,
+least recently used out): the sorted URLs, and links as delta encoded ids of the
+domain's URL dictionary (graph_codec) where every link has an id. The cache
+checks the head item's version at most every SITEMAP_API_CACHE_SECONDS. While a
+crawl writes, the version moves on all the time, so the head's write counters
+(see sitemap_store) decide which items changed and only those are read again;
+the whole sitemap is read when writes were not counted or the sitemap was
+replaced. Entries that differ between two loads are remembered with the version
+they changed in, which answers "since"; a "since" older than the first version
+an instance loaded gets "reset": true and every page, and the client starts over
+from the returned version. Depths and degrees
+come from graph_metrics, as of its last update.
+"""
+
+import bisect
+import json
+import os
+import time
+from collections import OrderedDict
+
+import graph_codec
+import graph_metrics
+import sitemap_store
+
+SITEMAP_API_CACHE_SECONDS = int(os.environ.get('SITEMAP_API_CACHE_SECONDS', '30'))
+SITEMAP_API_CACHE_DOMAINS = int(os.environ.get('SITEMAP_API_CACHE_DOMAINS', '20'))
+SITEMAP_API_PAGE_SIZE = int(os.environ.get('SITEMAP_API_PAGE_SIZE', '500'))
+SITEMAP_API_MAX_PAGE_SIZE = int(os.environ.get('SITEMAP_API_MAX_PAGE_SIZE', '5000'))
+SITEMAP_API_ORIGIN = os.environ.get('SITEMAP_API_ORIGIN', '*')
+FIELDS = ('links', 'in_degree', 'out_degree', 'depth', 'pagerank')
+METRIC_FIELDS = ('in_degree', 'out_degree', 'depth', 'pagerank')
+
+_cache = OrderedDict()  # domain -> {version, writes, items, checked_at, base_version, urls, entries, changed, removed, metrics}
+_stats = {'requests': 0, 'not_modified': 0, 'loads': 0, 'partial_loads': 0, 'items_read': 0, 'version_checks': 0}
+
+
+class RequestError(Exception):
+    pass
+
+
+# region cache
+def _compact(dictionary, value):
+    """A stored entry value as compact as possible: URL lists become encoded ids when every link has one"""
+    if isinstance(value, list):
+        ids = [dictionary.id(link) for link in value]
+        if None in ids:
+            return tuple(value)
+        return graph_codec.encode_ids(ids)
+    # Encoded ids and S3 pointers are kept as stored
+    return value
+
+
+def _changed_shards(previous, state):
+    """The shards written since previous was loaded, or None if only a whole read can tell"""
+    old = previous['writes']
+    new = state['writes']
+    # A counter that went down or away belongs to a replaced sitemap
+    if any(new.get(shard, 0) < count for shard, count in old.items()):
+        return None
+    # Every write moves the version by one and counts at least one item, fewer counts
+    # mean a writer that does not count them
+    if sum(new.values()) - sum(old.values()) < state['version'] - previous['version']:
+        return None
+    return sorted(shard for shard in new if new[shard] != old.get(shard, 0))
+
+
+def _load(domain, previous):
+    """
+    A domain's sitemap for the cache, or None if it has none. With the previously cached copy
+    only the items written since are read; the same copy is returned if nothing was written.
+    """
+    # The head item holds the version and write counters, and the entries of a site that is not sharded
+    state = sitemap_store.read_state(domain)
+    _stats['version_checks'] += 1
+    if state is None:
+        return None
+    shards = None
+    if previous is not None:
+        if state['version'] == previous['version']:
+            previous['checked_at'] = time.time()
+            return previous
+        shards = _changed_shards(previous, state)
+
+    dictionary = sitemap_store.load_dictionary(domain)
+    if shards is None:
+        read = sitemap_store.read_items(domain, head=state['head'])
+        _stats['loads'] += 1
+        # Items that are gone count as read too, their entries were removed
+        shards = sorted(set(read) | set(previous['items'] if previous is not None else ()))
+        items = {}
+    else:
+        read = sitemap_store.read_items(domain, shards, head=state['head'])
+        _stats['partial_loads'] += 1
+        items = dict(previous['items'])
+    _stats['items_read'] += len(read)
+    version = state['version']
+    writes = state['writes']
+
+    for shard in shards:
+        if shard in read:
+            items[shard] = {url: _compact(dictionary, value)
+                            for url, value in read[shard].get('sitemap', {}).items()}
+        else:
+            # A counted shard that is not there yet is read again once it is written to
+            items.pop(shard, None)
+    entries = sitemap_store.merge_items({shard: {'sitemap': item} for shard, item in items.items()})
+
+    if previous is None:
+        changed = {}
+        removed = {}
+        base_version = version
+        urls = sorted(entries)
+    else:
+        changed = dict(previous['changed'])
+        removed = dict(previous['removed'])
+        # Only entries of the items read again can differ from the previous copy
+        candidates = set()
+        urls_changed = False
+        for shard in shards:
+            candidates.update(items.get(shard, {}))
+            candidates.update(previous['items'].get(shard, {}))
+        for url in candidates:
+            if url not in entries:
+                if url in previous['entries']:
+                    removed[url] = version
+                    changed.pop(url, None)
+                    urls_changed = True
+            elif previous['entries'].get(url) != entries[url]:
+                changed[url] = version
+                removed.pop(url, None)
+                urls_changed = urls_changed or url not in previous['entries']
+        base_version = previous['base_version']
+        # The sorted URLs only need rebuilding when pages came or went
+        urls = sorted(entries) if urls_changed else previous['urls']
+    return {
+        'version': version,
+        'writes': writes,
+        'items': items,
+        'checked_at': time.time(),
+        'base_version': base_version,
+        'urls': urls,
+        'entries': entries,
+        'changed': changed,
+        'removed': removed,
+        'metrics': None,
+    }
+
+
+def cached_sitemap(domain):
+    """The cached sitemap of a domain, brought up to date if its version moved on. None if it has none."""
+    cached = _cache.get(domain)
+    now = time.time()
+    if cached is not None and now - cached['checked_at'] < SITEMAP_API_CACHE_SECONDS:
+        _cache.move_to_end(domain)
+        return cached
+    cached = _load(domain, cached)
+    if cached is None:
+        _cache.pop(domain, None)
+        return None
+    _cache[domain] = cached
+    _cache.move_to_end(domain)
+    while len(_cache) > SITEMAP_API_CACHE_DOMAINS:
+        _cache.popitem(last=False)
+    return cached
+
+
+def _metrics(domain, cached):
+    if cached['metrics'] is None:
+        cached['metrics'] = graph_metrics.read_metrics(domain)['nodes']
+    return cached['metrics']
+# endregion
+
+
+# region queries
+def _int_parameter(parameters, name, default=None):
+    value = parameters.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(f'{name} must be an integer')
+
+
+def query(domain, prefix='', depth=None, max_depth=None, fields=('links',), since=None, after=None, limit=None):
+    """
+    One page of a domain's sitemap:
+    {'website_domain', 'version', 'pages': [{'url', <fields>}], 'next', 'removed', 'reset'}
+    or None if the domain has no sitemap.
+    """
+    if limit is not None and limit < 1:
+        raise RequestError('limit must be at least 1')
+    cached = cached_sitemap(domain)
+    if cached is None:
+        return None
+    limit = min(limit or SITEMAP_API_PAGE_SIZE, SITEMAP_API_MAX_PAGE_SIZE)
+    reset = since is not None and since < cached['base_version']
+    incremental = since is not None and not reset
+    metrics = None
+    if depth is not None or max_depth is not None or any(field in METRIC_FIELDS for field in fields):
+        metrics = _metrics(domain, cached)
+
+    urls = cached['urls']
+    # Sorted URLs: the prefix is a contiguous range, the cursor a position in it
+    start = bisect.bisect_left(urls, prefix)
+    if after is not None and after >= prefix:
+        start = bisect.bisect_right(urls, after)
+    pages = []
+    next_url = None
+    for index in range(start, len(urls)):
+        url = urls[index]
+        if not url.startswith(prefix):
+            break
+        if incremental and cached['changed'].get(url, -1) <= since:
+            continue
+        if metrics is not None and (depth is not None or max_depth is not None):
+            page_depth = metrics.get(url, {}).get('depth')
+            if page_depth is None or depth is not None and page_depth != depth \
+                    or max_depth is not None and page_depth > max_depth:
+                continue
+        if len(pages) == limit:
+            next_url = pages[-1]['url']
+            break
+        page = {'url': url}
+        for field in fields:
+            if field == 'links':
+                page['links'] = sitemap_store.resolve_entry(domain, url, cached['entries'][url])
+            else:
+                page[field] = metrics.get(url, {}).get(field)
+        pages.append(page)
+
+    result = {'website_domain': domain, 'version': cached['version'], 'pages': pages, 'next': next_url}
+    if incremental:
+        result['removed'] = sorted(url for url, at in cached['removed'].items()
+                                   if at > since and url.startswith(prefix))
+    if reset:
+        result['reset'] = True
+    return result
+# endregion
+
+
+def _response(status, body, etag=None):
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': SITEMAP_API_ORIGIN,
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': 'no-cache',
+    }
+    if etag:
+        headers['ETag'] = etag
+    return {'statusCode': status, 'headers': headers, 'body': json.dumps(body) if body is not None else ''}
+
+
+def lambda_handler(event, context):
+    """API Gateway proxy handler, see the module docstring for the parameters"""
+    _stats['requests'] += 1
+    try:
+        parameters = dict(event.get('queryStringParameters') or {})
+        parameters.update(event.get('pathParameters') or {})
+        headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        domain = parameters.get('website_domain')
+        if not domain:
+            raise RequestError('website_domain required')
+        fields = tuple(field.strip() for field in parameters.get('fields', 'links').split(',') if field.strip())
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise RequestError(f'Unknown fields {unknown}, expected some of {list(FIELDS)}')
+
+        cached = cached_sitemap(domain)
+        if cached is None:
+            return _response(404, {'error': f'No sitemap for {domain}'})
+        # The ETag is the sitemap version; the parameters are part of the URL, so caches key on them already
+        etag = f'"{cached["version"]}"'
+        if headers.get('if-none-match') == etag:
+            _stats['not_modified'] += 1
+            return _response(304, None, etag)
+
+        result = query(
+            domain,
+            prefix=parameters.get('prefix', ''),
+            depth=_int_parameter(parameters, 'depth'),
+            max_depth=_int_parameter(parameters, 'max_depth'),
+            fields=fields,
+            since=_int_parameter(parameters, 'since'),
+            after=parameters.get('after'),
+            limit=_int_parameter(parameters, 'limit'),
+        )
+        if result is None:
+            return _response(404, {'error': f'No sitemap for {domain}'})
+        return _response(200, result, f'"{result["version"]}"')
+    except RequestError as e:
+        return _response(400, {'error': str(e)})
+    except Exception as e:
+        print(f'Error reading sitemap: {e}')
+        return _response(500, {'error': f'Error reading sitemap: {str(e)}'})
+
+
+def get_stats() -> dict:
+    return dict(_stats, cached_domains=len(_cache))
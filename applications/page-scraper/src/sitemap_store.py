@@ -0,0 +1,860 @@
+"""
+Sitemap storage that outgrows DynamoDB's 400 KB item limit.
+A domain's sitemap ({page url: [internal links]}) starts out in its head item of the
+website-sitemaps table, exactly as before, so small sites look the same to every reader:
+    website_domain=<domain>                  sitemap, version, item_bytes, last_updated, writes0
+Once that item is full, its entries move by URL hash into shard items of the
+website-sitemap-parts table (SITEMAP_PARTS_TABLE_NAME), which holds everything of a
+domain besides its head, so a scan of website-sitemaps still finds one item per domain:
+    website_domain=<domain> part=shard#<n>   sitemap, item_bytes, last_updated
+The head then keeps no entries but the hash depth the move started at, the version
+and the write counters. Shard n at depth d (n = 2**d plus the first d bits of the
+SHA-256 of the URL) holds the URLs whose hash starts with those bits; a shard that
+fills up splits into shards 2n and 2n + 1 by the next bit and stays behind, empty,
+as a split marker. Every URL is therefore in exactly one shard, reached from its
+shard at the head's depth by following split markers, so checking or writing one
+entry is one item read or one conditional write whatever the size of the site. A
+move or split left unfinished by a failed writer is finished by the next one; while
+a shard splits its entries can be in it and in a child, the child's copy wins.
+An entry too large for any item (a page linking to thousands of pages) is stored
+as gzipped JSON in S3 with {'s3_key': ...} in place of its links.
+
+Entries are written one by one with nested updates (SET sitemap.#url) instead of
+rewriting the whole map. Every write adds its estimated size to the item's item_bytes,
+so an item is split before DynamoDB rejects it; a rejected write splits it too. Every
+write also increments the head item's version and the write counter of the item it
+changed (writesN for shard N), so a reader holding a copy can tell from the head alone
+which items to read again (read_state, read_items).
+
+With SITEMAP_ENCODING=graph, links are stored as graph_codec delta encoded ids
+(binary) instead of URL lists. The ids come from the domain's URL dictionary, kept
+append only in chunk items of SITEMAP_DICT_CHUNK entries:
+    website_domain=<domain> part=urls#<n>    urls (relative to the domain, position = id)
+Appends are conditional on the chunk's length, so an id never changes once given out.
+An entry that cannot be encoded falls back to its URL list.
+
+read_sitemap() reassembles head, shards and S3 entries into the shape of the
+original item ({'website_domain', 'sitemap', 'version', 'last_updated'}), so the
+scraper and sitemap_api read large and small sites through the same interface.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+import graph_codec
+
+dynamodb = boto3.resource('dynamodb')
+s3 = boto3.client('s3')
+
+SITEMAP_TABLE_NAME = os.environ.get('SITEMAP_TABLE_NAME', 'website-sitemaps')
+SITEMAP_PARTS_TABLE_NAME = os.environ.get('SITEMAP_PARTS_TABLE_NAME', 'website-sitemap-parts')
+SITEMAP_BUCKET = os.environ.get('SITEMAP_BUCKET', 'artist-scraped-data')
+SITEMAP_KEY_PREFIX = os.environ.get('SITEMAP_KEY_PREFIX', 'sitemaps')
+# Items are filled up to this many estimated bytes, well below the 400 KB DynamoDB allows
+SITEMAP_ITEM_BYTES = int(os.environ.get('SITEMAP_ITEM_BYTES', str(350 * 1024)))
+# Entries estimated larger than this are stored in S3 and referenced from the item
+SITEMAP_ENTRY_BYTES = int(os.environ.get('SITEMAP_ENTRY_BYTES', str(64 * 1024)))
+# A full head item moves its entries into 2**SITEMAP_HASH_DEPTH shards
+SITEMAP_HASH_DEPTH = int(os.environ.get('SITEMAP_HASH_DEPTH', '4'))
+# How old the URLs of a domain returned by known_urls(max_age=...) may be
+SITEMAP_KNOWN_URLS_SECONDS = int(os.environ.get('SITEMAP_KNOWN_URLS_SECONDS', '60'))
+# 'lists' stores links as URL lists, 'graph' as delta encoded ids of the URL dictionary
+SITEMAP_ENCODING = os.environ.get('SITEMAP_ENCODING', 'lists').lower()
+SITEMAP_DICT_CHUNK = int(os.environ.get('SITEMAP_DICT_CHUNK', '1024'))
+SHARD_PREFIX = 'shard#'
+DICTIONARY_PREFIX = 'urls#'
+WRITES_ATTRIBUTE = 'writes'
+HASH_BITS = 32
+SPILL_ATTEMPTS = 3
+BATCH_GET_KEYS = 100
+# Entries per update when copying entries into a shard that exists already
+COPY_ENTRIES_PER_UPDATE = 40
+# Writes to a shard only go through while it is not being split
+SHARD_OPEN = 'attribute_exists(sitemap) AND attribute_not_exists(#split) AND attribute_not_exists(#splitting)'
+SHARD_NAMES = {'#split': 'split', '#splitting': 'splitting'}
+
+# Per sharded domain: the hash depth of its head and the shards known to be split
+_layout = {}
+# Per domain: when this container last read its URLs, and the URLs (plus those it wrote since)
+_known = {}
+# URL dictionaries of the domains seen by this container, refreshed from their last chunk on use
+_dictionaries = {}
+_stats = {'reads': 0, 'item_reads': 0, 'writes': 0, 'spills': 0, 'splits': 0, 's3_entries': 0,
+          'encoded_entries': 0, 'dictionary_appends': 0}
+
+
+def _table():
+    return dynamodb.Table(SITEMAP_TABLE_NAME)
+
+
+def _parts_table():
+    return dynamodb.Table(SITEMAP_PARTS_TABLE_NAME)
+
+
+def part_key(domain, part) -> dict:
+    """The key of one of a domain's items in the parts table"""
+    return {'website_domain': domain, 'part': part}
+
+
+def shard_part(shard) -> str:
+    return f'{SHARD_PREFIX}{shard}'
+
+
+def shard_number(part) -> int:
+    return int(part[len(SHARD_PREFIX):])
+
+
+def _url_hash(url) -> int:
+    return int.from_bytes(hashlib.sha256(url.encode('utf-8')).digest()[:HASH_BITS // 8], 'big')
+
+
+def shard_of(url, depth) -> int:
+    """The shard holding a URL at the given hash depth"""
+    return (1 << depth) | (_url_hash(url) >> (HASH_BITS - depth))
+
+
+def _child(shard, url) -> int:
+    """The shard a URL moves to when its shard splits"""
+    depth = shard.bit_length() - 1
+    return 2 * shard + ((_url_hash(url) >> (HASH_BITS - depth - 1)) & 1)
+
+
+def writes_attribute(shard) -> str:
+    """The head item attribute counting the writes to one of the domain's items"""
+    return f'{WRITES_ATTRIBUTE}{shard}'
+
+
+def write_counts(head) -> dict:
+    """{shard: writes} of every item of a domain that was written, from its head item"""
+    counts = {}
+    for name, value in head.items():
+        if name.startswith(WRITES_ATTRIBUTE) and name[len(WRITES_ATTRIBUTE):].isdigit():
+            counts[int(name[len(WRITES_ATTRIBUTE):])] = int(value)
+    return counts
+
+
+def _binary(value):
+    """The bytes of a binary attribute value (boto3 reads them back as Binary), else None"""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if hasattr(value, 'value') and isinstance(value.value, (bytes, bytearray)):
+        return bytes(value.value)
+    return None
+
+
+def entry_bytes(url, links) -> int:
+    """Rough DynamoDB size of one sitemap entry: the name, every link and per element overhead"""
+    encoded = _binary(links)
+    if encoded is not None:
+        return len(url.encode('utf-8')) + 1 + len(encoded)
+    if isinstance(links, dict):
+        return len(url.encode('utf-8')) + 3 + sum(len(k) + len(str(v).encode('utf-8')) + 1
+                                                 for k, v in links.items())
+    return len(url.encode('utf-8')) + 3 + sum(len(link.encode('utf-8')) + 1 for link in links)
+
+
+def _is_size_error(e) -> bool:
+    error = e.response.get('Error', {})
+    return error.get('Code') == 'ValidationException' and 'size' in error.get('Message', '').lower()
+
+
+def _is_condition_error(e) -> bool:
+    return e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+# region S3 entries
+def entry_key(domain, url) -> str:
+    return f'{SITEMAP_KEY_PREFIX}/{domain}/{hashlib.sha256(url.encode("utf-8")).hexdigest()}.json.gz'
+
+
+def _store_entry(domain, url, links) -> dict:
+    key = entry_key(domain, url)
+    body = gzip.compress(json.dumps(links, separators=(',', ':')).encode('utf-8'), mtime=0)
+    s3.put_object(Bucket=SITEMAP_BUCKET, Key=key, Body=body, ContentType='application/json',
+                  ContentEncoding='gzip')
+    _stats['s3_entries'] += 1
+    return {'s3_key': key, 'count': len(links)}
+
+
+def _load_entry(pointer) -> list:
+    response = s3.get_object(Bucket=SITEMAP_BUCKET, Key=pointer['s3_key'])
+    return json.loads(gzip.decompress(response['Body'].read()))
+
+
+def entry_value(domain, url, links):
+    """What is stored in the map for an entry: the links, their encoded ids, or a pointer to them in S3"""
+    if SITEMAP_ENCODING == 'graph' and links:
+        try:
+            dictionary = assign_ids(domain, [url] + list(links))
+            encoded = graph_codec.encode_ids(dictionary.id(link) for link in links)
+        except Exception as e:
+            print(f'Error encoding sitemap entry {url}, storing its URL list: {e}')
+        else:
+            if entry_bytes(url, encoded) <= SITEMAP_ENTRY_BYTES:
+                _stats['encoded_entries'] += 1
+                return encoded
+    if entry_bytes(url, links) > SITEMAP_ENTRY_BYTES:
+        return _store_entry(domain, url, links)
+    return links
+# endregion
+
+
+# region URL dictionary
+def dictionary_part(chunk) -> str:
+    return f'{DICTIONARY_PREFIX}{chunk}'
+
+
+def load_dictionary(domain):
+    """A domain's URL dictionary, read from the chunk the cached copy ends in onwards"""
+    dictionary = _dictionaries.get(domain)
+    if dictionary is None:
+        dictionary = graph_codec.UrlDictionary(domain)
+    while True:
+        chunk = len(dictionary) // SITEMAP_DICT_CHUNK
+        item = _parts_table().get_item(Key=part_key(domain, dictionary_part(chunk))).get('Item')
+        _stats['item_reads'] += 1
+        stored = item.get('urls', []) if item else []
+        dictionary.extend_entries(stored[len(dictionary) - chunk * SITEMAP_DICT_CHUNK:])
+        if len(stored) < SITEMAP_DICT_CHUNK:
+            break
+    _dictionaries[domain] = dictionary
+    return dictionary
+
+
+def _append_entries(domain, chunk, offset, entries) -> bool:
+    """Append entries to a chunk that holds offset entries. False if the chunk changed meanwhile."""
+    try:
+        if offset == 0:
+            _parts_table().put_item(Item=dict(part_key(domain, dictionary_part(chunk)),
+                                              urls=entries, last_updated=int(time.time())),
+                                    ConditionExpression='attribute_not_exists(website_domain)')
+        else:
+            _parts_table().update_item(
+                Key=part_key(domain, dictionary_part(chunk)),
+                UpdateExpression='SET #urls = list_append(#urls, :entries), last_updated = :now',
+                ConditionExpression='size(#urls) = :offset',
+                ExpressionAttributeNames={'#urls': 'urls'},
+                ExpressionAttributeValues={':entries': entries, ':offset': offset, ':now': int(time.time())}
+            )
+    except ClientError as e:
+        if _is_condition_error(e):
+            return False
+        raise
+    _stats['dictionary_appends'] += 1
+    return True
+
+
+def assign_ids(domain, urls):
+    """Give every URL an id in the domain's dictionary. Returns the dictionary."""
+    dictionary = _dictionaries.get(domain)
+    if dictionary is None:
+        dictionary = load_dictionary(domain)
+    for _ in range(SPILL_ATTEMPTS + len(urls) // SITEMAP_DICT_CHUNK + 1):
+        missing = dictionary.missing(urls)
+        if not missing:
+            return dictionary
+        chunk, offset = divmod(len(dictionary), SITEMAP_DICT_CHUNK)
+        entries = missing[:SITEMAP_DICT_CHUNK - offset]
+        if _append_entries(domain, chunk, offset, entries):
+            dictionary.extend_entries(entries)
+        else:
+            # Another writer appended first, pick up its entries and try again
+            dictionary = load_dictionary(domain)
+    if dictionary.missing(urls):
+        raise RuntimeError(f'Could not assign ids to {len(dictionary.missing(urls))} URLs of {domain}')
+    return dictionary
+# endregion
+
+
+# region reader
+def _batch_get(domain, shards) -> dict:
+    """{shard: item} of the given shard items that exist"""
+    keys = [part_key(domain, shard_part(shard)) for shard in shards]
+    found = {}
+    for start in range(0, len(keys), BATCH_GET_KEYS):
+        request = {SITEMAP_PARTS_TABLE_NAME: {'Keys': keys[start:start + BATCH_GET_KEYS]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(SITEMAP_PARTS_TABLE_NAME, []):
+                found[shard_number(item['part'])] = item
+                _stats['item_reads'] += 1
+            request = response.get('UnprocessedKeys')
+    return found
+
+
+def _query_shards(domain, keys_only=False) -> dict:
+    """{shard: item} of all shard items of a domain, or just their keys"""
+    params = {
+        'KeyConditionExpression': 'website_domain = :domain AND begins_with(#part, :prefix)',
+        'ExpressionAttributeNames': {'#part': 'part'},
+        'ExpressionAttributeValues': {':domain': domain, ':prefix': SHARD_PREFIX},
+    }
+    if keys_only:
+        params['ProjectionExpression'] = 'website_domain, #part'
+    found = {}
+    while True:
+        response = _parts_table().query(**params)
+        for item in response.get('Items', []):
+            found[shard_number(item['part'])] = item
+            _stats['item_reads'] += 1
+        if 'LastEvaluatedKey' not in response:
+            return found
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def read_items(domain, shards=None, head=None) -> dict:
+    """
+    {shard: item} of a domain's items: the given shard numbers (0 is the head item) that
+    exist, or by default the head item and all its shards. Empty if the domain has no sitemap.
+    A head item the caller has just read is passed as head and not read again.
+    """
+    items = {}
+    if shards is None or 0 in shards:
+        if head is None:
+            head = _table().get_item(Key={'website_domain': domain}).get('Item')
+            _stats['item_reads'] += 1
+        if head is None:
+            return {}
+        items[0] = head
+    if shards is None:
+        if head.get('hash_depth') is not None:
+            items.update(_query_shards(domain))
+    else:
+        items.update(_batch_get(domain, [shard for shard in shards if shard != 0]))
+    return items
+
+
+def read_state(domain) -> dict:
+    """
+    The head item and the write counters on it, or None if the domain has no sitemap:
+    {'version', 'writes': {shard: writes}, 'head'}. Once sharded the head holds no entries.
+    """
+    head = _table().get_item(Key={'website_domain': domain}).get('Item')
+    _stats['item_reads'] += 1
+    if head is None:
+        return None
+    return {'version': int(head.get('version', 0)), 'writes': write_counts(head), 'head': head}
+
+
+def merge_items(items) -> dict:
+    """The entries of a domain's items {shard: item}; of an entry in a splitting shard and its child, the child's wins"""
+    sitemap = {}
+    for shard in sorted(items):
+        sitemap.update(items[shard].get('sitemap', {}))
+    return sitemap
+
+
+def read_sitemap(domain, resolve=True):
+    """
+    A domain's whole sitemap reassembled from its items, or None if it has none:
+    {'website_domain', 'sitemap', 'version', 'last_updated', 'shards'}.
+    With resolve=False entries stored in S3 are left as their pointers.
+    """
+    items = read_items(domain)
+    _stats['reads'] += 1
+    if not items:
+        _layout.pop(domain, None)
+        return None
+    head = items[0]
+    if head.get('hash_depth') is not None and not head.get('migrating'):
+        split = {shard for shard, item in items.items() if item.get('split')}
+        _layout[domain] = {'depth': int(head['hash_depth']), 'split': split}
+    else:
+        _layout.pop(domain, None)
+    sitemap = merge_items(items)
+    if resolve:
+        for url, links in sitemap.items():
+            sitemap[url] = resolve_entry(domain, url, links)
+    return {
+        'website_domain': domain,
+        'sitemap': sitemap,
+        'version': int(head.get('version', 0)),
+        'last_updated': head.get('last_updated'),
+        'shards': sum(1 for shard, item in items.items() if shard and not item.get('split')),
+    }
+
+
+def resolve_entry(domain, url, value) -> list:
+    """The links of a stored entry value: a URL list, encoded ids or a pointer to S3"""
+    encoded = _binary(value)
+    if encoded is not None:
+        dictionary = _dictionaries.get(domain)
+        if dictionary is None:
+            dictionary = load_dictionary(domain)
+        try:
+            return graph_codec.decode_links(dictionary, encoded)
+        except IndexError:
+            # Ids given out since the dictionary was loaded
+            return graph_codec.decode_links(load_dictionary(domain), encoded)
+    if isinstance(value, dict) and 's3_key' in value:
+        try:
+            return _load_entry(value)
+        except Exception as e:
+            print(f'Error reading sitemap entry {url} from S3: {e}')
+            return []
+    return list(value)
+
+
+def known_urls(domain, max_age=0) -> set:
+    """
+    The URLs of a domain's sitemap, without fetching entries from S3. With max_age, the
+    URLs this container read up to that many seconds ago, plus those it wrote since, do.
+    """
+    known = _known.get(domain)
+    if known is not None and time.time() - known[0] < max_age:
+        return set(known[1])
+    result = read_sitemap(domain, resolve=False)
+    urls = set(result['sitemap']) if result else set()
+    _known[domain] = (time.time(), urls)
+    return set(urls)
+
+
+def _find(domain, url, layout):
+    """The stored value of a URL in a sharded sitemap, or None: one item read per shard on its path"""
+    shard = shard_of(url, layout['depth'])
+    while True:
+        if shard in layout['split']:
+            shard = _child(shard, url)
+            continue
+        item = _parts_table().get_item(Key=part_key(domain, shard_part(shard)),
+                                       ProjectionExpression='#split, #splitting, sitemap.#url',
+                                       ExpressionAttributeNames=dict(SHARD_NAMES, **{'#url': url})).get('Item')
+        _stats['item_reads'] += 1
+        if item is None:
+            return None
+        if url in item.get('sitemap', {}):
+            return item['sitemap'][url]
+        if item.get('split'):
+            layout['split'].add(shard)
+        elif not item.get('splitting'):
+            return None
+        shard = _child(shard, url)
+
+
+def contains(domain, url) -> bool:
+    """Whether a domain's sitemap has an entry for the URL: one item read once the layout is known"""
+    layout = _layout.get(domain)
+    if layout is None:
+        names = {'#depth': 'hash_depth', '#migrating': 'migrating', '#url': url}
+        head = _table().get_item(Key={'website_domain': domain}, ProjectionExpression='#depth, #migrating, sitemap.#url',
+                                 ExpressionAttributeNames=names).get('Item')
+        _stats['item_reads'] += 1
+        if head is None:
+            return False
+        if url in head.get('sitemap', {}):
+            return True
+        if head.get('hash_depth') is None:
+            return False
+        layout = {'depth': int(head['hash_depth']), 'split': set()}
+        # While entries move out of the head, the next check has to look at it again
+        if not head.get('migrating'):
+            _layout[domain] = layout
+    return _find(domain, url, layout) is not None
+# endregion
+
+
+# region writer
+def _bump_version(domain, now, shards):
+    """Count a write to the given shard items on the head item"""
+    names = {f'#w{shard}': writes_attribute(shard) for shard in shards}
+    _table().update_item(
+        Key={'website_domain': domain},
+        UpdateExpression='SET last_updated = :now ADD version :one' + ''.join(f', {name} :one' for name in names),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={':now': now, ':one': 1}
+    )
+
+
+def _remember(domain, url, present):
+    known = _known.get(domain)
+    if known is not None:
+        if present:
+            known[1].add(url)
+        else:
+            known[1].discard(url)
+
+
+def _copy_entries(domain, shard, entries, now):
+    """
+    Add entries to a shard, keeping the values written to it since, or to its children
+    if it is split. Used to move entries out of a full head or a splitting shard.
+    """
+    if not entries:
+        return
+    key = part_key(domain, shard_part(shard))
+    try:
+        _parts_table().put_item(Item=dict(key, sitemap=entries, last_updated=now,
+                                          item_bytes=sum(entry_bytes(url, value) for url, value in entries.items())),
+                                ConditionExpression='attribute_not_exists(website_domain)')
+        return
+    except ClientError as e:
+        if not _is_condition_error(e):
+            raise
+    urls = sorted(entries)
+    for start in range(0, len(urls), COPY_ENTRIES_PER_UPDATE):
+        batch = urls[start:start + COPY_ENTRIES_PER_UPDATE]
+        names = dict(SHARD_NAMES)
+        values = {':now': now, ':size': sum(entry_bytes(url, entries[url]) for url in batch)}
+        clauses = []
+        for i, url in enumerate(batch):
+            names[f'#u{i}'] = url
+            values[f':v{i}'] = entries[url]
+            clauses.append(f'sitemap.#u{i} = if_not_exists(sitemap.#u{i}, :v{i})')
+        try:
+            _parts_table().update_item(
+                Key=key,
+                UpdateExpression='SET ' + ', '.join(clauses) + ', last_updated = :now ADD item_bytes :size',
+                ConditionExpression=SHARD_OPEN,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+        except ClientError as e:
+            # The shard exists, so a failed condition means it is split or being split
+            if _is_size_error(e):
+                _split(domain, shard, now)
+            elif _is_condition_error(e):
+                _finish_split(domain, shard, now)
+            else:
+                raise
+            rest = urls[start:]
+            for child in (2 * shard, 2 * shard + 1):
+                _copy_entries(domain, child, {url: entries[url] for url in rest if _child(shard, url) == child}, now)
+            return
+
+
+def _split(domain, shard, now):
+    """Split a full shard into shards 2n and 2n + 1 by the next bit of its URLs' hashes"""
+    if shard.bit_length() > HASH_BITS:
+        raise RuntimeError(f'Sitemap shard {shard} of {domain} cannot be split further')
+    try:
+        _parts_table().update_item(Key=part_key(domain, shard_part(shard)), UpdateExpression='SET #splitting = :true',
+                                   ConditionExpression=SHARD_OPEN, ExpressionAttributeNames=SHARD_NAMES,
+                                   ExpressionAttributeValues={':true': True})
+        _stats['splits'] += 1
+        print(f'Sitemap shard {shard} of {domain} split into shards {2 * shard} and {2 * shard + 1}')
+    except ClientError as e:
+        if not _is_condition_error(e):
+            raise
+    _finish_split(domain, shard, now)
+
+
+def _finish_split(domain, shard, now):
+    """Copy the entries of a splitting shard to its children and mark it split, unless that is done"""
+    key = part_key(domain, shard_part(shard))
+    item = _parts_table().get_item(Key=key, ConsistentRead=True).get('Item')
+    _stats['item_reads'] += 1
+    if item is None or not item.get('splitting'):
+        return
+    children = {2 * shard: {}, 2 * shard + 1: {}}
+    for url, value in item.get('sitemap', {}).items():
+        children[_child(shard, url)][url] = value
+    for child, entries in children.items():
+        _copy_entries(domain, child, entries, now)
+    try:
+        _parts_table().update_item(
+            Key=key,
+            UpdateExpression='SET #split = :true, sitemap = :empty, item_bytes = :zero, last_updated = :now '
+                             'REMOVE #splitting',
+            ConditionExpression='attribute_exists(#splitting)',
+            ExpressionAttributeNames=SHARD_NAMES,
+            ExpressionAttributeValues={':true': True, ':empty': {}, ':zero': 0, ':now': now}
+        )
+    except ClientError as e:
+        if _is_condition_error(e):
+            return
+        raise
+    _bump_version(domain, now, [shard, *children])
+    if domain in _layout:
+        _layout[domain]['split'].add(shard)
+
+
+def _shard_sitemap(domain, now):
+    """Move the entries of a full head item into 2**SITEMAP_HASH_DEPTH shards, unless another writer did"""
+    try:
+        _table().update_item(
+            Key={'website_domain': domain},
+            UpdateExpression='SET #depth = :depth, #migrating = :true',
+            ConditionExpression='attribute_not_exists(#depth)',
+            ExpressionAttributeNames={'#depth': 'hash_depth', '#migrating': 'migrating'},
+            ExpressionAttributeValues={':depth': SITEMAP_HASH_DEPTH, ':true': True}
+        )
+        _stats['spills'] += 1
+        print(f'Sitemap of {domain} moved into {2 ** SITEMAP_HASH_DEPTH} shards')
+    except ClientError as e:
+        if not _is_condition_error(e):
+            raise
+    _finish_migration(domain, now)
+
+
+def _finish_migration(domain, now):
+    """Copy the entries of a head item being sharded to their shards and empty it, unless that is done"""
+    head = _table().get_item(Key={'website_domain': domain}, ConsistentRead=True).get('Item')
+    _stats['item_reads'] += 1
+    if head is None or not head.get('migrating'):
+        return
+    depth = int(head['hash_depth'])
+    shards = {}
+    for url, value in head.get('sitemap', {}).items():
+        shards.setdefault(shard_of(url, depth), {})[url] = value
+    for shard, entries in shards.items():
+        _copy_entries(domain, shard, entries, now)
+    try:
+        _table().update_item(
+            Key={'website_domain': domain},
+            UpdateExpression='SET sitemap = :empty, item_bytes = :zero REMOVE #migrating',
+            ConditionExpression='attribute_exists(#migrating)',
+            ExpressionAttributeNames={'#migrating': 'migrating'},
+            ExpressionAttributeValues={':empty': {}, ':zero': 0}
+        )
+    except ClientError as e:
+        if _is_condition_error(e):
+            return
+        raise
+    _bump_version(domain, now, [0, *sorted(shards)])
+
+
+def _sharded_layout(domain, now):
+    """The layout of a domain whose head moved its entries into shards, finishing the move. None if it did not."""
+    head = _table().get_item(Key={'website_domain': domain}, ProjectionExpression='#depth, #migrating',
+                             ExpressionAttributeNames={'#depth': 'hash_depth', '#migrating': 'migrating'},
+                             ConsistentRead=True).get('Item')
+    _stats['item_reads'] += 1
+    if head is None or head.get('hash_depth') is None:
+        return None
+    if head.get('migrating'):
+        _finish_migration(domain, now)
+    layout = _layout.setdefault(domain, {'depth': int(head['hash_depth']), 'split': set()})
+    return layout
+
+
+def _leaf(url, layout) -> int:
+    """The shard of a URL as far as this container knows which shards are split"""
+    shard = shard_of(url, layout['depth'])
+    while shard in layout['split']:
+        shard = _child(shard, url)
+    return shard
+
+
+def _write_head(domain, url, value, size, only_new, now):
+    """
+    Set one entry in a head item that holds its domain's entries, creating it if needed.
+    True once written, False if only_new and the entry exists, None if the sitemap is sharded.
+    """
+    names = {'#url': url, '#depth': 'hash_depth', '#writes': writes_attribute(0)}
+    condition = 'attribute_exists(sitemap) AND attribute_not_exists(#depth)'
+    if only_new:
+        condition += ' AND attribute_not_exists(sitemap.#url)'
+    for _ in range(SPILL_ATTEMPTS):
+        try:
+            response = _table().update_item(
+                Key={'website_domain': domain},
+                UpdateExpression='SET sitemap.#url = :links, last_updated = :now '
+                                 'ADD item_bytes :size, version :one, #writes :one',
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':links': value, ':now': now, ':size': size, ':one': 1},
+                ReturnValues='UPDATED_NEW'
+            )
+            if int(response.get('Attributes', {}).get('item_bytes', 0)) > SITEMAP_ITEM_BYTES:
+                _shard_sitemap(domain, now)
+            return True
+        except ClientError as e:
+            if _is_size_error(e):
+                _shard_sitemap(domain, now)
+                return None
+            if not _is_condition_error(e):
+                raise
+        # The head does not exist yet, is sharded, or (with only_new) has the entry
+        head = _table().get_item(Key={'website_domain': domain}, ProjectionExpression='#depth, sitemap.#url',
+                                 ExpressionAttributeNames={'#depth': 'hash_depth', '#url': url},
+                                 ConsistentRead=True).get('Item')
+        _stats['item_reads'] += 1
+        if head is None:
+            try:
+                _table().put_item(Item={'website_domain': domain, 'sitemap': {url: value}, 'item_bytes': size,
+                                        'version': 1, writes_attribute(0): 1, 'last_updated': now},
+                                  ConditionExpression='attribute_not_exists(website_domain)')
+                return True
+            except ClientError as e:
+                if not _is_condition_error(e):
+                    raise
+        elif head.get('hash_depth') is not None:
+            return None
+        elif only_new and url in head.get('sitemap', {}):
+            return False
+    raise RuntimeError(f'Sitemap entry {url} of {domain} could not be written to its head item')
+
+
+def _write_shard(domain, url, value, size, only_new, now, layout) -> bool:
+    """Set one entry in the shard of its URL, following and making splits. False if only_new and it exists."""
+    shard = _leaf(url, layout)
+    names = dict(SHARD_NAMES, **{'#url': url})
+    condition = SHARD_OPEN
+    if only_new:
+        condition += ' AND attribute_not_exists(sitemap.#url)'
+    for _ in range(HASH_BITS):
+        key = part_key(domain, shard_part(shard))
+        try:
+            response = _parts_table().update_item(
+                Key=key,
+                UpdateExpression='SET sitemap.#url = :links, last_updated = :now ADD item_bytes :size',
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':links': value, ':now': now, ':size': size},
+                ReturnValues='UPDATED_NEW'
+            )
+            _bump_version(domain, now, [shard])
+            if int(response.get('Attributes', {}).get('item_bytes', 0)) > SITEMAP_ITEM_BYTES:
+                _split(domain, shard, now)
+            return True
+        except ClientError as e:
+            if _is_size_error(e):
+                _split(domain, shard, now)
+                layout['split'].add(shard)
+                shard = _child(shard, url)
+                continue
+            if not _is_condition_error(e):
+                raise
+        # The shard does not exist yet, is split or splitting, or (with only_new) has the entry
+        item = _parts_table().get_item(Key=key, ProjectionExpression='#split, #splitting, sitemap.#url',
+                                       ExpressionAttributeNames=names, ConsistentRead=True).get('Item')
+        _stats['item_reads'] += 1
+        if item is None:
+            try:
+                _parts_table().put_item(Item=dict(key, sitemap={url: value}, item_bytes=size, last_updated=now),
+                                        ConditionExpression='attribute_not_exists(website_domain)')
+                _bump_version(domain, now, [shard])
+                return True
+            except ClientError as e:
+                if not _is_condition_error(e):
+                    raise
+            continue
+        if only_new and url in item.get('sitemap', {}):
+            return False
+        if item.get('splitting'):
+            _finish_split(domain, shard, now)
+        if item.get('split') or item.get('splitting'):
+            layout['split'].add(shard)
+            shard = _child(shard, url)
+    raise RuntimeError(f'Sitemap entry {url} of {domain} could not be written to its shard')
+
+
+def put_entry(domain, url, links, only_new=False) -> bool:
+    """
+    Store one sitemap entry in the head item, or once the sitemap is sharded in the shard its
+    URL hashes to. With only_new the write is conditional on the entry not existing, so it
+    is a lock: it fails (returns False) if the entry exists.
+    """
+    value = entry_value(domain, url, links)
+    size = entry_bytes(url, value)
+    now = int(time.time())
+    layout = _layout.get(domain)
+    written = None
+    if layout is None:
+        written = _write_head(domain, url, value, size, only_new, now)
+        if written is None:
+            layout = _sharded_layout(domain, now)
+    if written is None:
+        written = _write_shard(domain, url, value, size, only_new, now, layout)
+    if written:
+        _remember(domain, url, True)
+        _stats['writes'] += 1
+    return written
+
+
+def remove_entry(domain, url) -> bool:
+    """Remove one sitemap entry, so the page counts as not scraped again. False if it had none."""
+    now = int(time.time())
+    layout = _layout.get(domain)
+    if layout is None:
+        try:
+            _table().update_item(
+                Key={'website_domain': domain},
+                UpdateExpression='REMOVE sitemap.#url SET last_updated = :now ADD version :one, #writes :one',
+                ConditionExpression='attribute_exists(sitemap.#url) AND attribute_not_exists(#depth)',
+                ExpressionAttributeNames={'#url': url, '#depth': 'hash_depth', '#writes': writes_attribute(0)},
+                ExpressionAttributeValues={':now': now, ':one': 1}
+            )
+            _remember(domain, url, False)
+            _stats['writes'] += 1
+            return True
+        except ClientError as e:
+            if not _is_condition_error(e):
+                raise
+        layout = _sharded_layout(domain, now)
+        if layout is None:
+            return False
+    shard = _leaf(url, layout)
+    names = dict(SHARD_NAMES, **{'#url': url})
+    for _ in range(HASH_BITS):
+        key = part_key(domain, shard_part(shard))
+        try:
+            _parts_table().update_item(Key=key, UpdateExpression='REMOVE sitemap.#url SET last_updated = :now',
+                                       ConditionExpression=f'attribute_exists(sitemap.#url) AND {SHARD_OPEN}',
+                                       ExpressionAttributeNames=names, ExpressionAttributeValues={':now': now})
+            _bump_version(domain, now, [shard])
+            _remember(domain, url, False)
+            _stats['writes'] += 1
+            return True
+        except ClientError as e:
+            if not _is_condition_error(e):
+                raise
+        item = _parts_table().get_item(Key=key, ProjectionExpression='#split, #splitting',
+                                       ExpressionAttributeNames=SHARD_NAMES, ConsistentRead=True).get('Item')
+        _stats['item_reads'] += 1
+        if item is None or not (item.get('split') or item.get('splitting')):
+            return False
+        if item.get('splitting'):
+            _finish_split(domain, shard, now)
+        layout['split'].add(shard)
+        shard = _child(shard, url)
+    return False
+
+
+def replace_sitemap(domain, sitemap) -> int:
+    """Replace a domain's whole sitemap: in its head item if it fits, else hashed into shards. Returns the shard count."""
+    previous = _table().get_item(Key={'website_domain': domain}, ProjectionExpression='version').get('Item', {})
+    now = int(time.time())
+    values = {url: entry_value(domain, url, links) for url, links in sitemap.items()}
+    sizes = {url: entry_bytes(url, value) for url, value in values.items()}
+    depth = None
+    shards = {}
+    if sum(sizes.values()) > SITEMAP_ITEM_BYTES:
+        depth = SITEMAP_HASH_DEPTH
+        while True:
+            shards = {}
+            for url, value in values.items():
+                shards.setdefault(shard_of(url, depth), {})[url] = value
+            if all(sum(sizes[url] for url in entries) <= SITEMAP_ITEM_BYTES for entries in shards.values()):
+                break
+            depth += 1
+    version = int(previous.get('version', 0)) + 1
+    # Shards first, so readers never see a head pointing at shards that are not written yet
+    for shard, entries in shards.items():
+        _parts_table().put_item(Item=dict(part_key(domain, shard_part(shard)), sitemap=entries, last_updated=now,
+                                          item_bytes=sum(sizes[url] for url in entries)))
+    for shard in set(_query_shards(domain, keys_only=True)) - set(shards):
+        _parts_table().delete_item(Key=part_key(domain, shard_part(shard)))
+    # Every item counts as written at the new version, which is more than any counter was before
+    head = {writes_attribute(shard): version for shard in [0, *shards]}
+    head.update(website_domain=domain, version=version, last_updated=now)
+    if depth is None:
+        head.update(sitemap=values, item_bytes=sum(sizes.values()))
+    else:
+        head.update(sitemap={}, item_bytes=0, hash_depth=depth)
+    _table().put_item(Item=head)
+    _layout.pop(domain, None)
+    _known.pop(domain, None)
+    _stats['writes'] += 1
+    return len(shards)
+# endregion
+
+
+def get_stats() -> dict:
+    return dict(_stats, domains_cached=len(_layout), encoding=SITEMAP_ENCODING)
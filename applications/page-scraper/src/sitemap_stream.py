@@ -0,0 +1,244 @@
+"""
+Change data capture on the sitemap table for downstream consumers.
+A DynamoDB Streams consumer (NEW_AND_OLD_IMAGES) of the website-sitemaps and
+website-sitemap-parts tables diffs the old and new image of every changed sitemap
+item (head and shard items, see sitemap_store) and turns a
+batch of stream records into one compact change event per domain:
+    {"type": "graph_delta", "website_domain": ..., "version": ...,
+     "data": {"nodes_added": [...], "nodes_removed": [...],
+              "edges_added": {url: [links]}, "edges_removed": {url: [links]}}}
+Only the entries that changed are decoded (URL lists, graph encoded ids or S3
+entries alike), so consumers work in O(change) instead of re-reading the site.
+A page's placeholder and its links written within one batch are one new page. An
+entry that moves to another shard (when a full item splits) within a batch is not
+reported at all; across batches it shows up as removed and added again, which nets
+out for counting consumers. The two tables stream separately, so an event built from
+shard records only has no version: the head's version moves in the other stream.
+
+Events fan out through SQS in batches: to the WebSocket broadcaster
+(BROADCAST_QUEUE_URL, with events split below BROADCAST_EVENT_BYTES, as API Gateway
+caps a WebSocket message at 128 KB), the analytics builder (ANALYTICS_QUEUE_URL, see
+graph_metrics.apply_delta) and the snapshot builder (SNAPSHOT_QUEUE_URL, which
+only needs the domain and version). A queue that is not configured is skipped. If
+a message cannot be sent the handler raises, so the stream retries the batch:
+delivery is at least once.
+"""
+
+import base64
+import json
+import os
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+import sitemap_store
+
+sqs = boto3.client('sqs')
+
+BROADCAST_QUEUE_URL = os.environ.get('BROADCAST_QUEUE_URL')
+ANALYTICS_QUEUE_URL = os.environ.get('ANALYTICS_QUEUE_URL')
+SNAPSHOT_QUEUE_URL = os.environ.get('SNAPSHOT_QUEUE_URL')
+# SQS takes 256 KB per message and per batch; events are split well below that
+STREAM_EVENT_BYTES = int(os.environ.get('STREAM_EVENT_BYTES', str(192 * 1024)))
+# The broadcaster posts an event's data to every connection in a message of its own,
+# which API Gateway limits to 128 KB; the rest is left for its envelope
+BROADCAST_EVENT_BYTES = int(os.environ.get('BROADCAST_EVENT_BYTES', str(120 * 1024)))
+SQS_BATCH_MESSAGES = 10
+SQS_BATCH_BYTES = 240 * 1024
+EVENT_TYPE = 'graph_delta'
+
+_deserializer = TypeDeserializer()
+_stats = {'records': 0, 'ignored': 0, 'events': 0, 'messages': 0}
+
+
+def item_domain(keys):
+    """(domain, kind) of a sitemap or parts table key; kind is head, shard, dictionary or metrics"""
+    domain = keys.get('website_domain', '')
+    part = keys.get('part')
+    if part is None:
+        return domain, 'head'
+    if part.startswith(sitemap_store.SHARD_PREFIX):
+        return domain, 'shard'
+    if part.startswith(sitemap_store.DICTIONARY_PREFIX):
+        return domain, 'dictionary'
+    return domain, 'metrics'
+
+
+def _plain(value):
+    """Stream images carry binary values base64 encoded, the deserializer expects bytes"""
+    (kind, inner), = value.items()
+    if kind == 'B':
+        return {'B': base64.b64decode(inner)}
+    if kind == 'BS':
+        return {'BS': [base64.b64decode(item) for item in inner]}
+    if kind == 'M':
+        return {'M': {name: _plain(item) for name, item in inner.items()}}
+    if kind == 'L':
+        return {'L': [_plain(item) for item in inner]}
+    return value
+
+
+def deserialize(image) -> dict:
+    return {name: _deserializer.deserialize(_plain(value)) for name, value in (image or {}).items()}
+
+
+# region diff
+def collect_changes(records) -> dict:
+    """
+    Per domain, the sitemap entries a batch of stream records changed:
+    {domain: {'version': ..., 'entries': {url: [value before the batch, value after it]}}}
+    with None for an entry that did not exist (or no longer does).
+    """
+    changes = {}
+    # Per domain and URL, the first value before and the last value after in each item
+    seen = {}
+    for record in records:
+        _stats['records'] += 1
+        stream = record.get('dynamodb', {})
+        keys = deserialize(stream.get('Keys'))
+        key = (keys.get('website_domain', ''), keys.get('part'))
+        domain, kind = item_domain(keys)
+        if kind not in ('head', 'shard'):
+            _stats['ignored'] += 1
+            continue
+        old_image = deserialize(stream.get('OldImage'))
+        new_image = deserialize(stream.get('NewImage'))
+        domain_changes = changes.setdefault(domain, {'version': None, 'entries': {}})
+        domain_seen = seen.setdefault(domain, {})
+        if kind == 'head' and new_image.get('version') is not None:
+            domain_changes['version'] = int(new_image['version'])
+        old_map = old_image.get('sitemap', {})
+        new_map = new_image.get('sitemap', {})
+        for url in set(old_map) | set(new_map):
+            before = old_map.get(url)
+            after = new_map.get(url)
+            if before == after:
+                continue
+            items = domain_seen.setdefault(url, {})
+            if key in items:
+                items[key][1] = after
+            else:
+                items[key] = [before, after]
+    for domain, domain_seen in seen.items():
+        for url, items in domain_seen.items():
+            # An entry moved between items is removed from one and written to another: it
+            # existed if it did in any item, and exists if it does in any item
+            befores = [before for before, _ in items.values() if before is not None]
+            afters = [after for _, after in items.values() if after is not None]
+            changes[domain]['entries'][url] = [befores[0] if befores else None, afters[-1] if afters else None]
+    return changes
+
+
+def domain_delta(domain, entries) -> dict:
+    """Decode the changed entries of a domain into nodes and edges added and removed"""
+    delta = {'nodes_added': [], 'nodes_removed': [], 'edges_added': {}, 'edges_removed': {}}
+    for url, (before, after) in sorted(entries.items()):
+        old_links = set(sitemap_store.resolve_entry(domain, url, before)) if before is not None else set()
+        new_links = set(sitemap_store.resolve_entry(domain, url, after)) if after is not None else set()
+        if before is None and after is not None:
+            delta['nodes_added'].append(url)
+        elif before is not None and after is None:
+            delta['nodes_removed'].append(url)
+        if new_links - old_links:
+            delta['edges_added'][url] = sorted(new_links - old_links)
+        if old_links - new_links:
+            delta['edges_removed'][url] = sorted(old_links - new_links)
+    return {name: value for name, value in delta.items() if value}
+# endregion
+
+
+# region events
+def split_delta(delta, max_bytes=None) -> list:
+    """Split a delta by page so that every part stays under max_bytes (STREAM_EVENT_BYTES) of JSON"""
+    max_bytes = max_bytes or STREAM_EVENT_BYTES
+    urls = sorted(set(delta.get('nodes_added', [])) | set(delta.get('nodes_removed', []))
+                  | set(delta.get('edges_added', {})) | set(delta.get('edges_removed', {})))
+    parts = []
+    part = {}
+    size = 0
+    for url in urls:
+        # Compact JSON: a quoted URL and a comma per node, plus the list of quoted links per edge map
+        unit_size = 0
+        for name in ('nodes_added', 'nodes_removed'):
+            if url in delta.get(name, ()):
+                unit_size += len(url.encode('utf-8')) + 3
+        for name in ('edges_added', 'edges_removed'):
+            if url in delta.get(name, {}):
+                unit_size += len(url.encode('utf-8')) + 6 + sum(len(link.encode('utf-8')) + 3 for link in delta[name][url])
+        if part and size + unit_size > max_bytes:
+            parts.append(part)
+            part = {}
+            size = 0
+        for name in ('nodes_added', 'nodes_removed'):
+            if url in delta.get(name, ()):
+                part.setdefault(name, []).append(url)
+        for name in ('edges_added', 'edges_removed'):
+            if url in delta.get(name, {}):
+                part.setdefault(name, {})[url] = delta[name][url]
+        size += unit_size
+    if part:
+        parts.append(part)
+    return parts
+
+
+def build_deltas(changes) -> list:
+    """(domain, version, delta) of every domain with changes"""
+    return [(domain, domain_changes['version'], domain_delta(domain, domain_changes['entries']))
+            for domain, domain_changes in changes.items()]
+
+
+def build_events(deltas, max_bytes=None) -> list:
+    events = []
+    for domain, version, delta in deltas:
+        for part in split_delta(delta, max_bytes):
+            events.append({'type': EVENT_TYPE, 'website_domain': domain, 'version': version, 'data': part})
+    return events
+
+
+def send_messages(queue_url, messages):
+    """Send messages in SQS batches by count and size. Raises if any message was not accepted."""
+    bodies = [json.dumps(message, separators=(',', ':'), ensure_ascii=False) for message in messages]
+    batch = []
+    batch_bytes = 0
+    for body in bodies + [None]:
+        full = body is None or len(batch) == SQS_BATCH_MESSAGES or batch_bytes + len(body.encode('utf-8')) > SQS_BATCH_BYTES
+        if batch and full:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=[
+                {'Id': str(index), 'MessageBody': entry} for index, entry in enumerate(batch)])
+            if response.get('Failed'):
+                raise RuntimeError(f'{len(response["Failed"])} messages not accepted by {queue_url}: '
+                                   f'{response["Failed"][0].get("Message")}')
+            _stats['messages'] += len(batch)
+            batch = []
+            batch_bytes = 0
+        if body is not None:
+            batch.append(body)
+            batch_bytes += len(body.encode('utf-8'))
+
+
+def fan_out(deltas) -> int:
+    """Send the deltas to every configured queue. Returns the number of events built."""
+    events = build_events(deltas)
+    if BROADCAST_QUEUE_URL:
+        send_messages(BROADCAST_QUEUE_URL, build_events(deltas, min(BROADCAST_EVENT_BYTES, STREAM_EVENT_BYTES)))
+    if ANALYTICS_QUEUE_URL:
+        send_messages(ANALYTICS_QUEUE_URL, events)
+    if SNAPSHOT_QUEUE_URL:
+        # The snapshot builder rebuilds from the store, one message per domain is enough
+        send_messages(SNAPSHOT_QUEUE_URL, [{'type': EVENT_TYPE, 'website_domain': domain, 'version': version}
+                                           for domain, version, delta in deltas if delta])
+    _stats['events'] += len(events)
+    return len(events)
+# endregion
+
+
+def lambda_handler(event, context):
+    """DynamoDB Streams handler of the sitemap table"""
+    records = event.get('Records', [])
+    events = fan_out(build_deltas(collect_changes(records)))
+    print(f'Sitemap stream: {len(records)} records, {events} events: {json.dumps(_stats)}')
+    return {'statusCode': 200, 'body': json.dumps({'records': len(records), 'events': events})}
+
+
+def get_stats() -> dict:
+    return dict(_stats)
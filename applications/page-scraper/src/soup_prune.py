@@ -0,0 +1,106 @@
+"""
+Linear-time pruning of a BeautifulSoup tree.
+One walk over the document decides what to drop, then the dropped subtrees are
+detached in bulk: each parent's contents list is rebuilt once instead of calling
+decompose() per tag, which looks the tag up in its parent's contents every time
+and is quadratic on page-builder markup with thousands of sibling divs.
+"""
+
+from bs4.element import Tag
+
+
+def _has_child_tag(tag) -> bool:
+    for child in tag.contents:
+        if isinstance(child, Tag):
+            return True
+    return False
+
+
+def find_prunable(soup, decompose=(), collapse_empty=(), unwrap=()) -> tuple:
+    """
+    Return (tags to remove, tags to unwrap), both in document order, from one walk
+    that does not descend into subtrees already marked for removal.
+    decompose: tag names removed with their contents.
+    collapse_empty: container names removed when they hold no child tag (text alone does not keep them).
+    unwrap: tag names replaced by their contents.
+    """
+    decompose = frozenset(decompose)
+    collapse_empty = frozenset(collapse_empty)
+    unwrap = frozenset(unwrap)
+    marked, unwrapped = [], []
+    if not soup.contents:
+        return marked, unwrapped
+    # Walk the descendants through the next_element chain, like Tag.descendants does
+    stop = soup._last_descendant().next_element
+    element = soup.contents[0]
+    while element is not stop:
+        if isinstance(element, Tag):
+            if element.name in decompose or (
+                    element.name in collapse_empty and not _has_child_tag(element)):
+                marked.append(element)
+                # Skip the whole subtree, nothing inside it needs a decision
+                element = element._last_descendant().next_element
+                continue
+            if element.name in unwrap:
+                unwrapped.append(element)
+        element = element.next_element
+    return marked, unwrapped
+
+
+def detach_all(elements):
+    """
+    Detach a list of elements (in document order, none inside another) from their tree.
+    Equivalent to calling extract() on each, but every affected parent is rebuilt only once.
+    """
+    removed_ids = set()
+    parents = {}
+    for element in elements:
+        # Splice the subtree out of the next_element/previous_element chain. Doing this in
+        # document order keeps it correct when removed subtrees are adjacent.
+        last = element._last_descendant()
+        previous_element, next_element = element.previous_element, last.next_element
+        if previous_element is not None:
+            previous_element.next_element = next_element
+        if next_element is not None:
+            next_element.previous_element = previous_element
+        element.previous_element = None
+        last.next_element = None
+
+        removed_ids.add(id(element))
+        if element.parent is not None:
+            parents[id(element.parent)] = element.parent
+
+    for parent in parents.values():
+        kept = [child for child in parent.contents if id(child) not in removed_ids]
+        parent.contents[:] = kept
+        previous = None
+        for child in kept:
+            child.previous_sibling = previous
+            if previous is not None:
+                previous.next_sibling = child
+            previous = child
+        if previous is not None:
+            previous.next_sibling = None
+
+    for element in elements:
+        element.parent = None
+        element.previous_sibling = element.next_sibling = None
+
+
+def prune_soup(soup, rules: dict):
+    """
+    Apply prune rules to the soup in place. rules may contain:
+        'decompose':      tag names removed together with their contents
+        'collapse_empty': container names removed when they have no child tags
+        'unwrap':         tag names replaced by their contents (removed if empty)
+    Which tags qualify is decided on the tree as it was before any removal.
+    """
+    marked, unwrapped = find_prunable(
+        soup, rules.get('decompose', ()), rules.get('collapse_empty', ()), rules.get('unwrap', ()))
+    detach_all(marked)
+    # Unwrapping is rare (UNWANTED_ENCLOSING_TAGS is usually empty), so bs4's own unwrap is fine here
+    for tag in unwrapped:
+        if tag.contents:
+            tag.unwrap()
+        else:
+            tag.extract()
@@ -0,0 +1,237 @@
+"""
+Single-pass link and text extraction without building a DOM.
+The vendored BeautifulSoupHTMLParser drives a small event sink instead of a
+BeautifulSoup tree, so tokenizing, entity handling and void elements behave
+exactly as in the soup path, while links and visible text are emitted as the
+parser goes. The output matches scrape_links followed by clean_soup and
+stripped_strings:
+    - valid anchors are returned with their text and rel, plus the first <base href>
+    - each text string comes with its path and block, as text_layout.stripped_strings_with_layout computes them
+    - the first <title> text and all <meta> and <link> attributes are collected for page_metadata
+    - <a> tags without an href or with a '#' href are dropped with their contents, including
+      the scripts and title text inside them
+    - UNWANTED_TAGS are dropped with their contents
+    - divs without any child tag (after dropping those anchors) are dropped
+    - script, style, template and ruby annotation strings, comments and declarations are not text
+"""
+
+import inspect
+
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.element import CData
+
+from text_layout import PATH_SKIPPED_TAGS, ROOT_BLOCK, child_block, child_path, number_blocks
+
+_builder = HTMLParserTreeBuilder()
+STRING_CONTAINER_TAGS = frozenset(_builder.string_containers)
+# bs4 4.13 passes the soup to the parser's constructor, 4.12 (requirements.txt) sets it afterwards
+_PARSER_TAKES_SOUP = 'soup' in inspect.signature(BeautifulSoupHTMLParser.__init__).parameters
+
+
+class _Frame:
+    """An open tag on the sink's stack, with the extraction state inherited from its ancestors"""
+    __slots__ = ('name', 'is_empty_element', 'dropped', 'in_removed_anchor', 'string_container',
+                 'pending', 'buffer', 'capture_script', 'anchors', 'path', 'block')
+
+    def __init__(self, name, is_empty_element=False, dropped=False, in_removed_anchor=False,
+                 string_container=False, pending=False, capture_script=None, anchors=(), path='',
+                 block=ROOT_BLOCK):
+        self.name = name
+        self.is_empty_element = is_empty_element
+        self.dropped = dropped
+        self.in_removed_anchor = in_removed_anchor
+        self.string_container = string_container
+        # True for a collapsible container that has not seen a child tag yet; its text waits in buffer
+        self.pending = pending
+        self.buffer = []
+        self.capture_script = capture_script
+        # Indexes into StreamExtractor.links of the open anchors whose text this tag contributes to
+        self.anchors = anchors
+        self.path = path
+        self.block = block
+
+
+class StreamExtractor:
+    """
+    Receives the tree-building calls BeautifulSoupHTMLParser normally makes on a
+    BeautifulSoup object and turns them into links, text and embedded script payloads.
+    """
+    builder = _builder
+    original_encoding = None
+
+    def __init__(self, unwanted_tags, collapse_empty=('div',)):
+        self.unwanted_tags = frozenset(unwanted_tags)
+        self.collapse_empty = frozenset(collapse_empty)
+        self.stack = [_Frame('[document]')]
+        self.current_data = []
+        # [href, text strings, rel] per valid anchor
+        self.links = []
+        self.base_href = None
+        self.text = []
+        self.paths = []
+        self.blocks = []
+        self._paths = {}
+        self._block_count = 0
+        self.title = None
+        self.metas = []
+        self.link_attrs = []
+        # (name, attributes) of <img> and <source> tags
+        self.images = []
+        # The <title> frame while its text is being collected
+        self._title_frame = None
+        self.scripts = []
+
+    # region tree builder interface
+    def handle_starttag(self, name, namespace, nsprefix, attrs, sourceline=None, sourcepos=None,
+                        namespaces=None):
+        self.endData()
+        parent = self.stack[-1]
+
+        removed_anchor = False
+        anchors = parent.anchors
+        if name == 'a' and not parent.in_removed_anchor:
+            href = attrs.get('href')
+            if not href or href.startswith('#'):
+                removed_anchor = True
+                anchors = ()
+            else:
+                anchors = anchors + (len(self.links),)
+                rel = attrs.get('rel')
+                self.links.append([href, [], rel.split() if rel else None])
+        elif name == 'base' and self.base_href is None and not parent.in_removed_anchor:
+            self.base_href = attrs.get('href')
+        elif name == 'meta' and not parent.in_removed_anchor:
+            self.metas.append(attrs)
+        elif name == 'link' and not parent.in_removed_anchor:
+            self.link_attrs.append(attrs)
+        elif name in ('img', 'source') and not parent.in_removed_anchor:
+            self.images.append((name, attrs))
+
+        in_removed_anchor = parent.in_removed_anchor or removed_anchor
+        if not in_removed_anchor and parent.pending:
+            # The container has a child tag after all, so it survives and its text is released
+            parent.pending = False
+            for string, path, block in parent.buffer:
+                self.text.append(string)
+                self.paths.append(path)
+                self.blocks.append(block)
+            parent.buffer = []
+
+        dropped = parent.dropped or removed_anchor or name in self.unwanted_tags
+        self._block_count += 1
+        capture_script = None
+        # Removed anchors are decomposed with their scripts before the soup path reads them
+        if name == 'script' and not attrs.get('src') and not in_removed_anchor:
+            capture_script = (attrs.get('type') or '').split(';')[0].strip().lower()
+        frame = _Frame(
+            name,
+            is_empty_element=self.builder.can_be_empty_element(name),
+            dropped=dropped,
+            in_removed_anchor=in_removed_anchor,
+            string_container=parent.string_container or name in STRING_CONTAINER_TAGS,
+            pending=not dropped and name in self.collapse_empty,
+            capture_script=capture_script,
+            anchors=anchors,
+            path=self._path(parent.path, name),
+            block=child_block(parent.block, name, self._block_count),
+        )
+        if name == 'title' and self.title is None and not in_removed_anchor:
+            self._title_frame = frame
+            self.title = []
+        self.stack.append(frame)
+        return frame
+
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        # Same recovery as BeautifulSoup._popToTag: close everything up to the most recent
+        # open tag with this name, and ignore end tags that match nothing
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].name == name:
+                while len(self.stack) > i:
+                    self._close(self.stack.pop())
+                break
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def endData(self, containerClass=None):
+        if not self.current_data:
+            return
+        data = ''.join(self.current_data)
+        self.current_data = []
+        frame = self.stack[-1]
+
+        if frame.capture_script is not None and containerClass is None:
+            self.scripts.append((frame.capture_script, data))
+        # Comments, doctypes, declarations and processing instructions are never text
+        if containerClass is not None and containerClass is not CData:
+            return
+        if containerClass is None and frame.string_container:
+            return
+        if self._title_frame is not None and not frame.in_removed_anchor:
+            self.title.append(data)
+        string = data.strip()
+        if not string:
+            return
+        # Anchor text is taken before cleaning, so it includes strings in dropped tags
+        for index in frame.anchors:
+            self.links[index][1].append(string)
+        if frame.dropped:
+            return
+        if frame.pending:
+            frame.buffer.append((string, frame.path, frame.block))
+        else:
+            self.text.append(string)
+            self.paths.append(frame.path)
+            self.blocks.append(frame.block)
+    # endregion tree builder interface
+
+    def _path(self, parent_path, name):
+        if name in PATH_SKIPPED_TAGS:
+            return parent_path
+        # Pages repeat the same few paths thousands of times, so each distinct path is built once
+        key = (parent_path, name)
+        path = self._paths.get(key)
+        if path is None:
+            path = self._paths[key] = child_path(parent_path, name)
+        return path
+
+    def _close(self, frame):
+        # A collapsible container closed without a child tag is dropped with its text
+        frame.buffer = []
+        if frame is self._title_frame:
+            self._title_frame = None
+
+    def finish(self):
+        self.endData()
+        while len(self.stack) > 1:
+            self._close(self.stack.pop())
+
+
+def _parser(sink):
+    if _PARSER_TAKES_SOUP:
+        return BeautifulSoupHTMLParser(sink, convert_charrefs=False)
+    parser = BeautifulSoupHTMLParser(convert_charrefs=False)
+    parser.soup = sink
+    return parser
+
+
+def extract(markup: str, unwanted_tags, collapse_empty=('div',)) -> dict:
+    """
+    Parse markup in one streaming pass.
+    Returns (href, anchor text, rel) for each link in document order, the first <base href>,
+    visible text strings with their paths and blocks (see text_layout), (type, text) pairs for
+    inline scripts so embedded JSON can be read without a second parse, the 'head' parts
+    page_metadata.extract_metadata reads and the (name, attributes) of <img> and <source> tags.
+    """
+    sink = StreamExtractor(unwanted_tags, collapse_empty)
+    parser = _parser(sink)
+    parser.feed(markup)
+    parser.close()
+    sink.finish()
+    links = [(href, ' '.join(strings), rel) for href, strings, rel in sink.links]
+    return {'links': links, 'base_href': sink.base_href, 'text': sink.text, 'paths': sink.paths,
+            'blocks': number_blocks(sink.blocks), 'scripts': sink.scripts, 'images': sink.images,
+            'head': {'title': ''.join(sink.title) if sink.title is not None else None,
+                     'metas': sink.metas, 'links': sink.link_attrs, 'scripts': sink.scripts}}
@@ -0,0 +1,79 @@
+"""
+Where each extracted text string sits in the document.
+For every string both extraction engines report
+    path    slash separated names of the innermost tags from below <body>, e.g. 'header/nav/ul/li/a'
+    block   (block number, kind, inside a link) of the element the string belongs to
+Blocks are the nearest heading, paragraph, list item or caption around the string;
+inline tags (<a>, <b>, <span>, ...) belong to their parent's block, any other tag
+starts a plain 'text' block. Block numbers count blocks in order of their first string.
+"""
+
+# Tags every path would start with, left out so paths do not depend on the parse profile
+PATH_SKIPPED_TAGS = frozenset(['[document]', 'html', 'body'])
+# Only the innermost tags are kept, so deeply nested markup does not make paths grow with depth
+PATH_MAX_DEPTH = 12
+
+BLOCK_KINDS = {
+    'h1': 'h1', 'h2': 'h2', 'h3': 'h3', 'h4': 'h4', 'h5': 'h5', 'h6': 'h6',
+    'p': 'p', 'li': 'li', 'dt': 'li', 'dd': 'li',
+    'caption': 'caption', 'figcaption': 'caption',
+}
+INLINE_TAGS = frozenset([
+    'a', 'abbr', 'b', 'bdi', 'bdo', 'br', 'cite', 'code', 'data', 'dfn', 'em', 'font', 'i', 'kbd',
+    'label', 'mark', 'q', 's', 'samp', 'small', 'span', 'strong', 'sub', 'sup', 'time', 'u', 'var', 'wbr',
+])
+ROOT_BLOCK = (None, 'text', False)
+
+
+def child_path(parent_path, name) -> str:
+    """Path of a tag named name inside a tag with parent_path"""
+    if name in PATH_SKIPPED_TAGS:
+        return parent_path
+    if not parent_path:
+        return name
+    if parent_path.count('/') >= PATH_MAX_DEPTH - 1:
+        parent_path = parent_path[parent_path.index('/') + 1:]
+    return f'{parent_path}/{name}'
+
+
+def child_block(parent_block, name, key) -> tuple:
+    """Block of a tag named name inside parent_block; key identifies the tag if it starts a block"""
+    if name in BLOCK_KINDS:
+        return key, BLOCK_KINDS[name], False
+    if name in INLINE_TAGS:
+        owner, kind, in_link = parent_block
+        return owner, kind, in_link or name == 'a'
+    return key, 'text', False
+
+
+def number_blocks(blocks) -> list:
+    """Replace the engine specific block keys by block numbers in order of first appearance"""
+    numbers = {}
+    return [(numbers.setdefault(key, len(numbers)), kind, in_link) for key, kind, in_link in blocks]
+
+
+def _tag_layout(tag, cache):
+    # Walk up to the nearest ancestor with a known layout, then build the layouts back down
+    chain = []
+    while id(tag) not in cache and tag.parent is not None:
+        chain.append(tag)
+        tag = tag.parent
+    path, block = cache.get(id(tag), ('', ROOT_BLOCK))
+    for tag in reversed(chain):
+        path, block = child_path(path, tag.name), child_block(block, tag.name, id(tag))
+        cache[id(tag)] = (path, block)
+    return path, block
+
+
+def stripped_strings_with_layout(soup) -> tuple:
+    """Same strings as soup.stripped_strings, plus the path and block of each"""
+    text, paths, blocks = [], [], []
+    cache = {}
+    for string in soup.strings:
+        stripped = string.strip()
+        if stripped:
+            path, block = _tag_layout(string.parent, cache)
+            text.append(stripped)
+            paths.append(path)
+            blocks.append(block)
+    return text, paths, number_blocks(blocks)
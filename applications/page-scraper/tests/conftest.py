@@ -0,0 +1,162 @@
+import copy
+import json
+import os
+import re
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+# The Lambda sources are flat modules in src/, as build.sh packages them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# Module level boto3 clients need a region; tests never reach AWS
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+
+
+class FakeTable:
+    """A DynamoDB table for the expressions sitemap_store and graph_metrics use"""
+    ITEM_LIMIT = 1500
+
+    def __init__(self, key_names):
+        self.key_names = key_names
+        self.items = {}
+        self.calls = []
+
+    @staticmethod
+    def _fail(code='ConditionalCheckFailedException', message=''):
+        raise ClientError({'Error': {'Code': code, 'Message': message}}, 'op')
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    @staticmethod
+    def _path(path, names):
+        return [names.get(part, part) for part in path.strip().split('.')]
+
+    def _get(self, item, path, names):
+        for name in self._path(path, names):
+            if not isinstance(item, dict) or name not in item:
+                return None
+            item = item[name]
+        return item
+
+    def _check(self, item, condition, names, values):
+        for term in (condition or '').split(' AND ') if condition else []:
+            function, argument = re.match(r'(\w+)\((.*?)\)', term.strip()).groups()
+            value = self._get(item, argument, names) if item else None
+            if function == 'attribute_exists' and value is None \
+                    or function == 'attribute_not_exists' and value is not None \
+                    or function == 'size' and len(value or ()) != values[term.split('=')[1].strip()]:
+                self._fail()
+
+    def _store(self, item):
+        if len(json.dumps(item, default=str)) > self.ITEM_LIMIT:
+            self._fail('ValidationException', 'Item size has exceeded the maximum allowed size')
+        self.items[self._key(item)] = item
+
+    def get_item(self, Key, **kwargs):
+        self.calls.append(('get_item', self._key(Key)))
+        item = self.items.get(self._key(Key))
+        return {'Item': copy.deepcopy(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None):
+        self.calls.append(('put_item', self._key(Item)))
+        self._check(self.items.get(self._key(Item)), ConditionExpression, {}, {})
+        self._store(copy.deepcopy(Item))
+
+    def delete_item(self, Key):
+        self.calls.append(('delete_item', self._key(Key)))
+        self.items.pop(self._key(Key), None)
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None):
+        self.calls.append(('update_item', self._key(Key)))
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        item = self.items.get(self._key(Key))
+        self._check(item, ConditionExpression, names, values)
+        item = copy.deepcopy(item) if item else dict(Key)
+        updated = set()
+        for action, clauses in re.findall(r'(SET|ADD|REMOVE) (.*?)(?= SET | ADD | REMOVE |$)', UpdateExpression):
+            for clause in re.split(r',\s*(?![^()]*\))', clauses):
+                if action == 'SET':
+                    path, expression = clause.split('=', 1)
+                    *parents, name = self._path(path, names)
+                    expression = expression.strip()
+                    if expression.startswith('if_not_exists('):
+                        inner, default = re.match(r'if_not_exists\((.*?), (:\w+)\)', expression).groups()
+                        value = self._get(item, inner, names)
+                        value = values[default] if value is None else value
+                        if '+' in expression:
+                            value += values[expression.rsplit('+', 1)[1].strip()]
+                    elif expression.startswith('list_append('):
+                        listed, appended = re.match(r'list_append\((.*?), (:\w+)\)', expression).groups()
+                        value = self._get(item, listed, names) + values[appended]
+                    else:
+                        value = values[expression]
+                    target = item
+                    for parent in parents:
+                        target = target[parent]
+                    target[name] = copy.deepcopy(value)
+                    updated.add(self._path(path, names)[0])
+                elif action == 'ADD':
+                    path, value = clause.split()
+                    name = self._path(path, names)[0]
+                    item[name] = item.get(name, 0) + values[value]
+                    updated.add(name)
+                else:
+                    *parents, name = self._path(clause, names)
+                    target = item
+                    for parent in parents:
+                        target = target[parent]
+                    target.pop(name, None)
+        self._store(item)
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': {name: copy.deepcopy(item[name]) for name in updated if name in item}}
+        return {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        self.calls.append(('query', ExpressionAttributeValues[':domain']))
+        found = [copy.deepcopy(item) for key, item in sorted(self.items.items())
+                 if key[0] == ExpressionAttributeValues[':domain']
+                 and key[1].startswith(ExpressionAttributeValues[':prefix'])]
+        return {'Items': found}
+
+    def scan(self, **kwargs):
+        return {'Items': [copy.deepcopy(item) for item in self.items.values()]}
+
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(('website_domain', 'part') if 'parts' in name else ('website_domain',))
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            table.calls.append(('batch_get_item', len(request['Keys'])))
+            responses[name] = [copy.deepcopy(table.items[table._key(key)]) for key in request['Keys']
+                               if table._key(key) in table.items]
+        return {'Responses': responses}
+
+
+@pytest.fixture
+def sitemap_tables(monkeypatch):
+    """sitemap_store against in-memory tables, with small items so that sitemaps shard and split early"""
+    import sitemap_store
+
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setattr(sitemap_store, 'dynamodb', dynamodb)
+    monkeypatch.setattr(sitemap_store, 'SITEMAP_ITEM_BYTES', 600)
+    monkeypatch.setattr(sitemap_store, 'SITEMAP_HASH_DEPTH', 1)
+    monkeypatch.setattr(sitemap_store, 'SITEMAP_ENCODING', 'lists')
+    for cache in (sitemap_store._layout, sitemap_store._known, sitemap_store._dictionaries):
+        cache.clear()
+    yield dynamodb.Table(sitemap_store.SITEMAP_TABLE_NAME), dynamodb.Table(sitemap_store.SITEMAP_PARTS_TABLE_NAME)
+    for cache in (sitemap_store._layout, sitemap_store._known, sitemap_store._dictionaries):
+        cache.clear()
@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+import columnar_export
+
+
+def export(count=10):
+    rows = [dict({column: None for column in columnar_export.COLUMNS}, url=f'https://a.example/{i}', depth=i % 3)
+            for i in range(count)]
+    stream = io.BytesIO()
+    columnar_export.write_rows(rows, stream, 'cols')
+    stream.seek(0)
+    return stream
+
+
+def test_filters_select_rows():
+    result = columnar_export.read_table(export(), columns=['url'], filters=[('depth', '<=', 0)])
+    assert result['url'] == ['https://a.example/0', 'https://a.example/3', 'https://a.example/6',
+                             'https://a.example/9']
+
+
+@pytest.mark.parametrize('filters', [
+    [('depth', '==', None)],
+    [('url', '>=', None)],
+    [('depth', 'in', [1, None])],
+    [('depth', '~', 1)],
+])
+def test_unusable_filters_raise_value_error(filters):
+    with pytest.raises(ValueError):
+        columnar_export.read_table(export(), columns=['url'], filters=filters)
@@ -0,0 +1,26 @@
+import pytest
+
+import contact_extract
+
+
+@pytest.mark.parametrize('text', [
+    'Edition 2019-2020-2021',
+    'Shown 1998.1999.2000.2001',
+    'Residencies 2004-2008-2012-2016-2020',
+])
+def test_year_runs_are_not_phones(text):
+    assert 'phones' not in contact_extract.extract_contacts({}, [text])
+
+
+@pytest.mark.parametrize('text, phone', [
+    ('Call +44 20 7946 0958', '+442079460958'),
+    ('Studio (030) 1234-5678', '03012345678'),
+    ('Studio 030-2019-2020', '03020192020'),
+])
+def test_text_phones(text, phone):
+    assert contact_extract.extract_contacts({}, [text])['phones'] == [phone]
+
+
+def test_tel_links_are_taken_as_given():
+    links = {'external': {'tel:2019-2020-2021': {}}}
+    assert contact_extract.extract_contacts(links, [])['phones'] == ['201920202021']
@@ -0,0 +1,30 @@
+import pytest
+
+import graph_codec
+
+DOMAIN = 'ex.com'
+
+
+@pytest.mark.parametrize('url', [
+    'https://ex.com',
+    'https://ex.com/a',
+    'https://ex.com?page=2',
+    'https://ex.com/share?u=https://ex.com/a',
+    'https://ex.com/redirect/https://other.example/b',
+    'https://ex.com.evil.example/a',
+    'http://ex.com/a',
+    'https://other.example/?next=https://ex.com/',
+])
+def test_urls_round_trip(url):
+    dictionary = graph_codec.UrlDictionary(DOMAIN)
+    url_id = dictionary.add(url)
+    assert dictionary.url(url_id) == url
+    # As stored and read back by another container
+    assert graph_codec.UrlDictionary(DOMAIN, dictionary.entries).url(url_id) == url
+
+
+def test_links_round_trip_through_their_ids():
+    links = ['https://ex.com/share?u=https://ex.com/a', 'https://ex.com/a', 'https://other.example/']
+    dictionary = graph_codec.UrlDictionary(DOMAIN)
+    encoded = graph_codec.encode_links(dictionary, links)
+    assert graph_codec.decode_links(graph_codec.UrlDictionary(DOMAIN, dictionary.entries), encoded) == links
@@ -0,0 +1,75 @@
+import datetime
+import json
+
+import pytest
+import requests
+
+import host_concurrency
+import pagescraper
+import retry_policy
+import sitemap_store
+
+URL = 'https://a.example/page'
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    """process_record against a host answering with the status in crawl['status']"""
+    state = {'status': 503, 'removed': [], 'marked': [], 'queued': []}
+
+    def get(url, timeout=None):
+        response = requests.Response()
+        response.status_code = state['status']
+        response.url = url
+        response.elapsed = datetime.timedelta(seconds=0.1)
+        response._content = b'<html><body><p>hello</p></body></html>'
+        return response
+
+    class Sqs:
+        def send_message(self, QueueUrl, MessageBody, DelaySeconds=0):
+            state['queued'].append((json.loads(MessageBody), DelaySeconds))
+            return {'MessageId': '1'}
+
+    monkeypatch.setenv('URL_QUEUE_URL', 'queue')
+    monkeypatch.setattr(pagescraper.session, 'get', get)
+    monkeypatch.setattr(pagescraper, 'sqs', Sqs())
+    monkeypatch.setattr(pagescraper, 'check_url_exists_in_dynamodb', lambda url, domain: False)
+    monkeypatch.setattr(pagescraper, 'lock_url_in_dynamodb', lambda url, domain: True)
+    monkeypatch.setattr(pagescraper, 'update_url_sitemap_in_dynamodb',
+                        lambda url, links, domain: state['marked'].append((url, links)) or True)
+    monkeypatch.setattr(sitemap_store, 'remove_entry', lambda domain, url: state['removed'].append(url) or True)
+    monkeypatch.setattr(retry_policy, 'circuit_open_until', lambda domain: 0)
+    monkeypatch.setattr(retry_policy, 'record_failure', lambda domain: None)
+    monkeypatch.setattr(host_concurrency, 'acquire', lambda host: True)
+    monkeypatch.setattr(host_concurrency, 'release', lambda host: None)
+    monkeypatch.setattr(host_concurrency, 'observe', lambda *args: None)
+    return state
+
+
+def process(**fields):
+    result = pagescraper.process_record({'body': json.dumps(dict(page_url=URL, **fields))})
+    return json.loads(result['body'])
+
+
+def test_retryable_error_leaves_the_url_unmarked_and_requeues_it(crawl):
+    assert process()['status'] == 'deferred'
+    assert crawl['removed'] == [URL]
+    assert crawl['marked'] == []
+    (message, delay), = crawl['queued']
+    assert message['page_url'] == URL and message['attempt'] == 1
+    assert delay == pagescraper.PAGE_RETRY_DELAY_SECONDS
+
+
+def test_retryable_error_is_marked_processed_after_the_last_attempt(crawl):
+    body = process(attempt=pagescraper.PAGE_RETRY_ATTEMPTS)
+    assert body['status'] == 'error' and body['error_class'] == retry_policy.ERROR_RETRYABLE
+    assert crawl['removed'] == [] and crawl['queued'] == []
+    assert crawl['marked'] == [(URL, [])]
+
+
+def test_permanent_error_is_marked_processed(crawl):
+    crawl['status'] = 404
+    body = process()
+    assert body['status'] == 'error' and body['error_class'] == retry_policy.ERROR_PERMANENT
+    assert crawl['removed'] == [] and crawl['queued'] == []
+    assert crawl['marked'] == [(URL, [])]
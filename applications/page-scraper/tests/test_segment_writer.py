@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import pagescraper
+import page_store
+import segment_writer
+import sitemap_store
+
+
+@pytest.fixture(autouse=True)
+def no_open_segments():
+    segment_writer.discard()
+    yield
+    segment_writer.discard()
+
+
+def failing_storage(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('S3 unavailable')
+    monkeypatch.setattr(segment_writer.s3, 'put_object', fail)
+    monkeypatch.setattr(page_store, 'store_page', fail)
+
+
+def test_flush_tries_every_segment_and_leaves_none_open(monkeypatch):
+    written = []
+    monkeypatch.setattr(segment_writer.s3, 'put_object', lambda **kwargs: written.append(kwargs['Key']))
+    segment_writer.append('https://a.example/1', {}, 'crawl')
+    segment_writer.append('https://b.example/1', {}, 'crawl')
+    segment_writer.append('https://b.example/2', {}, 'crawl')
+    failing_storage(monkeypatch)
+
+    with pytest.raises(segment_writer.SegmentFlushError) as error:
+        segment_writer.flush()
+    assert sorted(error.value.page_urls) == ['https://a.example/1', 'https://b.example/1', 'https://b.example/2']
+    assert segment_writer.pending_records() == 0
+    assert written == []
+
+
+def test_failed_flush_unmarks_pages_and_fails_the_batch(monkeypatch):
+    monkeypatch.setattr(pagescraper, 'STORAGE_LAYOUT', 'segments')
+
+    def process_record(record):
+        # What process_record does once the page is in the sitemap
+        url = json.loads(record['body'])['page_url']
+        pagescraper.storeDataToS3({url: {}}, url, 'crawl')
+        return {'statusCode': 200, 'body': json.dumps({'url': url})}
+
+    monkeypatch.setattr(pagescraper, 'process_record', process_record)
+    failing_storage(monkeypatch)
+    removed = []
+    monkeypatch.setattr(sitemap_store, 'remove_entry', lambda domain, url: removed.append((domain, url)) or True)
+    event = {'Records': [{'body': json.dumps({'page_url': url})}
+                         for url in ('https://a.example/1', 'https://b.example/2')]}
+
+    with pytest.raises(segment_writer.SegmentFlushError):
+        pagescraper.lambda_handler(event, None)
+    assert sorted(removed) == [('a.example', 'https://a.example/1'), ('b.example', 'https://b.example/2')]
+    assert segment_writer.pending_records() == 0
+
+
+def test_rollover_failure_unmarks_earlier_records_of_the_batch(monkeypatch):
+    monkeypatch.setattr(pagescraper, 'STORAGE_LAYOUT', 'segments')
+    monkeypatch.setattr(segment_writer, 'SEGMENT_MAX_RECORDS', 2)
+    failing_storage(monkeypatch)
+    removed = []
+    monkeypatch.setattr(sitemap_store, 'remove_entry', lambda domain, url: removed.append(url) or True)
+    segment_writer.append('https://b.example/other', {}, 'crawl')
+
+    def process_record(record):
+        url = json.loads(record['body'])['page_url']
+        pagescraper.storeDataToS3({url: {}}, url, 'crawl')
+        return {'statusCode': 200, 'body': '{}'}
+
+    monkeypatch.setattr(pagescraper, 'process_record', process_record)
+    event = {'Records': [{'body': json.dumps({'page_url': url})}
+                         for url in ('https://a.example/1', 'https://a.example/2')]}
+
+    with pytest.raises(segment_writer.SegmentFlushError):
+        pagescraper.lambda_handler(event, None)
+    assert sorted(removed) == ['https://a.example/1', 'https://a.example/2', 'https://b.example/other']
+    assert segment_writer.pending_records() == 0
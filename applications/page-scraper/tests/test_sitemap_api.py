@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+import sitemap_api
+import sitemap_store
+
+DOMAIN = 'example.com'
+
+
+def page(number):
+    return f'https://{DOMAIN}/page/{number}'
+
+
+@pytest.fixture
+def table(sitemap_tables, monkeypatch):
+    monkeypatch.setattr(sitemap_api, 'SITEMAP_API_CACHE_SECONDS', 0)
+    sitemap_api._cache.clear()
+    sitemap_api._stats.update(dict.fromkeys(sitemap_api._stats, 0))
+    yield sitemap_tables
+    sitemap_api._cache.clear()
+
+
+def crawl(pages):
+    for number in pages:
+        sitemap_store.put_entry(DOMAIN, page(number), [page(number + 1), page(number + 2)])
+
+
+def fresh_entries():
+    return {url: sitemap_store.resolve_entry(DOMAIN, url, value)
+            for url, value in sitemap_store.read_sitemap(DOMAIN, resolve=False)['sitemap'].items()}
+
+
+def cached_entries():
+    cached = sitemap_api.cached_sitemap(DOMAIN)
+    assert cached['urls'] == sorted(cached['entries'])
+    return {url: sitemap_store.resolve_entry(DOMAIN, url, value) for url, value in cached['entries'].items()}
+
+
+def test_writes_during_a_crawl_read_only_the_items_written(table):
+    crawl(range(40))
+    first = sitemap_api.cached_sitemap(DOMAIN)
+    assert len(first['writes']) > 3
+    loads = sitemap_api.get_stats()['loads']
+    items_read = sitemap_api.get_stats()['items_read']
+
+    crawl([40])
+    sitemap_store.put_entry(DOMAIN, page(0), [page(7)])
+    assert cached_entries() == fresh_entries()
+    stats = sitemap_api.get_stats()
+    assert stats['loads'] == loads
+    # Just the shards of the two pages
+    layout = sitemap_store._layout[DOMAIN]
+    assert stats['items_read'] - items_read == len({sitemap_store._leaf(url, layout) for url in (page(0), page(40))})
+
+    result = sitemap_api.query(DOMAIN, since=first['version'], limit=100)
+    assert [entry['url'] for entry in result['pages']] == sorted([page(0), page(40)])
+    assert result['removed'] == []
+
+
+def test_removed_and_moved_entries_are_picked_up(table):
+    heads, parts = table
+    crawl(range(30))
+    version = sitemap_api.cached_sitemap(DOMAIN)['version']
+    split = {key for key, item in parts.items.items() if item.get('split')}
+
+    sitemap_store.remove_entry(DOMAIN, page(3))
+    # An entry that outgrows its item splits it, moving its other entries too
+    sitemap_store.put_entry(DOMAIN, page(1), [page(number) for number in range(40)])
+    assert {key for key, item in parts.items.items() if item.get('split')} > split
+    assert cached_entries() == fresh_entries()
+    result = sitemap_api.query(DOMAIN, since=version, limit=100)
+    assert [entry['url'] for entry in result['pages']] == [page(1)]
+    assert result['removed'] == [page(3)]
+    assert sitemap_api.get_stats()['loads'] == 1
+
+
+def test_uncounted_writes_and_replaced_sitemaps_read_everything(table):
+    crawl(range(30))
+    sitemap_api.cached_sitemap(DOMAIN)
+
+    # A writer that does not count its writes
+    heads, parts = table
+    heads.items[(DOMAIN,)]['sitemap'][page(99)] = []
+    heads.items[(DOMAIN,)]['version'] += 1
+    assert cached_entries() == fresh_entries()
+    assert sitemap_api.get_stats()['loads'] == 2
+
+    sitemap_store.replace_sitemap(DOMAIN, {page(1): [page(2)], page(2): []})
+    assert cached_entries() == {page(1): [page(2)], page(2): []}
+    sitemap_store.replace_sitemap(DOMAIN, {page(number): [page(number + 1)] * 5 for number in range(40)})
+    assert cached_entries() == fresh_entries()
+    assert json.dumps(sitemap_api.query(DOMAIN, limit=1)['pages']) == json.dumps(
+        [{'url': page(0), 'links': [page(1)] * 5}])
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', '-5000'])
+def test_limits_below_one_are_rejected(table, limit):
+    crawl(range(5))
+    response = sitemap_api.lambda_handler(
+        {'queryStringParameters': {'website_domain': DOMAIN, 'limit': limit}}, None)
+    assert response['statusCode'] == 400
+    assert 'limit' in json.loads(response['body'])['error']
+
+
+def test_limits_are_capped(table, monkeypatch):
+    monkeypatch.setattr(sitemap_api, 'SITEMAP_API_MAX_PAGE_SIZE', 3)
+    crawl(range(5))
+    assert len(sitemap_api.query(DOMAIN, limit=100)['pages']) == 3
+
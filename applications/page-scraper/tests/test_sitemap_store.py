@@ -0,0 +1,103 @@
+import sitemap_store
+
+DOMAIN = 'example.com'
+
+
+def page(number):
+    return f'https://{DOMAIN}/page/{number}'
+
+
+def crawl(pages):
+    for number in pages:
+        sitemap_store.put_entry(DOMAIN, page(number), [page(number + 1), page(number + 2)])
+
+
+def leaves(parts):
+    """{shard: entries} of the shards that hold entries"""
+    return {sitemap_store.shard_number(part): item['sitemap'] for (_, part), item in parts.items.items()
+            if part.startswith(sitemap_store.SHARD_PREFIX) and not item.get('split')}
+
+
+def test_small_sites_stay_in_their_head_item(sitemap_tables):
+    heads, parts = sitemap_tables
+    crawl(range(3))
+    assert sorted(heads.items[(DOMAIN,)]['sitemap']) == sorted(page(number) for number in range(3))
+    assert parts.items == {}
+
+
+def test_large_sites_are_hashed_into_shards_outside_the_head_table(sitemap_tables):
+    heads, parts = sitemap_tables
+    crawl(range(60))
+    # The dashboard scans the head table: one item per domain, without entries once sharded
+    assert list(heads.items) == [(DOMAIN,)]
+    assert heads.items[(DOMAIN,)]['sitemap'] == {}
+    assert any(item.get('split') for item in parts.items.values())
+    # Every URL is in one shard, the one its hash leads to
+    placed = {url: shard for shard, entries in leaves(parts).items() for url in entries}
+    assert sorted(placed) == sorted(page(number) for number in range(60))
+    sitemap_store.read_sitemap(DOMAIN)
+    layout = sitemap_store._layout[DOMAIN]
+    assert all(sitemap_store._leaf(url, layout) == shard for url, shard in placed.items())
+    assert sitemap_store.read_sitemap(DOMAIN)['sitemap'][page(7)] == [page(8), page(9)]
+
+
+def test_checks_and_locks_touch_one_shard(sitemap_tables):
+    heads, parts = sitemap_tables
+    crawl(range(60))
+    sitemap_store.read_sitemap(DOMAIN)
+    heads.calls.clear()
+    parts.calls.clear()
+
+    assert sitemap_store.contains(DOMAIN, page(5))
+    assert not sitemap_store.contains(DOMAIN, page(500))
+    assert [call for call, _ in parts.calls] == ['get_item', 'get_item']
+    assert heads.calls == []
+
+    parts.calls.clear()
+    # The conditional write is the lock, nothing is read before it
+    assert sitemap_store.put_entry(DOMAIN, page(500), [], only_new=True)
+    assert not sitemap_store.put_entry(DOMAIN, page(500), [], only_new=True)
+    assert parts.calls[0][0] == 'update_item'
+    assert sitemap_store.contains(DOMAIN, page(500))
+
+
+def test_checks_follow_splits_made_by_other_writers(sitemap_tables):
+    crawl(range(10))
+    sitemap_store.read_sitemap(DOMAIN)
+    stale = dict(sitemap_store._layout[DOMAIN], split=set(sitemap_store._layout[DOMAIN]['split']))
+    # Another container splits the shards further, this one still knows the old splits
+    crawl(range(10, 60))
+    sitemap_store._layout[DOMAIN] = stale
+    assert all(sitemap_store.contains(DOMAIN, page(number)) for number in range(60))
+    assert sitemap_store.remove_entry(DOMAIN, page(42))
+    assert not sitemap_store.contains(DOMAIN, page(42))
+    assert not sitemap_store.remove_entry(DOMAIN, page(42))
+
+
+def test_unfinished_moves_are_finished_by_the_next_writer(sitemap_tables):
+    heads, parts = sitemap_tables
+    crawl(range(5))
+    # A writer that failed right after marking the head
+    heads.items[(DOMAIN,)].update(hash_depth=1, migrating=True)
+    crawl([5])
+    assert heads.items[(DOMAIN,)]['sitemap'] == {}
+    assert 'migrating' not in heads.items[(DOMAIN,)]
+    assert sorted(sitemap_store.read_sitemap(DOMAIN)['sitemap']) == sorted(page(number) for number in range(6))
+
+    # ... and one that failed right after marking a shard
+    shard = next(iter(leaves(parts)))
+    parts.items[(DOMAIN, sitemap_store.shard_part(shard))]['splitting'] = True
+    sitemap_store._layout.clear()
+    crawl(range(6, 30))
+    assert parts.items[(DOMAIN, sitemap_store.shard_part(shard))]['split']
+    assert sorted(sitemap_store.read_sitemap(DOMAIN)['sitemap']) == sorted(page(number) for number in range(30))
+
+
+def test_replaced_sitemaps_drop_their_old_shards(sitemap_tables):
+    heads, parts = sitemap_tables
+    crawl(range(60))
+    assert sitemap_store.replace_sitemap(DOMAIN, {page(1): [page(2)]}) == 0
+    assert parts.items == {}
+    assert sitemap_store.read_sitemap(DOMAIN)['sitemap'] == {page(1): [page(2)]}
+    assert sitemap_store.replace_sitemap(DOMAIN, {page(number): [page(0)] * 3 for number in range(30)}) > 1
+    assert sitemap_store.read_sitemap(DOMAIN)['sitemap'] == {page(number): [page(0)] * 3 for number in range(30)}
@@ -139,20 +139,29 @@ def broadcast_handler(event, context):
     This function is called by the scraping Lambda to send real-time updates.
     """
     try:
-        # Parse the incoming message
+        # Parse the incoming messages
         if 'Records' in event:
-            # Called via SQS
-            message_body = json.loads(event['Records'][0]['body'])
+            # Called via SQS, possibly with a batch of messages (e.g. graph_delta events of the sitemap stream)
+            message_bodies = [json.loads(record['body']) for record in event['Records']]
         else:
             # Called directly
-            message_body = event
+            message_bodies = [event]
         
-        website_domain = message_body.get('website_domain')
-        update_type = message_body.get('type', 'sitemap_update')
-        data = message_body.get('data', {})
+        # Prepare broadcast messages
+        broadcast_messages = []
+        for message_body in message_bodies:
+            website_domain = message_body.get('website_domain')
+            if not website_domain:
+                logger.error("No website_domain in broadcast message")
+                continue
+            broadcast_messages.append(json.dumps({
+                'type': message_body.get('type', 'sitemap_update'),
+                'website_domain': website_domain,
+                'data': message_body.get('data', {}),
+                'timestamp': int(time.time())
+            }))
         
-        if not website_domain:
-            logger.error("No website_domain in broadcast message")
+        if not broadcast_messages:
             return {
                 'statusCode': 400,
                 'body': json.dumps({'error': 'website_domain required'})
@@ -185,15 +194,6 @@ def broadcast_handler(event, context):
             endpoint_url=api_endpoint
         )
         
-        # Prepare broadcast message
-        broadcast_message = {
-            'type': update_type,
-            'website_domain': website_domain,
-            'data': data,
-            'timestamp': int(time.time())
-        }
-        
-        message_json = json.dumps(broadcast_message)
         successful_sends = 0
         failed_sends = 0
         stale_connections = []
@@ -203,12 +203,13 @@ def broadcast_handler(event, context):
             connection_id = connection['connectionId']
             
             try:
-                apigateway_management.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=message_json
-                )
-                successful_sends += 1
-                logger.info(f"Message sent to connection: {connection_id}")
+                for message_json in broadcast_messages:
+                    apigateway_management.post_to_connection(
+                        ConnectionId=connection_id,
+                        Data=message_json
+                    )
+                    successful_sends += 1
+                logger.info(f"{len(broadcast_messages)} messages sent to connection: {connection_id}")
                 
             except ClientError as e:
                 error_code = e.response['Error']['Code']
@@ -10,7 +10,7 @@ terraform {
     dynamodb_table = "terraform-state-lock"
     encrypt        = true
   }
-  
+
   required_version = ">= 1.6.0"
   required_providers {
     aws = {
@@ -58,7 +58,7 @@ resource "aws_s3_bucket" "terraform_state" {
 
 resource "aws_s3_bucket_versioning" "terraform_state_versioning" {
   bucket = aws_s3_bucket.terraform_state.id
-  
+
   versioning_configuration {
     status = "Enabled"
   }
@@ -91,9 +91,13 @@ resource "aws_dynamodb_table" "terraform_state_lock" {
 
 # Simple DynamoDB table for website sitemap storage
 resource "aws_dynamodb_table" "website_sitemaps" {
-  name           = "website-sitemaps"  # Synchronized with IAM policies and other references
-  billing_mode   = var.enable_provisioned_capacity ? "PROVISIONED" : "PAY_PER_REQUEST"
-  hash_key       = "website_domain"
+  name         = "website-sitemaps" # Synchronized with IAM policies and other references
+  billing_mode = var.enable_provisioned_capacity ? "PROVISIONED" : "PAY_PER_REQUEST"
+  hash_key     = "website_domain"
+
+  # Change stream for sitemap_stream.py, which diffs old and new images
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
 
   # Provisioned capacity for cost optimization (when enabled)
   read_capacity  = var.enable_provisioned_capacity ? var.read_capacity_units : null
@@ -111,11 +115,67 @@ resource "aws_dynamodb_table" "website_sitemaps" {
   }
 
   tags = {
-    Name                = "Website Sitemaps"
-    Environment         = var.environment
-    Purpose             = "3D Force Graph Data Storage"
-    OptimizedFor        = "SimpleSchema"
-    VisualizationType   = "3D Force Graph"
+    Name              = "Website Sitemaps"
+    Environment       = var.environment
+    Purpose           = "3D Force Graph Data Storage"
+    OptimizedFor      = "SimpleSchema"
+    VisualizationType = "3D Force Graph"
+  }
+}
+
+# Everything of a sitemap besides its head item (see sitemap_store): hashed shards of
+# large sites, URL dictionary chunks and graph metrics, one item per domain and part.
+# Kept out of website-sitemaps so the dashboard's scan of it finds only domains.
+resource "aws_dynamodb_table" "sitemap_parts" {
+  name         = "website-sitemap-parts" # SITEMAP_PARTS_TABLE_NAME of the scraper
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "website_domain"
+  range_key    = "part"
+
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
+  attribute {
+    name = "website_domain"
+    type = "S"
+  }
+
+  attribute {
+    name = "part"
+    type = "S"
+  }
+
+  point_in_time_recovery {
+    enabled = var.enable_point_in_time_recovery
+  }
+
+  tags = {
+    Name        = "Website Sitemap Parts"
+    Environment = var.environment
+    Purpose     = "Sitemap Shards, URL Dictionaries and Graph Metrics"
+  }
+}
+
+# Shared crawl state of the scraper Lambdas: per-host circuit breakers and concurrency
+# limits, learned boilerplate and per-domain contacts, one item per state_key
+resource "aws_dynamodb_table" "crawl_state" {
+  name         = "scraper-crawl-state" # CRAWL_STATE_TABLE_NAME of the scraper
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "state_key"
+
+  attribute {
+    name = "state_key"
+    type = "S"
+  }
+
+  point_in_time_recovery {
+    enabled = var.enable_point_in_time_recovery
+  }
+
+  tags = {
+    Name        = "Scraper Crawl State"
+    Environment = var.environment
+    Purpose     = "Circuit Breakers, Host Concurrency, Boilerplate and Contacts"
   }
 }
 
@@ -126,7 +186,7 @@ resource "aws_dynamodb_table" "website_sitemaps" {
 resource "aws_cognito_identity_pool" "dashboard_identity_pool" {
   identity_pool_name               = "scraping-dashboard-identity-pool"
   allow_unauthenticated_identities = true
-  allow_classic_flow              = false
+  allow_classic_flow               = false
 
   tags = {
     Name        = "3D Scraping Dashboard Identity Pool"
@@ -142,40 +202,42 @@ resource "aws_cognito_identity_pool" "dashboard_identity_pool" {
 # Storage module with enhanced monitoring for 3D data
 module "storage" {
   source = "./modules/storage"
-  
+
   environment              = var.environment
   scraped_data_bucket_name = "artist-scraped-data"
   enable_versioning        = true
   enable_encryption        = true
- 
+
   # Enhanced monitoring for 3D visualization data
-  enable_monitoring             = true
-  bucket_size_alarm_threshold   = 107374182400
-  alarm_topic_arn              = module.monitoring.sns_topic_arn
+  enable_monitoring           = true
+  bucket_size_alarm_threshold = 107374182400
+  alarm_topic_arn             = module.monitoring.sns_topic_arn
 }
 
 # Enhanced SQS queues with optimized settings for 3D processing
 module "sqs_queues" {
   source = "./modules/sqs-queues"
-  
-  environment                    = var.environment
-  visibility_timeout_seconds     = 900  # Increased for 3D processing
-  max_receive_count             = 3
-  enable_monitoring             = true
-  queue_depth_alarm_threshold   = 100
-  alarm_topic_arn               = module.monitoring.sns_topic_arn
+
+  environment                 = var.environment
+  visibility_timeout_seconds  = 900 # Increased for 3D processing
+  max_receive_count           = 3
+  enable_monitoring           = true
+  queue_depth_alarm_threshold = 100
+  alarm_topic_arn             = module.monitoring.sns_topic_arn
 }
 
 # Enhanced IAM with specific 3D dashboard permissions
 module "iam" {
   source = "./modules/iam"
-  
-  environment           = var.environment
-  aws_region           = var.aws_region
-  enable_xray_tracing  = true
-  s3_bucket_arn        = module.storage.scraped_data_bucket_arn
-  dynamodb_table_arn   = aws_dynamodb_table.website_sitemaps.arn
-  
+
+  environment             = var.environment
+  aws_region              = var.aws_region
+  enable_xray_tracing     = true
+  s3_bucket_arn           = module.storage.scraped_data_bucket_arn
+  dynamodb_table_arn      = aws_dynamodb_table.website_sitemaps.arn
+  sitemap_parts_table_arn = aws_dynamodb_table.sitemap_parts.arn
+  crawl_state_table_arn   = aws_dynamodb_table.crawl_state.arn
+
   # Enhanced permissions for 3D visualization
   cognito_identity_pool_id = aws_cognito_identity_pool.dashboard_identity_pool.id
 }
@@ -183,47 +245,53 @@ module "iam" {
 # Enhanced Lambda with 3D processing optimizations
 module "page_scraper_lambda" {
   source = "./modules/lambda-scraper"
-  
-  function_name     = "page-scraper"
-  lambda_role_arn   = module.iam.lambda_execution_role_arn
-  
+
+  function_name   = "page-scraper"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
   # Build configuration (relative to FAN-2025 root)
-  source_path        = "applications/page-scraper/src"
-  build_script_path  = "applications/page-scraper/build.sh"
-  output_path        = "infrastructure/lambda_function.zip"
-  
-  environment       = var.environment
-  aws_region        = var.aws_region
-  
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/lambda_function.zip"
+
+  environment = var.environment
+  aws_region  = var.aws_region
+
   # Enhanced performance for 3D data processing
-  use_arm64         = true
-  memory_size       = var.lambda_memory_size
-  timeout           = var.lambda_timeout
-  
+  use_arm64   = true
+  memory_size = var.lambda_memory_size
+  timeout     = var.lambda_timeout
+
   # Enhanced features for 3D visualization
-  enable_json_logging  = true
+  enable_json_logging = true
   enable_xray_tracing = true
   log_retention_days  = var.log_retention_days
-  
+
   # Event source configuration optimized for 3D processing
   event_source_arn = module.sqs_queues.scraping_queue_arn
   batch_size       = 1
   max_concurrency  = var.lambda_max_concurrency
-  
+
   # Enhanced dead letter queue configuration
   dlq_arn = module.sqs_queues.lambda_dlq_arn
-  
+
   # Environment variables for 3D force graph optimization
   environment_variables = {
-    MAX_DEPTH             = var.scraping_max_depth
-    RATE_LIMIT_PER_DOMAIN = var.rate_limit_per_domain
-    ALLOWED_DOMAINS       = jsonencode(var.allowed_domains)
-    URL_QUEUE_URL         = module.sqs_queues.scraping_queue_url
-    SITEMAP_TABLE_NAME    = aws_dynamodb_table.website_sitemaps.name
-    
+    MAX_DEPTH                = var.scraping_max_depth
+    RATE_LIMIT_PER_DOMAIN    = var.rate_limit_per_domain
+    ALLOWED_DOMAINS          = jsonencode(var.allowed_domains)
+    URL_QUEUE_URL            = module.sqs_queues.scraping_queue_url
+    SITEMAP_TABLE_NAME       = aws_dynamodb_table.website_sitemaps.name
+    SITEMAP_PARTS_TABLE_NAME = aws_dynamodb_table.sitemap_parts.name
+    CRAWL_STATE_TABLE_NAME   = aws_dynamodb_table.crawl_state.name
+
+    # Degrees come from the sitemap stream when incremental graph metrics are on
+    GRAPH_METRICS_ENABLED = tostring(var.enable_incremental_graph_metrics)
+    GRAPH_METRICS_SOURCE  = "stream"
+
     # 3D visualization specific variables
     ENABLE_3D_OPTIMIZATION     = "true"
-    MAX_NODES_PER_WEBSITE     = var.max_nodes_per_website
+    MAX_NODES_PER_WEBSITE      = var.max_nodes_per_website
     ENABLE_PROGRESSIVE_LOADING = "true"
     VISUALIZATION_MODE         = "3D_FORCE_GRAPH"
 
@@ -237,19 +305,19 @@ module "page_scraper_lambda" {
 # Enhanced API Gateway with 3D-specific rate limits
 module "api_gateway" {
   source = "./modules/api-gateway"
-  
+
   environment = var.environment
-  
+
   sqs_queue_url            = module.sqs_queues.scraping_queue_url
   sqs_integration_role_arn = module.iam.api_gateway_sqs_role_arn
-  
+
   # Enhanced API configuration for 3D dashboard
   enable_api_key     = true
   rate_limit         = var.api_rate_limit
   burst_limit        = var.api_burst_limit
   monthly_quota      = var.api_monthly_quota
   log_retention_days = var.log_retention_days
-  
+
   # Enhanced CORS for 3D visualization
   enable_cors = true
 }
@@ -258,26 +326,26 @@ module "api_gateway" {
 # New monitoring module for enhanced 3D visualization monitoring
 module "monitoring" {
   source = "./modules/monitoring"
-  
+
   environment = var.environment
   aws_region  = var.aws_region
-  
+
   # Resources to monitor
   dynamodb_table_name  = aws_dynamodb_table.website_sitemaps.name
   lambda_function_name = module.page_scraper_lambda.function_name
-  sqs_queue_name      = module.sqs_queues.scraping_queue_name
-  api_gateway_name    = module.api_gateway.api_gateway_id
-  s3_bucket_name      = module.storage.scraped_data_bucket_name
-  
+  sqs_queue_name       = module.sqs_queues.scraping_queue_name
+  api_gateway_name     = module.api_gateway.api_gateway_id
+  s3_bucket_name       = module.storage.scraped_data_bucket_name
+
   # Notification settings (optional)
-  notification_email = ""  # Set to your email if you want notifications
+  notification_email = "" # Set to your email if you want notifications
 }
 
 # Build WebSocket Lambda package
 resource "null_resource" "websocket_build" {
   triggers = {
     # Force rebuild when source files change
-    source_hash = filemd5("${path.module}/../applications/websocket-handler/src/websocket_handler.py")
+    source_hash  = filemd5("${path.module}/../applications/websocket-handler/src/websocket_handler.py")
     build_script = filemd5("${path.module}/../applications/websocket-handler/build.sh")
     requirements = filemd5("${path.module}/../applications/websocket-handler/requirements.txt")
   }
@@ -295,16 +363,242 @@ resource "null_resource" "websocket_build" {
 # WebSocket module for real-time dashboard updates
 module "websocket" {
   source = "./modules/websocket"
-  
-  environment                = var.environment
-  websocket_lambda_role_arn  = module.iam.websocket_lambda_role_arn
-  websocket_package_path     = "${path.module}/../infrastructure/websocket_function.zip"
-  log_retention_days         = var.log_retention_days
-  stage_name                 = var.environment
-  
+
+  environment               = var.environment
+  websocket_lambda_role_arn = module.iam.websocket_lambda_role_arn
+  websocket_package_path    = "${path.module}/../infrastructure/websocket_function.zip"
+  log_retention_days        = var.log_retention_days
+  stage_name                = var.environment
+
   depends_on = [null_resource.websocket_build]
 }
 
+# ================================================================
+# SITEMAP CHANGE STREAM AND GRAPH WORKERS
+# ================================================================
+# The same package as the scraper with other handlers, built to their own zips
+
+# Turns the change streams of both sitemap tables into graph_delta events on the
+# broadcast, analytics and snapshot queues
+module "sitemap_stream_lambda" {
+  source = "./modules/lambda-scraper"
+
+  function_name   = "sitemap-stream"
+  handler         = "sitemap_stream.lambda_handler"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/sitemap_stream_function.zip"
+
+  environment        = var.environment
+  aws_region         = var.aws_region
+  timeout            = 60
+  log_retention_days = var.log_retention_days
+
+  event_source_arn    = aws_dynamodb_table.website_sitemaps.stream_arn
+  starting_position   = "LATEST"
+  batch_size          = 100
+  max_batching_window = 1
+  max_concurrency     = null
+
+  environment_variables = {
+    SITEMAP_TABLE_NAME       = aws_dynamodb_table.website_sitemaps.name
+    SITEMAP_PARTS_TABLE_NAME = aws_dynamodb_table.sitemap_parts.name
+    BROADCAST_QUEUE_URL      = module.sqs_queues.broadcast_queue_url
+    ANALYTICS_QUEUE_URL      = module.sqs_queues.analytics_queue_url
+    SNAPSHOT_QUEUE_URL       = module.sqs_queues.snapshot_queue_url
+  }
+}
+
+# The shards of large sitemaps change in the parts table
+resource "aws_lambda_event_source_mapping" "sitemap_parts_stream" {
+  event_source_arn                   = aws_dynamodb_table.sitemap_parts.stream_arn
+  function_name                      = module.sitemap_stream_lambda.function_arn
+  starting_position                  = "LATEST"
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 1
+}
+
+# The WebSocket broadcaster posts the events to the dashboard's connections
+resource "aws_lambda_event_source_mapping" "broadcast_queue" {
+  event_source_arn = module.sqs_queues.broadcast_queue_arn
+  function_name    = module.websocket.websocket_broadcaster_function_arn
+  batch_size       = 10
+}
+
+# Applies degree changes from the analytics queue (with enable_incremental_graph_metrics)
+# and recomputes the metrics of changed sitemaps on a schedule
+module "graph_metrics_lambda" {
+  source = "./modules/lambda-scraper"
+
+  function_name   = "graph-metrics"
+  handler         = "graph_metrics.lambda_handler"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/graph_metrics_function.zip"
+
+  environment        = var.environment
+  aws_region         = var.aws_region
+  memory_size        = 1024
+  timeout            = 900
+  log_retention_days = var.log_retention_days
+
+  event_source_arn = module.sqs_queues.analytics_queue_arn
+  batch_size       = 10
+  max_concurrency  = 2
+
+  environment_variables = {
+    SITEMAP_TABLE_NAME       = aws_dynamodb_table.website_sitemaps.name
+    SITEMAP_PARTS_TABLE_NAME = aws_dynamodb_table.sitemap_parts.name
+    GRAPH_METRICS_ENABLED    = tostring(var.enable_incremental_graph_metrics)
+    GRAPH_METRICS_SOURCE     = "stream"
+  }
+}
+
+# Rebuilds the level of detail snapshots of the domains on the snapshot queue
+module "graph_snapshots_lambda" {
+  source = "./modules/lambda-scraper"
+
+  function_name   = "graph-snapshots"
+  handler         = "graph_snapshots.lambda_handler"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/graph_snapshots_function.zip"
+
+  environment        = var.environment
+  aws_region         = var.aws_region
+  memory_size        = 1024
+  timeout            = 900
+  log_retention_days = var.log_retention_days
+
+  event_source_arn    = module.sqs_queues.snapshot_queue_arn
+  batch_size          = 10
+  max_batching_window = 60
+  max_concurrency     = 2
+
+  environment_variables = {
+    SITEMAP_TABLE_NAME         = aws_dynamodb_table.website_sitemaps.name
+    SITEMAP_PARTS_TABLE_NAME   = aws_dynamodb_table.sitemap_parts.name
+    SNAPSHOT_BUCKET            = module.storage.scraped_data_bucket_name
+    MAX_NODES_PER_WEBSITE      = var.max_nodes_per_website
+    ENABLE_PROGRESSIVE_LOADING = "true"
+  }
+}
+
+# Merges the per page objects of the scraped data bucket into segments on a schedule
+module "compaction_lambda" {
+  source = "./modules/lambda-scraper"
+
+  function_name   = "page-compaction"
+  handler         = "compaction.lambda_handler"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/compaction_function.zip"
+
+  environment        = var.environment
+  aws_region         = var.aws_region
+  memory_size        = 1024
+  timeout            = 900
+  log_retention_days = var.log_retention_days
+
+  environment_variables = {
+    PAGE_BUCKET = module.storage.scraped_data_bucket_name
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "graph_metrics_schedule" {
+  name                = "${var.environment}-graph-metrics-schedule"
+  description         = "Recompute the graph metrics of sitemaps that changed"
+  schedule_expression = var.graph_metrics_schedule
+}
+
+resource "aws_cloudwatch_event_target" "graph_metrics_schedule" {
+  rule = aws_cloudwatch_event_rule.graph_metrics_schedule.name
+  arn  = module.graph_metrics_lambda.function_arn
+}
+
+resource "aws_lambda_permission" "graph_metrics_schedule" {
+  statement_id  = "AllowGraphMetricsSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = module.graph_metrics_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.graph_metrics_schedule.arn
+}
+
+resource "aws_cloudwatch_event_rule" "compaction_schedule" {
+  name                = "${var.environment}-page-compaction-schedule"
+  description         = "Compact the scraped page objects into segments"
+  schedule_expression = var.compaction_schedule
+}
+
+resource "aws_cloudwatch_event_target" "compaction_schedule" {
+  rule  = aws_cloudwatch_event_rule.compaction_schedule.name
+  arn   = module.compaction_lambda.function_arn
+  input = jsonencode({ delete = var.compaction_delete_sources })
+}
+
+resource "aws_lambda_permission" "compaction_schedule" {
+  statement_id  = "AllowCompactionSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = module.compaction_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compaction_schedule.arn
+}
+
+# Paginated sitemap reads for the dashboard, served through a function URL
+module "sitemap_api_lambda" {
+  source = "./modules/lambda-scraper"
+
+  function_name   = "sitemap-api"
+  handler         = "sitemap_api.lambda_handler"
+  lambda_role_arn = module.iam.lambda_execution_role_arn
+
+  source_path       = "applications/page-scraper/src"
+  build_script_path = "applications/page-scraper/build.sh"
+  output_path       = "infrastructure/sitemap_api_function.zip"
+
+  environment        = var.environment
+  aws_region         = var.aws_region
+  memory_size        = 1024
+  timeout            = 30
+  log_retention_days = var.log_retention_days
+
+  environment_variables = {
+    SITEMAP_TABLE_NAME       = aws_dynamodb_table.website_sitemaps.name
+    SITEMAP_PARTS_TABLE_NAME = aws_dynamodb_table.sitemap_parts.name
+    SITEMAP_BUCKET           = module.storage.scraped_data_bucket_name
+  }
+}
+
+# The URL answers CORS preflights itself; If-None-Match makes the dashboard's GETs preflighted
+resource "aws_lambda_function_url" "sitemap_api" {
+  function_name      = module.sitemap_api_lambda.function_name
+  authorization_type = "NONE"
+
+  cors {
+    allow_origins  = ["*"]
+    allow_methods  = ["GET"]
+    allow_headers  = ["if-none-match"]
+    expose_headers = ["etag"]
+    max_age        = 3600
+  }
+}
+
+resource "aws_lambda_permission" "sitemap_api_url" {
+  statement_id           = "AllowSitemapApiUrl"
+  action                 = "lambda:InvokeFunctionUrl"
+  function_name          = module.sitemap_api_lambda.function_name
+  principal              = "*"
+  function_url_auth_type = "NONE"
+}
+
 
 # ================================================================
 # COGNITO ROLE ATTACHMENTS
@@ -357,10 +651,10 @@ resource "aws_cloudwatch_dashboard" "scraping_3d_dashboard" {
         height = 6
 
         properties = {
-          query   = "SOURCE '/aws/lambda/${module.page_scraper_lambda.function_name}' | fields @timestamp, @message | filter @message like /3D/ | sort @timestamp desc | limit 20"
-          region  = var.aws_region
-          title   = "3D Processing Logs"
-          view    = "table"
+          query  = "SOURCE '/aws/lambda/${module.page_scraper_lambda.function_name}' | fields @timestamp, @message | filter @message like /3D/ | sort @timestamp desc | limit 20"
+          region = var.aws_region
+          title  = "3D Processing Logs"
+          view   = "table"
         }
       }
     ]
@@ -374,7 +668,7 @@ resource "aws_cloudwatch_dashboard" "scraping_3d_dashboard" {
 # CloudWatch alarm for DynamoDB costs
 resource "aws_cloudwatch_metric_alarm" "dynamodb_cost_alarm" {
   count = var.enable_cost_monitoring ? 1 : 0
-  
+
   alarm_name          = "${var.environment}-dynamodb-cost-high"
   comparison_operator = "GreaterThanThreshold"
   evaluation_periods  = "2"
@@ -404,7 +698,7 @@ resource "aws_cloudwatch_metric_alarm" "dynamodb_cost_alarm" {
 
 resource "aws_appautoscaling_target" "dynamodb_table_read_target" {
   count = var.enable_provisioned_capacity && var.enable_autoscaling ? 1 : 0
-  
+
   max_capacity       = var.max_read_capacity_units
   min_capacity       = var.min_read_capacity_units
   resource_id        = "table/${aws_dynamodb_table.website_sitemaps.name}"
@@ -414,7 +708,7 @@ resource "aws_appautoscaling_target" "dynamodb_table_read_target" {
 
 resource "aws_appautoscaling_policy" "dynamodb_table_read_policy" {
   count = var.enable_provisioned_capacity && var.enable_autoscaling ? 1 : 0
-  
+
   name               = "${var.environment}-DynamoDBReadCapacityUtilization"
   policy_type        = "TargetTrackingScaling"
   resource_id        = aws_appautoscaling_target.dynamodb_table_read_target[0].resource_id
@@ -431,7 +725,7 @@ resource "aws_appautoscaling_policy" "dynamodb_table_read_policy" {
 
 resource "aws_appautoscaling_target" "dynamodb_table_write_target" {
   count = var.enable_provisioned_capacity && var.enable_autoscaling ? 1 : 0
-  
+
   max_capacity       = var.max_write_capacity_units
   min_capacity       = var.min_write_capacity_units
   resource_id        = "table/${aws_dynamodb_table.website_sitemaps.name}"
@@ -441,7 +735,7 @@ resource "aws_appautoscaling_target" "dynamodb_table_write_target" {
 
 resource "aws_appautoscaling_policy" "dynamodb_table_write_policy" {
   count = var.enable_provisioned_capacity && var.enable_autoscaling ? 1 : 0
-  
+
   name               = "${var.environment}-DynamoDBWriteCapacityUtilization"
   policy_type        = "TargetTrackingScaling"
   resource_id        = aws_appautoscaling_target.dynamodb_table_write_target[0].resource_id
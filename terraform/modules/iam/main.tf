@@ -73,7 +73,8 @@ resource "aws_iam_role_policy" "lambda_sqs_access" {
         Resource = [
           "arn:aws:sqs:${var.aws_region}:*:url-scraping-queue",
           "arn:aws:sqs:${var.aws_region}:*:lambda-scraper-dlq",
-          "arn:aws:sqs:${var.aws_region}:*:url-scraping-dlq"
+          "arn:aws:sqs:${var.aws_region}:*:url-scraping-dlq",
+          "arn:aws:sqs:${var.aws_region}:*:sitemap-*-queue"
         ]
       }
     ]
@@ -211,6 +212,7 @@ resource "aws_iam_role_policy" "lambda_dynamodb_policy" {
         Action = [
           "dynamodb:PutItem",
           "dynamodb:GetItem",
+          "dynamodb:BatchGetItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
@@ -218,7 +220,56 @@ resource "aws_iam_role_policy" "lambda_dynamodb_policy" {
         ]
         Resource = [
           var.dynamodb_table_arn,
-          "${var.dynamodb_table_arn}/index/*"
+          "${var.dynamodb_table_arn}/index/*",
+          var.sitemap_parts_table_arn
+        ]
+      }
+    ]
+  })
+}
+
+# Sitemap stream consumer: reads the change streams of both sitemap tables
+resource "aws_iam_role_policy" "lambda_sitemap_stream_policy" {
+  name = "lambda-dynamodb-sitemap-stream-policy"
+  role = aws_iam_role.lambda_execution.name
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams"
+        ]
+        Resource = [
+          "${var.dynamodb_table_arn}/stream/*",
+          "${var.sitemap_parts_table_arn}/stream/*"
+        ]
+      }
+    ]
+  })
+}
+
+# Lambda DynamoDB access to the shared crawl state
+resource "aws_iam_role_policy" "lambda_crawl_state_policy" {
+  name = "lambda-dynamodb-crawl-state-policy"
+  role = aws_iam_role.lambda_execution.name
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem"
+        ]
+        Resource = [
+          var.crawl_state_table_arn
         ]
       }
     ]
@@ -243,6 +294,16 @@ resource "aws_iam_role_policy" "lambda_s3_policy" {
         Resource = [
           "${var.s3_bucket_arn}/*"
         ]
+      },
+      {
+        # Compaction lists the page objects it merges into segments
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = [
+          var.s3_bucket_arn
+        ]
       }
     ]
   })
@@ -325,6 +386,27 @@ resource "aws_iam_role_policy" "websocket_lambda_dynamodb_policy" {
   })
 }
 
+# The broadcaster takes sitemap change events from its queue
+resource "aws_iam_role_policy" "websocket_lambda_sqs_policy" {
+  name = "websocket-lambda-sqs-policy"
+  role = aws_iam_role.websocket_lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = "arn:aws:sqs:${var.aws_region}:*:sitemap-broadcast-queue"
+      }
+    ]
+  })
+}
+
 # API Gateway Management API access for WebSocket broadcasting
 resource "aws_iam_role_policy" "websocket_lambda_apigateway_policy" {
   name = "websocket-lambda-apigateway-policy"
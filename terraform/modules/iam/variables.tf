@@ -19,7 +19,7 @@ variable "enable_xray_tracing" {
 variable "cognito_identity_pool_id" {
   description = "Cognito Identity Pool ID for role assumption"
   type        = string
-  default     = "*"  # Will be updated after Cognito pool is created
+  default     = "*" # Will be updated after Cognito pool is created
 }
 
 variable "s3_bucket_arn" {
@@ -31,3 +31,13 @@ variable "dynamodb_table_arn" {
   description = "ARN of the DynamoDB sitemap table"
   type        = string
 }
+
+variable "sitemap_parts_table_arn" {
+  description = "ARN of the DynamoDB sitemap parts table (shards, URL dictionaries, graph metrics)"
+  type        = string
+}
+
+variable "crawl_state_table_arn" {
+  description = "ARN of the DynamoDB crawl state table (circuit breakers, host concurrency, boilerplate, contacts)"
+  type        = string
+}
@@ -105,7 +105,13 @@ variable "vpc_config" {
 }
 
 variable "event_source_arn" {
-  description = "ARN of the event source (SQS queue)"
+  description = "ARN of the event source (SQS queue or DynamoDB stream)"
+  type        = string
+  default     = null
+}
+
+variable "starting_position" {
+  description = "Where to start reading a DynamoDB stream event source (LATEST or TRIM_HORIZON), null for SQS"
   type        = string
   default     = null
 }
@@ -12,8 +12,8 @@ terraform {
 
 # Dead Letter Queue for failed scraping requests
 resource "aws_sqs_queue" "scraping_dlq" {
-  name                      = "url-scraping-dlq"
-  message_retention_seconds = var.dlq_message_retention_seconds
+  name                       = "url-scraping-dlq"
+  message_retention_seconds  = var.dlq_message_retention_seconds
   visibility_timeout_seconds = var.dlq_visibility_timeout_seconds
 
   tags = {
@@ -25,8 +25,8 @@ resource "aws_sqs_queue" "scraping_dlq" {
 
 # Dead Letter Queue for Lambda function errors
 resource "aws_sqs_queue" "lambda_dlq" {
-  name                      = "lambda-scraper-dlq"
-  message_retention_seconds = var.dlq_message_retention_seconds
+  name                       = "lambda-scraper-dlq"
+  message_retention_seconds  = var.dlq_message_retention_seconds
   visibility_timeout_seconds = var.dlq_visibility_timeout_seconds
 
   tags = {
@@ -38,11 +38,11 @@ resource "aws_sqs_queue" "lambda_dlq" {
 
 # Main scraping queue with modern configuration
 resource "aws_sqs_queue" "scraping_queue" {
-  name                      = "url-scraping-queue"
+  name                       = "url-scraping-queue"
   visibility_timeout_seconds = var.visibility_timeout_seconds
-  message_retention_seconds = var.message_retention_seconds
-  delay_seconds             = var.delay_seconds
-  receive_wait_time_seconds = var.receive_wait_time_seconds
+  message_retention_seconds  = var.message_retention_seconds
+  delay_seconds              = var.delay_seconds
+  receive_wait_time_seconds  = var.receive_wait_time_seconds
 
   # DLQ configuration
   redrive_policy = jsonencode({
@@ -57,6 +57,45 @@ resource "aws_sqs_queue" "scraping_queue" {
   }
 }
 
+# Dead Letter Queue for sitemap change events no consumer could handle
+resource "aws_sqs_queue" "sitemap_events_dlq" {
+  name                       = "sitemap-events-dlq"
+  message_retention_seconds  = var.dlq_message_retention_seconds
+  visibility_timeout_seconds = var.dlq_visibility_timeout_seconds
+
+  tags = {
+    Name        = "Sitemap Events DLQ"
+    Environment = var.environment
+    Purpose     = "Dead Letter Queue for sitemap change events"
+  }
+}
+
+# Fan out queues of the sitemap stream (sitemap_stream.py): graph_delta events for the
+# WebSocket broadcaster and the graph metrics updater, and domains for the snapshot builder
+resource "aws_sqs_queue" "sitemap_events" {
+  for_each = {
+    broadcast = "WebSocket broadcaster"
+    analytics = "Graph metrics updater"
+    snapshot  = "Graph snapshot builder"
+  }
+
+  name                       = "sitemap-${each.key}-queue"
+  visibility_timeout_seconds = var.visibility_timeout_seconds
+  message_retention_seconds  = var.message_retention_seconds
+  receive_wait_time_seconds  = var.receive_wait_time_seconds
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.sitemap_events_dlq.arn
+    maxReceiveCount     = var.max_receive_count
+  })
+
+  tags = {
+    Name        = "Sitemap ${title(each.key)} Queue"
+    Environment = var.environment
+    Purpose     = "Sitemap change events for the ${each.value}"
+  }
+}
+
 # CloudWatch alarms for monitoring queue depth
 resource "aws_cloudwatch_metric_alarm" "queue_depth_alarm" {
   count = var.enable_monitoring ? 1 : 0
@@ -34,3 +34,33 @@ output "lambda_dlq_arn" {
   description = "ARN of the Lambda DLQ"
   value       = aws_sqs_queue.lambda_dlq.arn
 }
+
+output "broadcast_queue_url" {
+  description = "URL of the sitemap change events queue of the WebSocket broadcaster"
+  value       = aws_sqs_queue.sitemap_events["broadcast"].url
+}
+
+output "broadcast_queue_arn" {
+  description = "ARN of the sitemap change events queue of the WebSocket broadcaster"
+  value       = aws_sqs_queue.sitemap_events["broadcast"].arn
+}
+
+output "analytics_queue_url" {
+  description = "URL of the sitemap change events queue of the graph metrics updater"
+  value       = aws_sqs_queue.sitemap_events["analytics"].url
+}
+
+output "analytics_queue_arn" {
+  description = "ARN of the sitemap change events queue of the graph metrics updater"
+  value       = aws_sqs_queue.sitemap_events["analytics"].arn
+}
+
+output "snapshot_queue_url" {
+  description = "URL of the queue of domains whose graph snapshots are to be rebuilt"
+  value       = aws_sqs_queue.sitemap_events["snapshot"].url
+}
+
+output "snapshot_queue_arn" {
+  description = "ARN of the queue of domains whose graph snapshots are to be rebuilt"
+  value       = aws_sqs_queue.sitemap_events["snapshot"].arn
+}
@@ -29,6 +29,11 @@ output "sitemap_table_name" {
   value       = aws_dynamodb_table.website_sitemaps.name
 }
 
+output "sitemap_api_url" {
+  description = "URL of the paginated sitemap read API"
+  value       = aws_lambda_function_url.sitemap_api.function_url
+}
+
 output "s3_bucket_name" {
   description = "Name of the S3 bucket for scraped data"
   value       = module.storage.scraped_data_bucket_name
@@ -59,6 +64,7 @@ output "dashboard_environment_variables" {
     VITE_SITEMAP_TABLE_NAME   = aws_dynamodb_table.website_sitemaps.name
     VITE_WEBSOCKET_ENDPOINT   = module.websocket.websocket_api_endpoint
     VITE_API_ENDPOINT         = module.api_gateway.api_endpoint_url
+    VITE_SITEMAP_API_URL      = aws_lambda_function_url.sitemap_api.function_url
   }
 }
 
@@ -70,7 +76,7 @@ output "websocket_connections_table_name" {
 output "real_time_dashboard_setup" {
   description = "Complete setup information for real-time dashboard"
   value = {
-    websocket_endpoint        = module.websocket.websocket_api_endpoint
+    websocket_endpoint       = module.websocket.websocket_api_endpoint
     api_endpoint             = module.api_gateway.api_endpoint_url
     cognito_identity_pool_id = aws_cognito_identity_pool.dashboard_identity_pool.id
     dynamodb_table_name      = aws_dynamodb_table.website_sitemaps.name
@@ -253,3 +253,31 @@ variable "daily_cost_threshold" {
   type        = number
   default     = 10
 }
+
+# ================================================================
+# SITEMAP STREAM AND GRAPH WORKERS
+# ================================================================
+
+variable "enable_incremental_graph_metrics" {
+  description = "Update graph degrees from the sitemap stream between scheduled recomputations"
+  type        = bool
+  default     = false
+}
+
+variable "graph_metrics_schedule" {
+  description = "Schedule of the graph metrics recomputation of changed sitemaps"
+  type        = string
+  default     = "rate(1 hour)"
+}
+
+variable "compaction_schedule" {
+  description = "Schedule of the compaction of scraped page objects into segments"
+  type        = string
+  default     = "rate(1 day)"
+}
+
+variable "compaction_delete_sources" {
+  description = "Delete page objects once compaction has copied them into a segment"
+  type        = bool
+  default     = false
+}